@@ -2,15 +2,20 @@
 from flask import Blueprint, request, jsonify
 import sqlite3
 from database import get_db_connection
+import device_routing
+import match_events
 
 courts_api = Blueprint('courts_api', __name__)
 
 
+def load_courts(conn):
+    return [dict(row) for row in conn.execute('SELECT * FROM courts ORDER BY name ASC')]
+
+
 @courts_api.route('/courts/', methods=['GET'])
 def get_courts():
     conn = get_db_connection()
-    courts = conn.execute('SELECT * FROM courts ORDER BY name ASC').fetchall()
-    return jsonify([dict(row) for row in courts])
+    return jsonify(load_courts(conn))
 
 @courts_api.route('/courts', methods=['POST'])
 def add_court():
@@ -22,6 +27,7 @@ def add_court():
         conn.execute('INSERT INTO courts (name) VALUES (?)', (name,))
         conn.commit()
         new_court_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+        match_events.bump_version()
         return jsonify({'message': f'Đã thêm thành công {name}', 'court_id': new_court_id}), 201
     except sqlite3.IntegrityError:
         return jsonify({'error': f'Tên sân "{name}" đã tồn tại'}), 409
@@ -34,4 +40,7 @@ def delete_court(court_id):
     conn.commit()
     if cursor.rowcount == 0:
         return jsonify({'error': 'Không tìm thấy sân'}), 404
+    # Bảng điểm của sân bị bỏ gán (ON DELETE SET NULL)
+    device_routing.unassign_court(court_id)
+    match_events.bump_version()
     return jsonify({'message': f'Đã xóa thành công sân ID {court_id}'})
\ No newline at end of file
@@ -0,0 +1,81 @@
+# api/dashboard.py
+from flask import Blueprint, Response, jsonify, request
+import sqlite3
+from database import get_db_connection
+import device_routing
+import live_scores
+import match_events
+from api.matches import load_ongoing_matches, load_queued_matches, iter_history
+from api.courts import load_courts
+from api.players import load_all_players, load_available_players
+from api.scoreboards import load_scoreboards
+from api.sessions import load_current_session
+
+dashboard_api = Blueprint('dashboard_api', __name__)
+
+SNAPSHOT_HISTORY_DEFAULT = 10
+SNAPSHOT_HISTORY_MAX = 50
+
+
+def snapshot_etag(history_limit):
+    """
+    ETag của snapshot: phiên bản trạng thái dashboard (match_events), tổng
+    seq điểm trực tiếp của các bảng điểm và số trận lịch sử (?history=, vì
+    nội dung trả về khác nhau). Không cần đọc SQLite để tính.
+    """
+    version = match_events.current_version()
+    scores = live_scores.seq_total(device_routing.device_ids())
+    return version, f"v{version}.s{scores}.h{history_limit}"
+
+
+def build_snapshot(conn, history_limit):
+    """Toàn bộ dữ liệu của dashboard, đọc trong MỘT transaction đọc (cùng một ảnh chụp WAL)."""
+    started = not conn.in_transaction
+    if started:
+        conn.execute('BEGIN')
+    try:
+        return {
+            'session': load_current_session(conn),
+            'ongoing': load_ongoing_matches(conn),
+            'queued': load_queued_matches(conn),
+            'history': list(iter_history(conn, ["m.status = 'finished'"], [], limit=history_limit)),
+            'courts': load_courts(conn),
+            'players': load_all_players(conn),
+            'available_players': load_available_players(conn),
+            'scoreboards': load_scoreboards(conn),
+        }
+    finally:
+        if started:
+            conn.rollback()
+
+
+@dashboard_api.route('/dashboard/snapshot', methods=['GET'])
+def get_dashboard_snapshot():
+    """
+    Ảnh chụp toàn bộ dashboard trong một request (?history= số trận gần nhất).
+    Trả 304 nếu If-None-Match khớp ETag hiện tại (không có gì thay đổi).
+    """
+    try:
+        history_limit = int(request.args.get('history', SNAPSHOT_HISTORY_DEFAULT))
+    except ValueError:
+        return jsonify({'error': "Tham số 'history' phải là số nguyên."}), 400
+    history_limit = max(0, min(history_limit, SNAPSHOT_HISTORY_MAX))
+
+    # ETag được tính TRƯỚC khi đọc dữ liệu: một thay đổi xảy ra trong lúc đọc
+    # chỉ làm lần sau trả 200 thừa, không bao giờ làm trả 304 cho dữ liệu cũ.
+    version, etag = snapshot_etag(history_limit)
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        try:
+            snapshot = build_snapshot(get_db_connection(), history_limit)
+        except sqlite3.Error as e:
+            return jsonify({'error': str(e)}), 500
+        snapshot['version'] = version
+        # Các seq của bảng điểm thuộc epoch này (xem live_scores.epoch)
+        snapshot['score_epoch'] = live_scores.epoch()
+        response = jsonify(snapshot)
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
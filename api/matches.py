@@ -4,27 +4,31 @@
 from flask import Blueprint, jsonify, request
 import sqlite3
 import json
-from database import get_db_connection
-from extensions import socketio
+import base64
+import datetime
+import itertools
+import redis
+from database import get_db_connection, pooled_connection
+import rooms
+import exporting
+import logic
+import rating
+import device_routing
+import live_scores
+import device_commands
+import match_events
+import next_match
+import queries
 
 
 matches_api = Blueprint('matches_api', __name__)
 
 
 
-# --- CÁC ENDPOINT GET (Giữ nguyên) ---
-@matches_api.route('/matches/ongoing/', methods=['GET'])
-def get_ongoing_matches():
-    query = """
-        SELECT m.id as match_id, m.court_id, c.name as court_name, m.start_time,
-               p.id as player_id, p.name as player_name, mp.team
-        FROM matches m JOIN courts c ON m.court_id = c.id
-        JOIN match_players mp ON m.id = mp.match_id
-        JOIN players p ON mp.player_id = p.id
-        WHERE m.status = 'ongoing' ORDER BY m.id, mp.team;
-    """
-    conn = get_db_connection()
-    rows = conn.execute(query).fetchall()
+def load_ongoing_matches(conn, match_id=None):
+    """Các trận đang diễn ra (hoặc chỉ trận match_id), mỗi trận kèm danh sách người chơi của hai đội."""
+    query = queries.ongoing_matches_query(by_match=match_id is not None)
+    rows = conn.execute(query, (match_id,) if match_id is not None else ()).fetchall()
     matches = {}
     for row in rows:
         mid = row['match_id']
@@ -32,12 +36,35 @@ def get_ongoing_matches():
             matches[mid] = {'id': mid, 'court_id': row['court_id'], 'court_name': row['court_name'], 'start_time': row['start_time'], 'team_A': [], 'team_B': []}
         player = {'id': row['player_id'], 'name': row['player_name']}
         matches[mid][f"team_{row['team']}"].append(player)
-    return jsonify(list(matches.values()))
+    return list(matches.values())
 
 
+def load_players(conn, player_ids):
+    """Các dòng đầy đủ của bảng players (giống GET /api/players) cho các id đã thay đổi."""
+    player_ids = list(player_ids)
+    if not player_ids:
+        return []
+    placeholders = ','.join('?' for _ in player_ids)
+    rows = conn.execute(f'SELECT * FROM players WHERE id IN ({placeholders}) ORDER BY name ASC', player_ids)
+    return [dict(row) for row in rows]
 
-@matches_api.route('/matches/queued/', methods=['GET'])
-def get_queued_matches():
+
+# --- CÁC ENDPOINT GET (Giữ nguyên) ---
+@matches_api.route('/matches/ongoing/', methods=['GET'])
+def get_ongoing_matches():
+    conn = get_db_connection()
+    return jsonify(load_ongoing_matches(conn))
+
+
+
+@matches_api.route('/matches/state-version', methods=['GET'])
+def get_match_state_version():
+    """Phiên bản hiện tại của trạng thái dashboard (xem match_events.py)."""
+    return jsonify({'version': match_events.current_version()})
+
+
+
+def load_queued_matches(conn):
     # The query is updated to use LEFT JOIN to include matches without a court assigned
     query = """
         SELECT m.id as match_id, m.court_id, c.name as court_name,
@@ -48,7 +75,6 @@ def get_queued_matches():
         JOIN players p ON mp.player_id = p.id
         WHERE m.status = 'queued' ORDER BY m.id, mp.team;
     """
-    conn = get_db_connection()
     rows = conn.execute(query).fetchall()
     matches = {}
     for row in rows:
@@ -64,45 +90,282 @@ def get_queued_matches():
             }
         player = {'id': row['player_id'], 'name': row['player_name']}
         matches[mid][f"team_{row['team']}"].append(player)
-    return jsonify(list(matches.values()))
+    return list(matches.values())
+
+
+@matches_api.route('/matches/queued/', methods=['GET'])
+def get_queued_matches():
+    conn = get_db_connection()
+    return jsonify(load_queued_matches(conn))
+
+
 
+HISTORY_DEFAULT_LIMIT = 50
+HISTORY_MAX_LIMIT = 200
+
+
+def encode_history_cursor(end_time, match_id):
+    """Cursor của trang kế tiếp: vị trí (end_time, id) của trận cuối cùng đã trả về."""
+    raw = json.dumps([end_time, match_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_history_cursor(token):
+    try:
+        end_time, match_id = json.loads(base64.urlsafe_b64decode(token.encode()))
+        return str(end_time), int(match_id)
+    except (ValueError, TypeError):
+        raise ValueError('Cursor không hợp lệ.')
+
+
+def _int_arg(args, name):
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"Tham số '{name}' phải là số nguyên.")
+
+
+def history_filters(args):
+    """
+    Dịch các query string lọc lịch sử thành điều kiện WHERE trên bảng matches (alias m).
+    Hỗ trợ: player_id, court_id, session_id, date_from, date_to (YYYY-MM-DD).
+    Trả về (clauses, params); ném ValueError nếu tham số sai.
+    """
+    clauses = [queries.FINISHED_CLAUSE]
+    params = []
+
+    player_id = _int_arg(args, 'player_id')
+    if player_id is not None:
+        clauses.append(queries.PLAYER_CLAUSE)
+        params.append(player_id)
+
+    court_id = _int_arg(args, 'court_id')
+    if court_id is not None:
+        clauses.append('m.court_id = ?')
+        params.append(court_id)
+
+    session_id = _int_arg(args, 'session_id')
+    if session_id is not None:
+        # sessions.start_time mặc định là CURRENT_TIMESTAMP (UTC), end_time được ghi theo giờ địa phương
+        clauses.append(
+            """m.end_time >= (SELECT datetime(start_time, 'localtime') FROM sessions WHERE id = ?)
+               AND m.end_time <= (SELECT COALESCE(end_time, '9999-12-31') FROM sessions WHERE id = ?)"""
+        )
+        params.extend([session_id, session_id])
+
+    for name, clause in (('date_from', 'm.end_time >= date(?)'), ('date_to', "m.end_time < date(?, '+1 day')")):
+        value = args.get(name)
+        if value:
+            try:
+                datetime.date.fromisoformat(value)
+            except ValueError:
+                raise ValueError(f"Tham số '{name}' phải có dạng YYYY-MM-DD.")
+            clauses.append(clause)
+            params.append(value)
+
+    return clauses, params
+
+
+def iter_history(conn, clauses, params, limit=None, after=None):
+    """
+    Duyệt các trận đã kết thúc (mới nhất trước) theo các điều kiện lọc, mỗi trận
+    là một dict. Các dòng được đọc dần từ cursor, không dùng fetchall().
+    `after` là (end_time, id) của trận cuối trang trước (keyset pagination).
+    """
+    clauses, params = list(clauses), list(params)
+    if after is not None:
+        clauses.append(queries.AFTER_CLAUSE)
+        params.extend(after)
+    if limit is not None:
+        params.append(limit)
+
+    rows = conn.execute(queries.history_query(clauses, limited=limit is not None), params)
+    for mid, match_rows in itertools.groupby(rows, key=lambda row: row['match_id']):
+        match = None
+        for row in match_rows:
+            if match is None:
+                match = {
+                    'id': mid, 'court_name': row['court_name'], 'end_time': row['end_time'],
+                    'winning_team': row['winning_team'], 'score_A': row['score_A'],
+                    'score_B': row['score_B'], 'team_A': [], 'team_B': []
+                }
+            player = {
+                'id': row['player_id'], 'name': row['player_name']
+            }
+            match[f"team_{row['team']}"].append(player)
+        yield match
 
 
 @matches_api.route('/matches/history/', methods=['GET'])
 def get_match_history():
-    query = """
-        SELECT
-            m.id as match_id, m.end_time, m.winning_team, m.score_A, m.score_B, 
-            c.name as court_name, p.id as player_id, p.name as player_name, 
-            mp.team
-        FROM matches m
-        JOIN courts c ON m.court_id = c.id
-        JOIN match_players mp ON m.id = mp.match_id
-        JOIN players p ON mp.player_id = p.id
-        WHERE m.status = 'finished'
-        ORDER BY m.end_time DESC, m.id, mp.team;
     """
+    Lịch sử trận đấu, phân trang theo keyset (end_time, id).
+    Query string: limit, cursor (next_cursor của trang trước) và các bộ lọc của history_filters().
+    """
+    try:
+        limit = _int_arg(request.args, 'limit') or HISTORY_DEFAULT_LIMIT
+        limit = max(1, min(limit, HISTORY_MAX_LIMIT))
+        cursor = request.args.get('cursor')
+        after = decode_history_cursor(cursor) if cursor else None
+        clauses, params = history_filters(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     conn = get_db_connection()
-    rows = conn.execute(query).fetchall()
-    matches = {}
-    for row in rows:
-        mid = row['match_id']
-        if mid not in matches:
-            matches[mid] = {
-                'id': mid, 'court_name': row['court_name'], 'end_time': row['end_time'],
-                'winning_team': row['winning_team'], 'score_A': row['score_A'],
-                'score_B': row['score_B'], 'team_A': [], 'team_B': []
-            }
+    # Lấy dư một trận để biết còn trang sau hay không
+    matches = list(iter_history(conn, clauses, params, limit=limit + 1, after=after))
+    next_cursor = None
+    if len(matches) > limit:
+        matches = matches[:limit]
+        last = matches[-1]
+        next_cursor = encode_history_cursor(last['end_time'], last['id'])
 
-        
-        player = {
-            'id': row['player_id'], 'name': row['player_name']
-        }
-        matches[mid][f"team_{row['team']}"].append(player)
-        
-    return jsonify(list(matches.values()))
+    return jsonify({'matches': matches, 'next_cursor': next_cursor})
+
+
+HISTORY_EXPORT_FIELDS = ['id', 'end_time', 'court_name', 'team_A', 'team_B', 'score_A', 'score_B', 'winning_team']
+
+
+def _flatten_match(match):
+    """Một trận thành một dòng CSV: tên người chơi của mỗi đội nối bằng ' & '."""
+    row = dict(match)
+    for team in ('team_A', 'team_B'):
+        row[team] = ' & '.join(player['name'] for player in match[team])
+    return row
+
+
+@matches_api.route('/matches/history/export', methods=['GET'])
+def export_match_history():
+    """
+    Xuất toàn bộ lịch sử (cùng bộ lọc với /matches/history/) dưới dạng CSV hoặc NDJSON (?format=).
+    Dữ liệu được stream theo từng trận, không dựng cả danh sách trong bộ nhớ.
+    """
+    try:
+        export_format = exporting.parse_format(request.args)
+        clauses, params = history_filters(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def generate():
+        # Kết nối riêng, giữ trong suốt thời gian stream
+        with pooled_connection() as conn:
+            for match in iter_history(conn, clauses, params):
+                yield _flatten_match(match) if export_format == 'csv' else match
+
+    return exporting.export_response(generate(), export_format, HISTORY_EXPORT_FIELDS, 'match_history')
 # --- CÁC ENDPOINT POST (Đã sửa đổi) ---
     
+def start_match(cursor, match_id, court_id):
+    """
+    Phần ghi DB của việc bắt đầu một trận đang chờ trên court_id (không commit,
+    không kiểm tra sân bận). Trả về id của người chơi, hoặc None nếu trận
+    không tồn tại / không ở trạng thái chờ.
+    """
+    cursor.execute(
+        """
+        UPDATE matches 
+        SET status = 'ongoing', court_id = ?, start_time = datetime('now', 'localtime')
+        WHERE id = ? AND status = 'queued'
+        """, (court_id, match_id)
+    )
+    if cursor.rowcount == 0:
+        return None
+
+    # Update consecutive matches for players
+    player_rows = cursor.execute("SELECT player_id FROM match_players WHERE match_id = ?", (match_id,)).fetchall()
+    player_ids = [row['player_id'] for row in player_rows]
+
+    if player_ids:
+        placeholders = ','.join('?' for _ in player_ids)
+        sql = f'UPDATE players SET consecutive_matches = consecutive_matches + 1 WHERE id IN ({placeholders})'
+        cursor.execute(sql, player_ids)
+
+    # Reset the scoreboard for the assigned court
+    cursor.execute(
+        "UPDATE scoreboards SET score_A = 0, score_B = 0, updated_by = 'system' WHERE court_id = ?",
+        (court_id,)
+    )
+    return player_ids
+
+
+def reset_court_board(court_id):
+    """
+    Sau commit: điểm trực tiếp của bảng điểm trên sân về 0 và lệnh reset được
+    gửi xuống bảng. Trận đã được ghi, nên lỗi ở đây chỉ được ghi log.
+    """
+    device_id = device_routing.device_of(court_id)
+    if device_id is None:
+        return
+    try:
+        live_scores.set_scores(device_id, 0, 0, updated_by='system')
+    except (redis.RedisError, sqlite3.Error) as e:
+        print(f"[API] FAILED to reset the live score of {device_id}: {e}")
+    device_commands.send(device_id, 'reset', 0, 0)
+
+
+def insert_queued_match(cursor, team_a_ids, team_b_ids, court_id=None):
+    """Thêm một trận vào hàng chờ (không commit). Trả về id của trận."""
+    cursor.execute("INSERT INTO matches (court_id, status) VALUES (?, 'queued')", (court_id,))
+    match_id = cursor.lastrowid
+    players_data = [(match_id, player_id, 'A') for player_id in team_a_ids]
+    players_data += [(match_id, player_id, 'B') for player_id in team_b_ids]
+    cursor.executemany("INSERT INTO match_players (match_id, player_id, team) VALUES (?, ?, ?)", players_data)
+    return match_id
+
+
+# Giá trị của cấu hình AUTO_DISPATCH (sân vừa trống trong finish_match)
+AUTO_DISPATCH_OFF = 0      # Người tổ chức tự bắt đầu trận tiếp theo
+AUTO_DISPATCH_QUEUE = 1    # Bắt đầu trận chờ lâu nhất có thể chơi ngay
+AUTO_DISPATCH_SUGGEST = 2  # Như trên, nếu không có thì một trận mới từ next_match
+
+# Trận chờ lâu nhất có thể bắt đầu ngay trên sân: chưa gán sân (hoặc gán
+# đúng sân này), mọi người chơi có mặt, không phải nghỉ, không đang chơi và
+# không nằm trong danh sách loại trừ ({excluded}: các placeholder).
+NEXT_QUEUED_MATCH_QUERY = """
+    SELECT m.id FROM matches m
+    WHERE m.status = 'queued' AND (m.court_id IS NULL OR m.court_id = ?)
+      AND NOT EXISTS (SELECT 1 FROM match_players mp WHERE mp.match_id = m.id AND mp.player_id IN ({excluded}))
+      AND NOT EXISTS (
+          SELECT 1 FROM match_players mp JOIN players p ON p.id = mp.player_id
+          WHERE mp.match_id = m.id AND (
+              p.is_active != 1 OR p.consecutive_matches >= 2
+              OR EXISTS (SELECT 1 FROM match_players mp2 JOIN matches m2 ON m2.id = mp2.match_id
+                         WHERE mp2.player_id = p.id AND m2.status = 'ongoing')
+          )
+      )
+    ORDER BY m.id LIMIT 1
+"""
+
+
+def dispatch_next_match(conn, court_id, mode, exclude_ids=()):
+    """
+    Chọn và bắt đầu trận tiếp theo trên court_id vừa trống, trong transaction
+    đang mở (không commit). Người chơi trong exclude_ids (những người vừa
+    đấu xong: bước 5 của finish_match đã reset consecutive_matches của họ)
+    không được chọn. Trả về (match_id, player_ids) hoặc (None, []).
+    """
+    if mode not in (AUTO_DISPATCH_QUEUE, AUTO_DISPATCH_SUGGEST):
+        return None, []
+    exclude_ids = list(exclude_ids)
+    cursor = conn.cursor()
+    query = NEXT_QUEUED_MATCH_QUERY.format(excluded=','.join('?' for _ in exclude_ids))
+    row = cursor.execute(query, [court_id] + exclude_ids).fetchone()
+    if row is not None:
+        match_id = row['id']
+    elif mode == AUTO_DISPATCH_SUGGEST:
+        # Đọc qua cùng kết nối: pool thấy các thay đổi chưa commit của trận vừa kết thúc
+        group = next_match.next_group(conn, exclude_ids)
+        if group is None:
+            return None, []
+        match_id = insert_queued_match(cursor, [p['id'] for p in group['team_A']], [p['id'] for p in group['team_B']])
+    else:
+        return None, []
+    return match_id, start_match(cursor, match_id, court_id)
+
+
 @matches_api.route('/matches/<int:match_id>/begin', methods=['POST'])
 def begin_match(match_id):
     """Assign a court to a queued match and set its status to 'ongoing'."""
@@ -116,49 +379,37 @@ def begin_match(match_id):
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        is_busy = cursor.execute("SELECT id FROM matches WHERE court_id = ? AND status = 'ongoing'", (court_id,)).fetchone()
+        is_busy = cursor.execute(queries.BUSY_COURT_QUERY, (court_id,)).fetchone()
         if is_busy:
             return jsonify({'error': 'Court is already in use'}), 409
             
-        cursor.execute(
-            """
-            UPDATE matches 
-            SET status = 'ongoing', court_id = ?, start_time = datetime('now', 'localtime')
-            WHERE id = ? AND status = 'queued'
-            """, (court_id, match_id)
-        )
-        
-        if cursor.rowcount == 0:
+        player_ids = start_match(cursor, match_id, court_id)
+        if player_ids is None:
             conn.rollback()
             return jsonify({'error': 'Match not found or not in queued status'}), 404
 
-        # Step 2: Update consecutive matches for players
-        player_rows = cursor.execute("SELECT player_id FROM match_players WHERE match_id = ?", (match_id,)).fetchall()
-        player_ids = [row['player_id'] for row in player_rows]
-
-        if player_ids:
-            placeholders = ','.join('?' for _ in player_ids)
-            sql = f'UPDATE players SET consecutive_matches = consecutive_matches + 1 WHERE id IN ({placeholders})'
-            cursor.execute(sql, player_ids)
-        
-        # Step 3: Reset the scoreboard for the assigned court
-        cursor.execute(
-            "UPDATE scoreboards SET score_A = 0, score_B = 0, updated_by = 'system' WHERE court_id = ?",
-            (court_id,)
-        )
-        socketio.emit('score_updated', {
+        rooms.emit_court_event('score_updated', {
             'court_id': court_id, 'score_A': 0, 'score_B': 0
-        })
+        }, court_id)
+
+        # Các dòng đã thay đổi, đọc trong cùng transaction cho sự kiện delta
+        started_match = load_ongoing_matches(conn, match_id)[0]
+        changed_players = load_players(conn, player_ids)
 
         conn.commit()
 
+        # Điểm trực tiếp của bảng điểm trên sân cũng về 0
+        reset_court_board(court_id)
+
         # --- TÍCH HỢP SOCKET.IO ---
-        # Sau khi bắt đầu trận, phát sự kiện để frontend tự cập nhật
-        socketio.emit('match_state_changed', {'message': 'A match has started!'})
+        # Sau khi bắt đầu trận, phát sự kiện delta để frontend tự vá trạng thái
+        match_events.emit(match_events.MATCH_STARTED, 'A match has started!',
+                          match=started_match, players=changed_players)
         print(f"[API] Emitted 'match_state_changed' after match {match_id} began.")
+        next_match.update(conn, changed_players, busy_ids=player_ids)
         
         return jsonify({'message': 'Match started successfully'}), 200
-    except sqlite3.Error as e:
+    except (sqlite3.Error, redis.RedisError, ValueError) as e:
         conn.rollback()
         return jsonify({'error': str(e)}), 500
 
@@ -175,80 +426,113 @@ def finish_match(match_id):
     conn = get_db_connection()
     cursor = conn.cursor()
 
-
+    # Toàn bộ việc kết thúc trận nằm trong MỘT transaction, mỗi bước là một
+    # câu lệnh SQL theo tập hợp (không lặp theo từng người chơi).
     try:
-        # Lấy thông tin người chơi và các chỉ số tổng của họ
-        player_rows = cursor.execute(
-            '''SELECT p.id, p.total_matches_played, p.total_wins, mp.team 
-            FROM players p JOIN match_players mp ON p.id = mp.player_id 
-            WHERE mp.match_id = ?''',
-            (match_id,)
-        ).fetchall()
-
-        # Tính toán và cập nhật chỉ số tổng và chỉ số phiên cho từng người chơi
-        for row in player_rows:
-            is_winner = 1 if row['team'] == winning_team else 0
-
-            # Tính toán chỉ số tổng mới
-            new_total_matches = row['total_matches_played'] + 1
-            new_total_wins = row['total_wins'] + is_winner
-            # Tránh chia cho 0
-            new_win_rate = new_total_wins / new_total_matches if new_total_matches > 0 else 0
-
-            # Cập nhật cả chỉ số tổng và chỉ số phiên
-            cursor.execute(
-            '''UPDATE players SET 
-                total_matches_played = ?, 
-                total_wins = ?, 
-                win_rate = ?, 
+        # 1. Đóng trận (chỉ trận đang diễn ra mới được kết thúc)
+        cursor.execute(
+            """
+            UPDATE matches
+            SET status = 'finished', end_time = datetime('now', 'localtime'), winning_team = ?, score_A = ?, score_B = ?
+            WHERE id = ? AND status = 'ongoing'
+            """,
+            (winning_team, score_a, score_b, match_id)
+        )
+        if cursor.rowcount == 0:
+            conn.rollback()
+            return jsonify({'error': 'Không tìm thấy trận đấu hoặc trận không ở trạng thái đang diễn ra.'}), 404
+
+        # 2. Cập nhật ELO của cả 4 người trước khi tăng total_matches_played (K-factor dựa vào số trận cũ)
+        settings = logic.load_settings()
+        rating.apply_match_ratings(cursor, match_id, winning_team, settings)
+
+        # 3. Chỉ số tổng và chỉ số phiên của những người chơi trong trận.
+        #    is_winner được tính bằng subquery theo khóa chính (match_id, player_id).
+        is_winner = "(SELECT team = ? FROM match_players WHERE match_id = ? AND player_id = players.id)"
+        cursor.execute(
+            f"""
+            UPDATE players SET
+                total_matches_played = COALESCE(total_matches_played, 0) + 1,
+                total_wins = COALESCE(total_wins, 0) + {is_winner},
+                win_rate = CAST(COALESCE(total_wins, 0) + {is_winner} AS REAL) / (COALESCE(total_matches_played, 0) + 1),
                 last_played_date = datetime('now', 'localtime'),
                 session_matches_played = session_matches_played + 1,
-                session_wins = session_wins + ?,
+                session_wins = session_wins + {is_winner},
                 session_last_played = datetime('now', 'localtime')
-            WHERE id = ?''',
-            (new_total_matches, new_total_wins, new_win_rate, is_winner, row['id'])
+            WHERE id IN (SELECT player_id FROM match_players WHERE match_id = ?)
+            """,
+            (winning_team, match_id) * 3 + (match_id,)
         )
 
-        # Cập nhật trạng thái trận đấu (giữ nguyên như cũ)
+        # 4. Tăng số lượt của sân
         cursor.execute(
-            "UPDATE matches SET status = 'finished', end_time = datetime('now', 'localtime'), winning_team = ?, score_A = ?, score_B = ? WHERE id = ?",
-            (winning_team, score_a, score_b, match_id)
+            "UPDATE courts SET session_turns = session_turns + 1 WHERE id = (SELECT court_id FROM matches WHERE id = ?)",
+            (match_id,)
         )
 
-    # ... các phần còn lại của hàm giữ nguyên ...
-        
-        conn.commit()
-        match_info = cursor.execute("SELECT court_id FROM matches WHERE id = ?", (match_id,)).fetchone()
-        if match_info:
-            court_id = match_info['court_id']
-            cursor.execute("UPDATE courts SET session_turns = session_turns + 1 WHERE id = ?", (court_id,))
+        # 5. Reset consecutive_matches cho người chơi đã nghỉ (có mặt nhưng không ở trận nào đang diễn ra)
+        rested_ids = [row['id'] for row in cursor.execute(f"SELECT id FROM players WHERE {queries.RESTING_PLAYERS_CONDITION}")]
+        cursor.execute(queries.RESET_RESTED_PLAYERS)
+
+        # 6. Ghi điểm trực tiếp cuối cùng của bảng điểm trên sân vào SQLite (checkpoint)
+        court_row = cursor.execute("SELECT court_id FROM matches WHERE id = ?", (match_id,)).fetchone()
+        if court_row and court_row['court_id'] is not None:
+            live_scores.flush_device(device_routing.device_of(court_row['court_id']), cursor)
+
+        # 7. Ghi lịch sử đồng đội cho từng đội
+        team_rows = cursor.execute("SELECT player_id, team FROM match_players WHERE match_id = ?", (match_id,)).fetchall()
+        pair_keys = []
+        for team in ('A', 'B'):
+            key = logic.update_pair_history([{'id': row['player_id']} for row in team_rows if row['team'] == team], cursor)
+            if key is not None:
+                pair_keys.append(key)
+
+        # 8. AUTO_DISPATCH: trận tiếp theo bắt đầu ngay trên sân vừa trống, trong cùng transaction
+        #    (savepoint: nếu việc chọn trận lỗi, chỉ phần này bị hủy, trận vẫn được kết thúc)
+        started_match_id, started_ids = None, []
+        if court_row and court_row['court_id'] is not None:
+            cursor.execute('SAVEPOINT dispatch')
+            try:
+                started_match_id, started_ids = dispatch_next_match(
+                    conn, court_row['court_id'], settings.get('AUTO_DISPATCH', AUTO_DISPATCH_OFF),
+                    exclude_ids=[row['player_id'] for row in team_rows])
+            except Exception as e:
+                cursor.execute('ROLLBACK TO dispatch')
+                started_match_id, started_ids = None, []
+                print(f"[API] Auto-dispatch on court {court_row['court_id']} failed: {e}")
+            cursor.execute('RELEASE dispatch')
+
+        # 9. Các dòng đã thay đổi, đọc trong cùng transaction cho sự kiện delta
+        finished_match = next(iter_history(conn, ["m.status = 'finished'", 'm.id = ?'], [match_id]))
+        court = None
+        if court_row and court_row['court_id'] is not None:
+            court = dict(cursor.execute("SELECT * FROM courts WHERE id = ?", (court_row['court_id'],)).fetchone())
+        started_match = load_ongoing_matches(conn, started_match_id)[0] if started_match_id else None
+        changed_players = load_players(conn, {row['player_id'] for row in team_rows} | set(rested_ids) | set(started_ids))
 
         conn.commit()
+    except (sqlite3.Error, redis.RedisError, ValueError) as e:
+        # Lỗi Redis (ghi điểm trực tiếp ở bước 6) hay dữ liệu sai cũng hủy toàn bộ transaction
+        conn.rollback()
+        return jsonify({'error': str(e)}), 500
 
-        # Logic reset consecutive_matches cho người chơi đã nghỉ
-        active_rows = cursor.execute('SELECT id FROM players WHERE is_active = 1').fetchall()
-        active_ids = {row['id'] for row in active_rows}
-        ongoing_rows = cursor.execute("SELECT DISTINCT player_id FROM match_players WHERE match_id IN (SELECT id FROM matches WHERE status = 'ongoing')").fetchall()
-        ongoing_ids = {row['player_id'] for row in ongoing_rows}
-        rested_ids = list(active_ids - ongoing_ids)
+    # Cache pair_history chỉ được cộng sau khi commit thành công
+    logic.apply_pair_history_increments(pair_keys)
 
-        if rested_ids:
-            placeholders = ','.join('?' for _ in rested_ids)
-            sql = f'UPDATE players SET consecutive_matches = 0 WHERE id IN ({placeholders})'
-            cursor.execute(sql, rested_ids)
-            conn.commit()
+    # --- TÍCH HỢP SOCKET.IO ---
+    # Sau khi kết thúc trận, phát sự kiện delta để frontend tự vá trạng thái.
+    # Nếu trận tiếp theo đã được bắt đầu (AUTO_DISPATCH), một sự kiện duy nhất mang cả hai trận.
+    if started_match is not None:
+        reset_court_board(started_match['court_id'])
+        match_events.emit(match_events.MATCH_TURNOVER, 'A match has finished and the next one has started!',
+                          match=finished_match, court=court, started_match=started_match, players=changed_players)
+    else:
+        match_events.emit(match_events.MATCH_FINISHED, 'A match has finished!',
+                          match=finished_match, court=court, players=changed_players)
+    print(f"[API] Emitted 'match_state_changed' after match {match_id} finished.")
+    next_match.update(conn, changed_players, busy_ids=started_ids)
 
-        
-        # --- TÍCH HỢP SOCKET.IO ---
-        # Sau khi kết thúc trận, phát sự kiện để frontend tự cập nhật
-        socketio.emit('match_state_changed', {'message': 'A match has finished!'})
-        print(f"[API] Emitted 'match_state_changed' after match {match_id} finished.")
-
-        return jsonify({'message': 'Match finished successfully'}), 200
-        
-    except sqlite3.Error as e:
-        conn.rollback()
-        return jsonify({'error': str(e)}), 500
+    return jsonify({'message': 'Match finished successfully', 'started_match_id': started_match_id}), 200
 
 
 @matches_api.route('/matches/queue', methods=['POST'])
@@ -267,18 +551,10 @@ def queue_match():
     cursor = conn.cursor()
     try:
         # Insert a match without a court_id. It will be NULL.
-        cursor.execute("INSERT INTO matches (court_id, status) VALUES (?, 'queued')", (None,))
-        match_id = cursor.lastrowid
-
-        players_data = []
-        for player in team_a:
-            players_data.append((match_id, player['id'], 'A'))
-        for player in team_b:
-            players_data.append((match_id, player['id'], 'B'))
-                    
-        cursor.executemany("INSERT INTO match_players (match_id, player_id, team) VALUES (?, ?, ?)", players_data)
+        match_id = insert_queued_match(cursor, [p['id'] for p in team_a], [p['id'] for p in team_b])
 
         conn.commit()
+        match_events.bump_version()
         return jsonify({'message': 'Match added to queue!', 'match_id': match_id}), 201
     except sqlite3.Error as e:
         conn.rollback()
@@ -1,19 +1,54 @@
 # api/players.py
 from flask import Blueprint, request, jsonify
 import sqlite3
-from database import get_db_connection
+from database import get_db_connection, pooled_connection
+import exporting
+import logic
+import rating
+import match_events
+import queries
 
 # Tạo một Blueprint tên là 'players_api'
 # Blueprint giống như một ứng dụng Flask thu nhỏ, có thể được đăng ký vào ứng dụng chính
 players_api = Blueprint('players_api', __name__)
 
 
+def load_all_players(conn):
+    return [dict(row) for row in conn.execute('SELECT * FROM players ORDER BY name ASC')]
+
+
+def load_available_players(conn):
+    """Người chơi đang có mặt và không phải nghỉ do đã chơi 2 trận liên tiếp."""
+    return [dict(row) for row in conn.execute(queries.AVAILABLE_PLAYERS_QUERY)]
+
+
 @players_api.route('/players/', methods=['GET'])
 def get_players():
     conn = get_db_connection()
-    players_rows = conn.execute('SELECT * FROM players ORDER BY name ASC').fetchall()
-    players_list = [dict(row) for row in players_rows]
-    return jsonify(players=players_list)
+    return jsonify(players=load_all_players(conn))
+
+
+PLAYER_EXPORT_FIELDS = [
+    'id', 'name', 'type', 'gender', 'skill_level', 'elo_rating', 'is_active',
+    'total_matches_played', 'total_wins', 'win_rate', 'last_played_date',
+    'session_matches_played', 'session_wins', 'join_date'
+]
+
+
+@players_api.route('/players/export', methods=['GET'])
+def export_players():
+    """Xuất chỉ số người chơi dưới dạng CSV hoặc NDJSON (?format=), stream từng dòng."""
+    try:
+        export_format = exporting.parse_format(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def generate():
+        with pooled_connection() as conn:
+            for row in conn.execute('SELECT * FROM players ORDER BY name ASC'):
+                yield dict(row)
+
+    return exporting.export_response(generate(), export_format, PLAYER_EXPORT_FIELDS, 'players')
 
 @players_api.route('/players/<int:player_id>', methods=['GET'])
 def get_player_by_id(player_id):
@@ -44,11 +79,12 @@ def add_player():
         conn = get_db_connection()
         # Cập nhật câu lệnh SQL
         conn.execute('''
-            INSERT INTO players (name, type, gender, contact_info, skill_level, join_date) 
-            VALUES (?, ?, ?, ?, ?, datetime('now', 'localtime'))
+            INSERT INTO players (name, type, gender, contact_info, skill_level, elo_rating, join_date) 
+            VALUES (?, ?, ?, ?, ?, ?, datetime('now', 'localtime'))
             ''',
-            (name, player_type, gender, contact_info, skill_level))
+            (name, player_type, gender, contact_info, skill_level, rating.initial_rating(skill_level)))
         conn.commit()
+        match_events.bump_version()
         return jsonify({'message': f'Đã thêm thành công người chơi {name}'}), 201
     except sqlite3.IntegrityError:
         return jsonify({'error': 'Lỗi khi thêm người chơi'}), 500
@@ -83,9 +119,22 @@ def update_player(player_id):
     
     if cursor.rowcount == 0:
         return jsonify({'error': 'Không tìm thấy người chơi'}), 404
+    match_events.bump_version()
     
     return jsonify({'message': f'Cập nhật thành công người chơi ID {player_id}'})
 
+@players_api.route('/players/ratings/recompute', methods=['POST'])
+def recompute_ratings():
+    """Tính lại ELO của tất cả người chơi từ toàn bộ lịch sử trận đấu."""
+    conn = get_db_connection()
+    try:
+        replayed = rating.recompute_all_ratings(conn, logic.load_settings())
+        match_events.bump_version()
+        return jsonify({'message': f'Đã tính lại ELO từ {replayed} trận đấu'})
+    except sqlite3.Error as e:
+        conn.rollback()
+        return jsonify({'error': f'Lỗi database: {e}'}), 500
+
 @players_api.route('/players/<int:player_id>', methods=['DELETE'])
 def delete_player(player_id):
     conn = get_db_connection()
@@ -94,6 +143,7 @@ def delete_player(player_id):
     conn.commit()
     if cursor.rowcount == 0:
         return jsonify({'error': 'Không tìm thấy người chơi'}), 404
+    match_events.bump_version()
     return jsonify({'message': f'Đã xóa thành công người chơi ID {player_id}'})
 
 # Thêm vào cuối file api/players.py
@@ -106,6 +156,4 @@ def get_available_players():
     2. Không phải nghỉ do đã chơi 2 trận liên tiếp (consecutive_matches < 2)
     """
     conn = get_db_connection()
-    query = "SELECT * FROM players WHERE is_active = 1 AND consecutive_matches < 2 ORDER BY name ASC"
-    players = conn.execute(query).fetchall()
-    return jsonify([dict(row) for row in players])
\ No newline at end of file
+    return jsonify(load_available_players(conn))
\ No newline at end of file
@@ -10,18 +10,28 @@ import sqlite3
 
 # --- IMPORTS MỚI ---
 from database import get_db_connection
-from extensions import socketio # Quan trọng: import socketio để phát sự kiện
+import rooms # Phát sự kiện vào room của sân và room dashboard
+import device_routing
+import live_scores
+import score_stream
+import device_commands
+import match_events
+import queries
 
 scoreboards_api = Blueprint('scoreboards_api', __name__)
 
+def load_scoreboards(conn):
+    scoreboards = [dict(row) for row in conn.execute("SELECT * FROM scoreboards")]
+    # Điểm trong bảng chỉ là checkpoint, điểm mới nhất nằm trong live_scores
+    return live_scores.overlay(scoreboards)
+
+
 @scoreboards_api.route('/scoreboards/', methods=['GET'])
 def get_all_scoreboards():
     """Fetches all registered scoreboard devices."""
     try:
         conn = get_db_connection()
-        cursor = conn.execute("SELECT * FROM scoreboards")
-        scoreboards = [dict(row) for row in cursor.fetchall()]
-        return jsonify(scoreboards)
+        return jsonify(load_scoreboards(conn))
     except sqlite3.Error as e:
         return jsonify({'error': str(e)}), 500
 
@@ -45,10 +55,16 @@ def assign_scoreboard():
         # Assign the new board
         cursor.execute("UPDATE scoreboards SET court_id = ? WHERE device_id = ?", (court_id, device_id))
         
+        assigned = cursor.rowcount > 0
         conn.commit()
+        if assigned:
+            device_routing.assign(device_id, court_id)
+        else:
+            device_routing.unassign_court(court_id)
+        match_events.bump_version()
         
         # --- TÍCH HỢP SOCKET.IO ---
-        socketio.emit('scoreboard_assignment_changed', {'court_id': court_id, 'device_id': device_id})
+        rooms.emit_court_event('scoreboard_assignment_changed', {'court_id': court_id, 'device_id': device_id}, court_id)
         print(f"[API] Emitted 'scoreboard_assignment_changed' for court {court_id}.")
 
         return jsonify({'message': f'Scoreboard {device_id} assigned to court {court_id}'}), 200
@@ -70,9 +86,11 @@ def unassign_scoreboard():
         cursor = conn.cursor()
         cursor.execute("UPDATE scoreboards SET court_id = NULL WHERE court_id = ?", (court_id,))
         conn.commit()
+        device_routing.unassign_court(court_id)
+        match_events.bump_version()
 
         # --- TÍCH HỢP SOCKET.IO ---
-        socketio.emit('scoreboard_assignment_changed', {'court_id': court_id, 'device_id': None})
+        rooms.emit_court_event('scoreboard_assignment_changed', {'court_id': court_id, 'device_id': None}, court_id)
         print(f"[API] Emitted 'scoreboard_assignment_changed' for court {court_id} (unassigned).")
 
         return jsonify({'message': f'Scoreboard unassigned from court {court_id}'}), 200
@@ -94,15 +112,17 @@ def toggle_swap():
         cursor = conn.cursor()
         
         # Toggle the boolean value
-        cursor.execute("UPDATE scoreboards SET is_swapped = NOT is_swapped WHERE court_id = ?", (court_id,))
+        cursor.execute(queries.SWAP_SCOREBOARD, (court_id,))
         conn.commit()
 
         # Get the new state to broadcast
         new_state = cursor.execute("SELECT is_swapped FROM scoreboards WHERE court_id = ?", (court_id,)).fetchone()
         if new_state:
+            device_routing.set_swapped(court_id, new_state['is_swapped'])
+            match_events.bump_version()
             # --- TÍCH HỢP SOCKET.IO ---
             payload = {'court_id': court_id, 'is_swapped': new_state['is_swapped']}
-            socketio.emit('board_state_updated', payload)
+            rooms.emit_court_event('board_state_updated', payload, court_id)
             print(f"[API] Emitted 'board_state_updated': {payload}")
 
         return jsonify({'message': 'Swap state toggled'}), 200
@@ -114,7 +134,7 @@ def toggle_swap():
 def control_scoreboard():
     """
     Handles score controls from the web UI (inc, dec, reset).
-    This function updates the DB and emits the new state.
+    This function updates the live score of the court's board and emits the new state.
     """
     data = request.get_json()
     court_id = data.get('court_id')
@@ -123,77 +143,60 @@ def control_scoreboard():
     if not court_id or not action:
         return jsonify({'error': 'Court ID and action are required'}), 400
 
-    actions = {
-        'inc_a': "score_A = score_A + 1",
-        'dec_a': "score_A = MAX(0, score_A - 1)",
-        'inc_b': "score_B = score_B + 1",
-        'dec_b': "score_B = MAX(0, score_B - 1)",
-        'reset': "score_A = 0, score_B = 0"
-    }
-
-    if action not in actions:
+    if action not in live_scores.ACTIONS:
         return jsonify({'error': 'Invalid action'}), 400
 
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Update scores in DB
-        query = f"UPDATE scoreboards SET {actions[action]}, updated_by = 'web' WHERE court_id = ?"
-        cursor.execute(query, (court_id,))
-        conn.commit()
+        court_id = int(court_id)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Court ID must be an integer'}), 400
 
-        # Get the new scores to broadcast
-        new_scores = cursor.execute("SELECT score_A, score_B FROM scoreboards WHERE court_id = ?", (court_id,)).fetchone()
-        
-        if new_scores:
-            # --- TÍCH HỢP SOCKET.IO ---
-            # This is the same event the Redis listener uses.
-            # This ensures the UI updates consistently whether the score
-            # is changed by a device or by the web UI.
-            payload = {
-                'court_id': court_id,
-                'score_A': new_scores['score_A'],
-                'score_B': new_scores['score_B']
-            }
-            socketio.emit('score_updated', payload)
-            print(f"[API] Emitted 'score_updated': {payload}")
-
-        # LƯU Ý: Logic để gửi lệnh ngược lại cho ESP qua Redis
-        # sẽ cần được thêm vào đây nếu muốn điều khiển 2 chiều.
-        
-        return jsonify({'message': f'Action {action} performed'}), 200
+    device_id = device_routing.device_of(court_id)
+    if device_id is None:
+        return jsonify({'error': 'No scoreboard assigned to this court'}), 404
+
+    try:
+        # Cập nhật điểm trực tiếp (Redis, nguyên tử); SQLite được ghi bởi checkpointer
+        score_a, score_b, score_seq = live_scores.apply_action(device_id, action, updated_by='web')
     except sqlite3.Error as e:
-        conn.rollback()
         return jsonify({'error': str(e)}), 500
 
+    # --- TÍCH HỢP SOCKET.IO ---
+    # This is the same event the Redis listener uses.
+    # This ensures the UI updates consistently whether the score
+    # is changed by a device or by the web UI.
+    payload = {'court_id': court_id, 'device_id': device_id, 'score_A': score_a, 'score_B': score_b,
+               'seq': score_seq, 'epoch': live_scores.epoch(), 'writer': 'web'}
+    rooms.emit_court_event('score_updated', payload, court_id)
+    print(f"[API] Emitted 'score_updated': {payload}")
 
+    # Gửi lệnh xuống bảng điểm vật lý (qua Redis -> sock_server -> ESP)
+    seq = device_commands.send(device_id, action, score_a, score_b)
 
+    return jsonify({'message': f'Action {action} performed', 'seq': seq}), 200
 
 
 @scoreboards_api.route('/scoreboards/<device_id>/score', methods=['POST'])
 def update_score_from_device(device_id):
-    data = request.get_json()
-    score_a = data.get('score_A', 0)
-    score_b = data.get('score_B', 0)
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE scoreboards SET score_A = ?, score_B = ?, last_seen = datetime('now', 'localtime'), updated_by = 'device' WHERE device_id = ?",
-        (score_a, score_b, device_id)
-    )
-    if cursor.rowcount == 0:
-        cursor.execute(
-            "INSERT INTO scoreboards (device_id, score_A, score_B, last_seen) VALUES (?, ?, ?, datetime('now', 'localtime'))",
-            (device_id, score_a, score_b)
-        )
-    conn.commit()
-    scoreboard = cursor.execute("SELECT court_id FROM scoreboards WHERE device_id = ?", (device_id,)).fetchone()
-    if scoreboard and scoreboard['court_id'] is not None:
-        socketio.emit('score_updated', {
-            'court_id': scoreboard['court_id'], 'score_A': score_a, 'score_B': score_b
-        })
-    return jsonify({'message': 'Score updated'}), 200
+    data = request.get_json(silent=True) or {}
+    try:
+        # Điểm phải là số nguyên không âm: giá trị sai sẽ làm hỏng hash điểm trực tiếp
+        score_a = score_stream.parse_score(data.get('score_A', 0))
+        score_b = score_stream.parse_score(data.get('score_B', 0))
+    except ValueError:
+        return jsonify({'error': 'score_A and score_B must be non-negative integers'}), 400
+    seq = live_scores.set_scores(device_id, score_a, score_b, updated_by='device')
+    if seq is None:
+        # Một điểm mới hơn đã được ghi (bởi web hoặc tiến trình khác): bỏ qua
+        return jsonify({'message': 'Stale score ignored'}), 200
+    # Sân của thiết bị lấy từ bảng định tuyến trong bộ nhớ, không cần SELECT
+    court_id = device_routing.court_of(device_id)
+    if court_id is not None:
+        rooms.emit_court_event('score_updated', {
+            'court_id': court_id, 'device_id': device_id, 'score_A': score_a, 'score_B': score_b,
+            'seq': seq, 'epoch': live_scores.epoch(), 'writer': 'device'
+        }, court_id)
+    return jsonify({'message': 'Score updated', 'seq': seq}), 200
 
 
 
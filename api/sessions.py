@@ -2,18 +2,21 @@
 from flask import Blueprint, jsonify, request
 import sqlite3
 from database import get_db_connection
+import match_events
 
 sessions_api = Blueprint('sessions_api', __name__)
 
 
+def load_current_session(conn):
+    session = conn.execute("SELECT * FROM sessions WHERE status = 'active'").fetchone()
+    return dict(session) if session else None
+
+
 @sessions_api.route('/sessions/current/', methods=['GET'])
 def get_current_session():
     """Lấy thông tin về phiên đang hoạt động."""
     conn = get_db_connection()
-    session = conn.execute("SELECT * FROM sessions WHERE status = 'active'").fetchone()
-    if session:
-        return jsonify(dict(session))
-    return jsonify(None)
+    return jsonify(load_current_session(conn))
 
 @sessions_api.route('/sessions/start', methods=['POST'])
 def start_session():
@@ -44,6 +47,7 @@ def start_session():
         cursor.execute("INSERT INTO sessions (status) VALUES ('active')")
         
         conn.commit()
+        match_events.bump_version()
         return jsonify({'message': 'Phiên chơi mới đã bắt đầu thành công!'}), 201
     except sqlite3.Error as e:
         conn.rollback()
@@ -76,6 +80,7 @@ def end_session():
         cursor.execute("UPDATE players SET is_active = 0")
         
         conn.commit()
+        match_events.bump_version()
         return jsonify({'message': 'Phiên chơi đã kết thúc. Hẹn gặp lại lần sau!'})
     except sqlite3.Error as e:
         conn.rollback()
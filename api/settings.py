@@ -2,6 +2,7 @@
 from flask import Blueprint, jsonify, request
 import sqlite3
 from database import get_db_connection
+import settings_cache
 
 settings_api = Blueprint('settings_api', __name__)
 
@@ -9,10 +10,8 @@ settings_api = Blueprint('settings_api', __name__)
 
 @settings_api.route('/settings/', methods=['GET'])
 def get_settings():
-    conn = get_db_connection()
-    settings_rows = conn.execute('SELECT key, value FROM settings').fetchall()
-    settings_dict = {row['key']: row['value'] for row in settings_rows}
-    return jsonify(settings_dict)
+    # Đọc từ cache trong bộ nhớ, không truy vấn lại bảng settings
+    return jsonify(settings_cache.get_raw_settings())
 
 @settings_api.route('/settings', methods=['PUT'])
 def update_settings():
@@ -23,12 +22,17 @@ def update_settings():
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
+        # Chỉ các khóa đã biết; khóa chưa có dòng trong bảng (vd. cấu hình mới) được thêm vào
         for key, value in new_settings.items():
+            if key not in settings_cache.NUMERIC_KEYS:
+                continue
             cursor.execute(
-                'UPDATE settings SET value = ? WHERE key = ?',
-                (str(value), key)
+                'INSERT INTO settings (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value',
+                (key, str(value))
             )
         conn.commit()
+        # Xóa cache ở process này và báo cho các process khác qua Redis
+        settings_cache.publish_invalidation()
         return jsonify({'message': 'Cập nhật cấu hình thành công!'})
     except sqlite3.Error as e:
         conn.rollback()
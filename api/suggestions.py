@@ -2,23 +2,65 @@
 from flask import Blueprint, request, jsonify
 import sqlite3
 import os
+import json
+import time
+import hashlib
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from openai import OpenAI
 from dotenv import load_dotenv
-from database import get_db_connection
+from database import get_db_connection, pooled_connection
+import logic
+import next_match
+import rooms
 
 # Tải các biến môi trường từ file .env
 load_dotenv()
 
 suggestions_api = Blueprint('suggestions_api', __name__)
 
+# --- Cấu hình gợi ý AI ---
+# OPENAI_BASE_URL cho phép trỏ tới một server tương thích chat-completions
+# (vd: một stub chạy local khi kiểm thử).
+AI_MODEL = os.environ.get('SUGGESTIONS_MODEL', 'gpt-3.5-turbo')  # Hoặc "gpt-4" để có kết quả tốt hơn
+AI_TIMEOUT = float(os.environ.get('SUGGESTIONS_AI_TIMEOUT', 20))  # Hạn chót cứng của một lần gọi LLM (giây)
+AI_WAIT = float(os.environ.get('SUGGESTIONS_AI_WAIT', 3))         # Thời gian request chờ LLM trước khi trả kết quả local
+AI_CACHE_TTL = float(os.environ.get('SUGGESTIONS_CACHE_TTL', 300))
+AI_CACHE_MAX_ENTRIES = 128
+AI_MAX_WORKERS = 2
+LOCAL_ENGINES = ('auto', 'exhaustive', 'fast')  # Giá trị 'engine' hợp lệ trong body của request
+
 # Khởi tạo OpenAI client
 # Nó sẽ tự động đọc key từ biến môi trường OPENAI_API_KEY
 try:
-    client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+    client = OpenAI(
+        api_key=os.environ.get("OPENAI_API_KEY"),
+        base_url=os.environ.get("OPENAI_BASE_URL") or None,
+        timeout=AI_TIMEOUT,
+        max_retries=0,  # Không thử lại: quá hạn thì dùng kết quả local
+    )
 except Exception as e:
     client = None
     print(f"LỖI: Không thể khởi tạo OpenAI client. Hãy chắc chắn bạn đã đặt OPENAI_API_KEY. Lỗi: {e}")
 
+# Các lần gọi LLM chạy trên thread riêng, không chiếm thread của request
+_ai_executor = ThreadPoolExecutor(max_workers=AI_MAX_WORKERS, thread_name_prefix='ai-suggestions')
+_ai_lock = threading.Lock()
+_ai_cache = {}      # key -> (hết hạn lúc, kết quả LLM)
+_ai_in_flight = {}  # key -> Future của lần gọi đang chạy (các request giống nhau dùng chung)
+
+# --- Job gợi ý chạy nền ---
+JOB_MAX_WORKERS = 2
+JOB_PROGRESS_INTERVAL = 0.2   # Khoảng cách tối thiểu (giây) giữa hai sự kiện tiến độ của một job
+JOB_KEEP_SECONDS = 300        # Job đã kết thúc được giữ lại để GET trong ngần này giây
+JOB_EVENT = 'suggestion_job'
+
+_job_executor = ThreadPoolExecutor(max_workers=JOB_MAX_WORKERS, thread_name_prefix='suggestion-jobs')
+_jobs_lock = threading.Lock()
+_jobs = {}           # job_id -> SuggestionJob
+_client_jobs = {}    # client_id -> job_id mới nhất của client đó
 
 
 def create_prompt(players, courts_count, rules):
@@ -58,71 +100,421 @@ def create_prompt(players, courts_count, rules):
     return system_prompt, user_prompt
 
 
-@suggestions_api.route('/suggestions', methods=['POST'])
-def get_suggestions():
-    if not client:
-        return jsonify({'error': 'Dịch vụ gợi ý AI chưa được cấu hình đúng.'}), 503
+# --- Cache kết quả LLM (TTL) ---
 
-    data = request.get_json()
-    player_ids = data.get('player_ids')
-    
-    if not player_ids or len(player_ids) < 4:
-        return jsonify({'suggestions': []}) # Không đủ người để xếp trận
+def ai_cache_key(players, courts, rules):
+    """Hash của (người chơi + chỉ số phiên, sân trống, quy tắc, model): cùng đầu vào thì cùng gợi ý."""
+    raw = json.dumps({
+        'players': sorted(
+            [p['id'], p['skill_level'], p['session_matches_played'], p['session_last_played']] for p in players
+        ),
+        'courts': sorted(court['id'] for court in courts),
+        'rules': rules,
+        'model': AI_MODEL,
+    }, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _cache_get(key):
+    now = time.monotonic()
+    with _ai_lock:
+        entry = _ai_cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del _ai_cache[key]
+            return None
+        return entry[1]
+
+
+def _cache_put(key, result):
+    now = time.monotonic()
+    with _ai_lock:
+        # Bỏ các mục đã hết hạn, sau đó các mục cũ nhất nếu vẫn quá giới hạn
+        for expired in [k for k, (expires_at, _) in _ai_cache.items() if expires_at <= now]:
+            del _ai_cache[expired]
+        while len(_ai_cache) >= AI_CACHE_MAX_ENTRIES:
+            del _ai_cache[next(iter(_ai_cache))]
+        _ai_cache[key] = (now + AI_CACHE_TTL, result)
 
-    # --- Lấy dữ liệu từ DB (giống như code cũ của bạn) ---
-    conn = get_db_connection()
-    placeholders = ','.join('?' for _ in player_ids)
-    
-    # Lấy thông tin người chơi được chọn
-    query_players = f"SELECT id, name, skill_level, session_matches_played, session_last_played FROM players WHERE id IN ({placeholders})"
-    selected_players_rows = conn.execute(query_players, player_ids).fetchall()
-    
-    # Lấy thông tin sân trống
-    empty_courts = conn.execute('SELECT * FROM courts WHERE id NOT IN (SELECT court_id FROM matches WHERE status = "ongoing")').fetchall()
 
-    if not empty_courts:
-         return jsonify({'suggestions': []}) # Không có sân trống
+# --- Gợi ý ---
+
+def load_candidates(conn, player_ids):
+    """
+    Những người chơi được chọn đang có mặt và sẵn sàng (chưa chơi 2 trận liên
+    tiếp, không ở trận nào đang diễn ra), kèm thời gian nghỉ, và các sân trống.
+    """
+    placeholders = ','.join('?' for _ in player_ids)
+    players = [dict(row) for row in conn.execute(f"""
+        SELECT * FROM players
+        WHERE id IN ({placeholders}) AND is_active = 1 AND consecutive_matches < 2
+          AND id NOT IN (SELECT mp.player_id FROM match_players mp
+                         JOIN matches m ON m.id = mp.match_id WHERE m.status = 'ongoing')
+    """, player_ids)]
+    empty_courts = [dict(row) for row in conn.execute(
+        "SELECT * FROM courts WHERE id NOT IN (SELECT court_id FROM matches WHERE status = 'ongoing' AND court_id IS NOT NULL) ORDER BY id"
+    )]
 
     # Xử lý dữ liệu người chơi để thêm thông tin "thời gian nghỉ"
-    from datetime import datetime
-    players_for_prompt = []
-    for row in selected_players_rows:
-        player = dict(row)
+    now = datetime.now()
+    for player in players:
         if player['session_last_played']:
             last_played = datetime.fromisoformat(player['session_last_played'])
-            rest_time = (datetime.now() - last_played).total_seconds() / 60
-            player['rest_time_minutes'] = int(rest_time)
+            player['rest_time_minutes'] = int((now - last_played).total_seconds() / 60)
         else:
             player['rest_time_minutes'] = 999 # Coi như đã nghỉ rất lâu
-        players_for_prompt.append(player)
+    return players, empty_courts
+
 
-    # --- Gọi API của LLM ---
-    system_prompt, user_prompt = create_prompt(
-        players_for_prompt, 
-        len(empty_courts), 
-        data.get('rules', 'Ưu tiên cân bằng trình độ và cho người nghỉ lâu được chơi.')
+def parse_rules(data):
+    """(rules cho logic.plan_matches, quy tắc dạng văn bản cho LLM) từ body của request."""
+    rules = {key: data.get(key, default) for key, default in logic.DEFAULT_RULES.items()}
+    # Chỉ là gợi ý: logic._select_engine vẫn giới hạn số nhóm khi vét cạn
+    rules['engine'] = data.get('engine') if data.get('engine') in LOCAL_ENGINES else 'auto'
+
+    rules_text = data.get('rules', 'Ưu tiên cân bằng trình độ và cho người nghỉ lâu được chơi.')
+    return rules, rules_text
+
+
+def _format_local(suggestions, engine=None):
+    source = f"Thuật toán nội bộ ({engine})" if engine else "Thuật toán nội bộ (đang tối ưu)"
+    return [{
+        'court_id': suggestion['court_id'],
+        'court_name': suggestion['court_name'],
+        'team_A': [p['name'] for p in suggestion['team_A']],
+        'team_B': [p['name'] for p in suggestion['team_B']],
+        'team_A_ids': [p['id'] for p in suggestion['team_A']],
+        'team_B_ids': [p['id'] for p in suggestion['team_B']],
+        'balance_score': suggestion['balance_score'],
+        'reasoning': f"{source}: chênh lệch ELO và ưu tiên nghỉ, điểm cân bằng {suggestion['balance_score']}.",
+    } for suggestion in suggestions]
+
+
+def local_suggestions(players, empty_courts, rules, conn, progress=None):
+    """
+    Gợi ý tức thì từ thuật toán nội bộ (logic.plan_matches), cùng định dạng với gợi ý AI.
+    progress(stage, suggestions) nhận kết quả tốt nhất tới lúc đó (đã đổi định dạng).
+    """
+    hook = None
+    if progress is not None:
+        def hook(stage, suggestions):
+            progress(stage, _format_local(suggestions) if suggestions is not None else None)
+    plan = logic.plan_matches(players, empty_courts, rules, conn, hook)
+    return _format_local(plan['suggestions'], plan['engine'])
+
+
+def _call_llm(players, empty_courts, rules_text):
+    """Gọi LLM (chạy trên _ai_executor). Trả về danh sách gợi ý đã kiểm tra."""
+    system_prompt, user_prompt = create_prompt(players, len(empty_courts), rules_text)
+    completion = client.chat.completions.create(
+        model=AI_MODEL,
+        response_format={ "type": "json_object" },
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
     )
+    return validate_ai_suggestions(json.loads(completion.choices[0].message.content), players, empty_courts)
+
+
+def validate_ai_suggestions(suggestions_data, players, empty_courts):
+    """
+    Kiểm tra gợi ý của LLM theo cùng ràng buộc với logic.plan_matches: mỗi đội
+    đúng 2 người trong số `players` (đã lọc sẵn sàng), các trận không trùng
+    người, số trận không vượt quá số sân trống. Gán sân trống theo thứ tự
+    (LLM không biết tên sân cụ thể). Ném ValueError nếu không hợp lệ: khi đó
+    kết quả không được cache và kết quả nội bộ được dùng.
+    """
+    raw = suggestions_data.get('suggestions') if isinstance(suggestions_data, dict) else None
+    if not isinstance(raw, list) or not raw:
+        raise ValueError('LLM không trả về gợi ý nào.')
+    max_matches = min(len(empty_courts), len(players) // 4)
+    if len(raw) > max_matches:
+        raise ValueError(f'LLM gợi ý {len(raw)} trận, tối đa {max_matches}.')
+
+    ids_by_name = {}
+    for p in players:
+        # Tên trùng nhau không xác định được người chơi
+        ids_by_name[p['name']] = None if p['name'] in ids_by_name else p['id']
+    used = set()
+    suggestions = []
+    for court, suggestion in zip(empty_courts, raw):
+        if not isinstance(suggestion, dict):
+            raise ValueError('Gợi ý của LLM không đúng định dạng.')
+        teams = {}
+        for team in ('team_A', 'team_B'):
+            names = suggestion.get(team)
+            if not isinstance(names, list) or len(names) != 2 or \
+                    not all(isinstance(name, str) and ids_by_name.get(name) is not None for name in names):
+                raise ValueError(f'Đội không hợp lệ trong gợi ý của LLM: {names}')
+            teams[team] = names
+        ids = [ids_by_name[name] for name in teams['team_A'] + teams['team_B']]
+        if len(set(ids)) != 4 or used.intersection(ids):
+            raise ValueError('Một người chơi được xếp vào nhiều vị trí trong gợi ý của LLM.')
+        used.update(ids)
+        suggestions.append({
+            'court_id': court['id'], 'court_name': court['name'],
+            'team_A': teams['team_A'], 'team_B': teams['team_B'],
+            'team_A_ids': ids[:2], 'team_B_ids': ids[2:],
+            'reasoning': str(suggestion.get('reasoning', '')),
+        })
+    return suggestions
+
+
+def _start_llm(key, players, empty_courts, rules_text):
+    """Future của lần gọi LLM cho `key` (dùng lại lần gọi đang chạy nếu có). Kết quả được lưu vào cache."""
+    with _ai_lock:
+        future = _ai_in_flight.get(key)
+        if future is not None:
+            return future
+        future = _ai_executor.submit(_call_llm, players, empty_courts, rules_text)
+        _ai_in_flight[key] = future
+
+    def done(f):
+        with _ai_lock:
+            _ai_in_flight.pop(key, None)
+        if f.exception() is None:
+            _cache_put(key, f.result())
+        else:
+            print(f"Lỗi khi gọi API OpenAI: {f.exception()}")
+    future.add_done_callback(done)
+    return future
+
+
+@suggestions_api.route('/suggestions', methods=['POST'])
+def get_suggestions():
+    """
+    Gợi ý trận đấu. Luôn có kết quả từ thuật toán nội bộ; gợi ý AI được dùng
+    nếu có trong cache hoặc trả về trong SUGGESTIONS_AI_WAIT giây. Nếu LLM
+    chậm hơn, lần gọi vẫn chạy nền (tối đa SUGGESTIONS_AI_TIMEOUT giây) và
+    kết quả được cache cho lần bấm sau.
+    Trả về {'suggestions', 'source': 'ai' | 'local', 'ai_status', 'local_suggestions'}.
+    ai_status: cached | fresh | pending | failed | disabled.
+    """
+    data = request.get_json() or {}
+    player_ids = data.get('player_ids')
+    
+    if not player_ids or len(player_ids) < 4:
+        return jsonify({'suggestions': []}) # Không đủ người để xếp trận
+
+    rules, rules_text = parse_rules(data)
 
     try:
-        completion = client.chat.completions.create(
-            model="gpt-3.5-turbo", # Hoặc "gpt-4" để có kết quả tốt hơn
-            response_format={ "type": "json_object" },
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
-        )
-        
-        response_content = completion.choices[0].message.content
-        suggestions_data = json.loads(response_content)
-        
-        # Gán tên sân cho các gợi ý (vì LLM không biết tên sân cụ thể)
-        for i, suggestion in enumerate(suggestions_data.get("suggestions", [])):
-            if i < len(empty_courts):
-                suggestion["court_name"] = empty_courts[i]["name"]
+        conn = get_db_connection()
+        players, empty_courts = load_candidates(conn, player_ids)
+        if not empty_courts:
+            return jsonify({'suggestions': []}) # Không có sân trống
+        local = local_suggestions(players, empty_courts, rules, conn)
+    except sqlite3.Error as e:
+        return jsonify({'error': f'Lỗi database: {e}'}), 500
+
+    result = {'suggestions': local, 'source': 'local', 'local_suggestions': local}
+    if not client:
+        return jsonify(dict(result, ai_status='disabled'))
 
-        return jsonify(suggestions_data)
+    key = ai_cache_key(players, empty_courts, rules_text)
+    cached = _cache_get(key)
+    if cached is not None:
+        return jsonify(dict(result, suggestions=cached, source='ai', ai_status='cached'))
 
+    future = _start_llm(key, players, empty_courts, rules_text)
+    try:
+        suggestions = future.result(timeout=AI_WAIT)
     except Exception as e:
-        print(f"Lỗi khi gọi API OpenAI: {e}")
-        return jsonify({'error': f'Đã có lỗi xảy ra khi kết nối với dịch vụ AI: {str(e)}'}), 500
\ No newline at end of file
+        # Lỗi timeout của LLM cũng là TimeoutError (Python 3.11+): phân biệt với "chưa xong"
+        if not future.done():
+            return jsonify(dict(result, ai_status='pending'))
+        return jsonify(dict(result, ai_status='failed', ai_error=str(e)))
+    return jsonify(dict(result, suggestions=suggestions, source='ai', ai_status='fresh'))
+
+
+@suggestions_api.route('/suggestions/next', methods=['GET'])
+def get_next_match_suggestion():
+    """
+    Gợi ý MỘT trận cho một sân vừa trống (?court_id=), lấy từ pool ứng viên
+    được cập nhật dần của phiên (next_match.py): không chấm điểm lại toàn bộ.
+    """
+    court_id = request.args.get('court_id', type=int)
+    if court_id is None:
+        return jsonify({'error': "Cần tham số 'court_id'."}), 400
+
+    try:
+        conn = get_db_connection()
+        court = conn.execute("SELECT * FROM courts WHERE id = ?", (court_id,)).fetchone()
+        if court is None:
+            return jsonify({'error': 'Không tìm thấy sân.'}), 404
+        if conn.execute("SELECT 1 FROM matches WHERE court_id = ? AND status = 'ongoing'", (court_id,)).fetchone():
+            return jsonify({'error': 'Sân đang có trận đấu.'}), 409
+        group = next_match.next_group(conn)
+    except sqlite3.Error as e:
+        return jsonify({'error': f'Lỗi database: {e}'}), 500
+
+    suggestion = None
+    if group is not None:
+        suggestion = _format_local([{
+            'court_id': court['id'], 'court_name': court['name'],
+            'team_A': group['team_A'], 'team_B': group['team_B'], 'balance_score': group['score'],
+        }], 'incremental')[0]
+    return jsonify({'suggestion': suggestion, 'pool': next_match.stats()})
+
+
+# --- Job gợi ý chạy nền ---
+# POST /suggestions/jobs trả về job_id ngay lập tức; việc tính toán (thuật
+# toán nội bộ rồi LLM) chạy trên _job_executor và tiến độ (kèm kết quả tốt
+# nhất tới lúc đó) được đẩy qua socket.io (sự kiện 'suggestion_job', phòng
+# riêng 'suggestions:<job_id>' mà trang gọi tham gia sau khi nhận job_id).
+# Một job mới của cùng client_id hủy job cũ của client đó.
+
+class SuggestionJob:
+    """Một lần tính gợi ý chạy nền. Trạng thái: queued, running, done, cancelled, failed."""
+
+    def __init__(self, client_id, player_ids, data):
+        self.id = uuid.uuid4().hex
+        self.client_id = client_id
+        self.player_ids = player_ids
+        self.data = data
+        self.status = 'queued'
+        self.stage = None
+        self.suggestions = []   # Kết quả tốt nhất tới lúc này
+        self.result = None      # Kết quả cuối (cùng định dạng với POST /suggestions)
+        self.error = None
+        self.finished_at = None
+        self.future = None
+        self._cancel = threading.Event()
+        self._last_published = 0.0
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+        if self.future is not None and self.future.cancel():
+            self._finish('cancelled')  # Job chưa bắt đầu chạy
+
+    def to_dict(self):
+        return {
+            'job_id': self.id, 'status': self.status, 'stage': self.stage,
+            'suggestions': self.suggestions, 'result': self.result, 'error': self.error,
+        }
+
+    def publish(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_published < JOB_PROGRESS_INTERVAL:
+            return
+        self._last_published = now
+        rooms.emit_to(JOB_EVENT, self.to_dict(), (rooms.suggestion_job_room(self.id),))
+
+    def checkpoint(self, stage, suggestions=None, force=False):
+        """Hook tiến độ (cũng là hook của logic.plan_matches): dừng job nếu đã bị hủy."""
+        if self.cancelled:
+            raise logic.PlanCancelled()
+        self.stage = stage
+        if suggestions is not None:
+            self.suggestions = suggestions
+        self.publish(force)
+
+    def _finish(self, status, result=None, error=None):
+        if self.finished_at is not None:
+            return
+        self.status, self.result, self.error = status, result, error
+        if result is not None:
+            self.suggestions = result['suggestions']
+        self.finished_at = time.monotonic()
+        self.publish(force=True)
+
+    def run(self):
+        if self.cancelled:
+            return self._finish('cancelled')
+        self.status = 'running'
+        try:
+            rules, rules_text = parse_rules(self.data)
+            with pooled_connection() as conn:
+                self.checkpoint('loading')
+                players, empty_courts = load_candidates(conn, self.player_ids)
+                local = local_suggestions(players, empty_courts, rules, conn, self.checkpoint) if empty_courts else []
+
+            result = {'suggestions': local, 'source': 'local', 'local_suggestions': local}
+            if not local:
+                return self._finish('done', result)
+            if not client:
+                return self._finish('done', dict(result, ai_status='disabled'))
+
+            # Kết quả nội bộ được gửi ngay, sau đó chờ LLM (tối đa SUGGESTIONS_AI_TIMEOUT)
+            self.checkpoint('ai', local, force=True)
+            key = ai_cache_key(players, empty_courts, rules_text)
+            cached = _cache_get(key)
+            if cached is not None:
+                return self._finish('done', dict(result, suggestions=cached, source='ai', ai_status='cached'))
+            future = _start_llm(key, players, empty_courts, rules_text)
+            while True:
+                try:
+                    suggestions = future.result(timeout=JOB_PROGRESS_INTERVAL)
+                    break
+                except Exception as e:
+                    if future.done():
+                        return self._finish('done', dict(result, ai_status='failed', ai_error=str(e)))
+                    if self.cancelled:  # Lần gọi LLM vẫn chạy tiếp và được cache cho lần sau
+                        raise logic.PlanCancelled()
+            self._finish('done', dict(result, suggestions=suggestions, source='ai', ai_status='fresh'))
+        except logic.PlanCancelled:
+            self._finish('cancelled')
+        except Exception as e:
+            print(f"Lỗi khi tính gợi ý (job {self.id}): {e}")
+            self._finish('failed', error=str(e))
+
+
+def _prune_jobs():
+    now = time.monotonic()
+    for job_id, job in list(_jobs.items()):
+        if job.finished_at is not None and now - job.finished_at > JOB_KEEP_SECONDS:
+            del _jobs[job_id]
+            if _client_jobs.get(job.client_id) == job_id:
+                del _client_jobs[job.client_id]
+
+
+@suggestions_api.route('/suggestions/jobs', methods=['POST'])
+def create_suggestion_job():
+    """
+    Bắt đầu một job gợi ý chạy nền (body giống POST /suggestions, thêm
+    'client_id' để nhận diện trang đang gọi). Job trước đó của cùng client
+    bị hủy. Trả về 202 với job_id; tiến độ được gửi qua sự kiện socket.io
+    'suggestion_job' (phòng 'suggestions:<job_id>') và qua GET /suggestions/jobs/<job_id>.
+    """
+    data = request.get_json() or {}
+    player_ids = data.get('player_ids')
+    if not player_ids or len(player_ids) < 4:
+        return jsonify({'error': 'Cần chọn ít nhất 4 người chơi.'}), 400
+
+    client_id = str(data.get('client_id') or request.remote_addr)
+    job = SuggestionJob(client_id, player_ids, data)
+    with _jobs_lock:
+        _prune_jobs()
+        previous = _jobs.get(_client_jobs.get(client_id))
+        _jobs[job.id] = job
+        _client_jobs[client_id] = job.id
+    if previous is not None:
+        previous.cancel()
+
+    job.future = _job_executor.submit(job.run)
+    return jsonify(job.to_dict()), 202
+
+
+@suggestions_api.route('/suggestions/jobs/<job_id>', methods=['GET'])
+def get_suggestion_job(job_id):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Không tìm thấy job.'}), 404
+    return jsonify(job.to_dict())
+
+
+@suggestions_api.route('/suggestions/jobs/<job_id>', methods=['DELETE'])
+def cancel_suggestion_job(job_id):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Không tìm thấy job.'}), 404
+    job.cancel()
+    return jsonify(job.to_dict())
@@ -0,0 +1,35 @@
+# api/system.py
+from flask import Blueprint, jsonify
+import database
+import score_stream
+import device_commands
+import live_scores
+
+system_api = Blueprint('system_api', __name__)
+
+
+@system_api.route('/system/db-pool', methods=['GET'])
+def get_db_pool_stats():
+    """Trả về thống kê của pool kết nối SQLite (số kết nối đang dùng, rảnh, tạm...)."""
+    return jsonify(database.pool_stats())
+
+
+@system_api.route('/system/score-stream', methods=['GET'])
+def get_score_stream_stats():
+    """Trả về độ dài stream điểm số, số entry chưa được xác nhận (pending) và độ trễ của consumer group."""
+    try:
+        return jsonify(score_stream.stats())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 503
+
+
+@system_api.route('/system/score-order', methods=['GET'])
+def get_score_order_stats():
+    """Thống kê bảng high-water-mark: số điểm đã áp dụng, số điểm trùng lặp / cũ đã bị bỏ."""
+    return jsonify(live_scores.order_stats())
+
+
+@system_api.route('/system/device-commands', methods=['GET'])
+def get_device_command_stats():
+    """Thống kê lệnh gửi xuống bảng điểm: đã gửi, đã xác nhận, đang chờ, độ trễ khứ hồi."""
+    return jsonify(device_commands.stats())
@@ -0,0 +1,264 @@
+# Filename: async_gateway.py
+"""
+Asyncio Device Gateway (alternative mode of sock_server.py)
+
+Same device protocol as sock_server.py (JSON frames on /ws/device, the
+first frame carrying `device_id`) and same Redis contract (one entry per
+score on the score stream, see score_stream.score_entry), but every board
+is a coroutine instead of a thread, so one process on one core can serve
+thousands of boards.
+
+- Scores are queued and a single publisher task appends them to Redis in
+  pipelines of up to PUBLISH_BATCH_MAX entries (one round trip per batch).
+  Queue order is arrival order, so the per-device seq given by the publish
+  script follows the order of the board's frames.
+  When the queue is full, reading from the boards pauses (backpressure).
+- Liveness is checked with WebSocket ping/pong (PING_INTERVAL /
+  PING_TIMEOUT) instead of a receive timeout, so an idle board between two
+  points stays connected; application level {"type": "ping"} frames are
+  answered with {"type": "pong"}.
+- Frames that are not a JSON object or carry a score that is not a
+  non-negative integer are dropped and counted as invalid_frames.
+- Each connection keeps its own counters; a summary is printed every
+  STATS_INTERVAL seconds and GET /metrics returns them as JSON.
+- Web commands (device_commands.py) are pushed to the boards connected
+  here, and their {"type": "ack", "seq": n} frames are published back.
+
+Run with:
+    GATEWAY_MODE=async python sock_server.py
+    python async_gateway.py
+"""
+
+import asyncio
+import json
+import os
+import time
+from http import HTTPStatus
+
+import redis.asyncio as aioredis
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+
+import device_commands
+import score_stream
+from extensions import (REDIS_URL, REDIS_COMMAND_CHANNEL, REDIS_COMMAND_ACK_CHANNEL,
+                        PUBSUB_RECONNECT_MIN_DELAY, PUBSUB_RECONNECT_MAX_DELAY)
+
+DEVICE_PATH = '/ws/device'
+METRICS_PATH = '/metrics'
+
+PING_INTERVAL = 20
+PING_TIMEOUT = 20
+PUBLISH_QUEUE_SIZE = 20000
+PUBLISH_BATCH_MAX = 500
+STATS_INTERVAL = 30
+# Print one line per connection / disconnection (off for large deployments)
+VERBOSE = os.environ.get('GATEWAY_VERBOSE', '0') == '1'
+
+
+class DeviceGateway:
+    """Accepts board connections and forwards their scores to the Redis stream."""
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+        self.publish_script = redis_client.register_script(score_stream.PUBLISH_SCORE_LUA)
+        self.queue = asyncio.Queue(maxsize=PUBLISH_QUEUE_SIZE)
+        self.connections = {}  # id(websocket) -> per-connection metrics
+        self.sockets = {}      # device_id -> websocket (downlink registry)
+        self.started_at = time.time()
+        self.totals = {
+            'connections_total': 0, 'frames': 0, 'scores': 0, 'invalid_frames': 0,
+            'published': 0, 'publish_batches': 0, 'publish_errors': 0,
+            'commands_delivered': 0, 'command_acks': 0,
+        }
+
+    # --- Board connections ---
+
+    async def handle(self, websocket):
+        metrics = {
+            'device_id': None,
+            'remote': str(websocket.remote_address[0]) if websocket.remote_address else None,
+            'connected_at': time.time(),
+            'last_frame_at': None,
+            'frames': 0,
+            'scores': 0,
+            'invalid_frames': 0,
+        }
+        self.connections[id(websocket)] = metrics
+        self.totals['connections_total'] += 1
+        try:
+            async for data in websocket:
+                metrics['frames'] += 1
+                metrics['last_frame_at'] = time.time()
+                self.totals['frames'] += 1
+
+                try:
+                    msg = json.loads(data)
+                    if not isinstance(msg, dict):
+                        raise ValueError('not an object')
+                except ValueError:
+                    metrics['invalid_frames'] += 1
+                    self.totals['invalid_frames'] += 1
+                    continue
+
+                if msg.get('type') == 'ping':
+                    await websocket.send('{"type": "pong"}')
+                    continue
+
+                # Register the device_id on first message
+                if 'device_id' in msg and metrics['device_id'] is None:
+                    metrics['device_id'] = msg['device_id']
+                    self.sockets[metrics['device_id']] = websocket
+                    if VERBOSE:
+                        print(f"Registered device: {metrics['device_id']}")
+
+                if msg.get('type') == 'ack' and metrics['device_id'] and 'seq' in msg:
+                    self.totals['command_acks'] += 1
+                    try:
+                        await self.redis.publish(REDIS_COMMAND_ACK_CHANNEL,
+                                                 device_commands.ack_message(metrics['device_id'], msg['seq']))
+                    except Exception as e:
+                        print(f"[Gateway] FAILED to publish ack of {metrics['device_id']}: {e}")
+                    continue
+
+                if 'score_A' in msg and 'score_B' in msg and metrics['device_id']:
+                    try:
+                        # A bad value would make the whole publish pipeline fail
+                        score_a = score_stream.parse_score(msg['score_A'])
+                        score_b = score_stream.parse_score(msg['score_B'])
+                    except ValueError:
+                        metrics['invalid_frames'] += 1
+                        self.totals['invalid_frames'] += 1
+                        continue
+                    metrics['scores'] += 1
+                    self.totals['scores'] += 1
+                    # Waits when the queue is full: stops reading this board
+                    await self.queue.put(score_stream.score_entry(
+                        metrics['device_id'], score_a, score_b, source='async_gateway'
+                    ))
+        except ConnectionClosed:
+            pass
+        finally:
+            del self.connections[id(websocket)]
+            if metrics['device_id'] and self.sockets.get(metrics['device_id']) is websocket:
+                del self.sockets[metrics['device_id']]
+            if VERBOSE:
+                print(f"🔌 ESP device {metrics['device_id'] or ''} disconnected "
+                      f"({metrics['frames']} frames, {metrics['scores']} scores).")
+
+    # --- Redis ---
+
+    async def publisher(self):
+        """Drains the queue and appends the scores to the stream, one pipeline per batch."""
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < PUBLISH_BATCH_MAX and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            pipe = self.redis.pipeline(transaction=False)
+            for fields in batch:
+                keys, args = score_stream.publish_call(fields)
+                await self.publish_script(keys=keys, args=args, client=pipe)
+            try:
+                await pipe.execute()
+                self.totals['published'] += len(batch)
+                self.totals['publish_batches'] += 1
+            except Exception as e:
+                self.totals['publish_errors'] += len(batch)
+                print(f"[Gateway] FAILED to publish {len(batch)} scores to Redis: {e}")
+                await asyncio.sleep(1)
+
+    async def command_listener(self):
+        """
+        Pushes the web commands to the boards connected to this gateway.
+        Resubscribes after a lost Redis connection, with the backoff of
+        extensions.listen_channel.
+        """
+        delay = PUBSUB_RECONNECT_MIN_DELAY
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(REDIS_COMMAND_CHANNEL)
+                delay = PUBSUB_RECONNECT_MIN_DELAY
+                async for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        await self.push_command(message['data'])
+            except aioredis.RedisError as e:
+                print(f"[Gateway] Lost the command subscription ({e}), retrying in {delay:.1f}s")
+            finally:
+                await pubsub.aclose()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, PUBSUB_RECONNECT_MAX_DELAY)
+
+    async def push_command(self, data):
+        command = device_commands.parse_command(data)
+        websocket = self.sockets.get(command['device_id']) if command else None
+        if websocket is None:
+            return  # Board connected to another gateway (or offline)
+        try:
+            await websocket.send(device_commands.command_frame(command))
+            self.totals['commands_delivered'] += 1
+        except ConnectionClosed:
+            pass
+
+    # --- Metrics ---
+
+    def snapshot(self, include_connections=False):
+        result = dict(
+            self.totals,
+            connections=len(self.connections),
+            queue_depth=self.queue.qsize(),
+            uptime=round(time.time() - self.started_at, 1),
+        )
+        if include_connections:
+            result['per_connection'] = list(self.connections.values())
+        return result
+
+    async def reporter(self):
+        while True:
+            await asyncio.sleep(STATS_INTERVAL)
+            print(f"[Gateway] {json.dumps(self.snapshot())}")
+
+    def process_request(self, connection, request):
+        """Serves GET /metrics and rejects any path other than /ws/device."""
+        path = request.path.split('?')[0]
+        if path == METRICS_PATH:
+            detail = 'connections=1' in request.path
+            response = connection.respond(HTTPStatus.OK, json.dumps(self.snapshot(detail), default=str) + '\n')
+            response.headers['Content-Type'] = 'application/json'
+            return response
+        if path != DEVICE_PATH:
+            return connection.respond(HTTPStatus.NOT_FOUND, 'Not found\n')
+        return None
+
+
+async def run(host, port):
+    redis_client = aioredis.from_url(REDIS_URL, decode_responses=True)
+    gateway = DeviceGateway(redis_client)
+    background = [asyncio.create_task(gateway.publisher()), asyncio.create_task(gateway.reporter()),
+                  asyncio.create_task(gateway.command_listener())]
+    try:
+        async with serve(gateway.handle, host, port,
+                         process_request=gateway.process_request,
+                         ping_interval=PING_INTERVAL, ping_timeout=PING_TIMEOUT,
+                         max_size=2 ** 14) as server:
+            print(f"Listening on ws://{host}:{port}{DEVICE_PATH} (asyncio gateway)")
+            await server.serve_forever()
+    finally:
+        for task in background:
+            task.cancel()
+        await redis_client.aclose()
+
+
+def main():
+    port = int(os.environ.get('SOCK_PORT', 5001))
+    host = os.environ.get('SOCK_HOST', '0.0.0.0')
+    print("--- Starting Hardware Gateway (asyncio) ---")
+    try:
+        asyncio.run(run(host, port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,28 +1,170 @@
 # database.py
+import os
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
 from flask import g # g là một đối tượng đặc biệt của Flask
 
 DATABASE_URI = 'badminton.db'
 
+# Số kết nối được giữ lại trong pool (có thể đổi qua biến môi trường)
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+# Thời gian chờ (giây) một kết nối rảnh trước khi mở kết nối tạm ngoài pool
+POOL_WAIT_TIMEOUT = 2
+
+# Các PRAGMA áp dụng cho mọi kết nối:
+# - WAL: người đọc (dashboard) không bị chặn bởi người ghi (điểm số) và ngược lại
+# - synchronous=NORMAL: an toàn với WAL, ít fsync hơn FULL
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA mmap_size = 268435456',   # 256 MB
+    'PRAGMA cache_size = -16000',     # ~16 MB
+    'PRAGMA foreign_keys = ON',
+    'PRAGMA busy_timeout = 15000',
+)
+
+
+class ConnectionPool:
+    """
+    Pool kết nối SQLite dùng chung cho các request và các thread nền.
+    Kết nối được tạo khi cần (tối đa `size`), cấu hình sẵn PRAGMA và được
+    tái sử dụng. Khi pool cạn quá POOL_WAIT_TIMEOUT, một kết nối tạm được mở
+    và đóng lại khi trả về.
+    """
+
+    def __init__(self, database, size):
+        self.database = database
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._overflow = 0
+        self._acquired_total = 0
+        self._waits = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database, timeout=15, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self):
+        """Lấy một kết nối (ưu tiên kết nối rảnh, sau đó tạo mới trong giới hạn pool)."""
+        conn, pooled = None, True
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    conn = self._connect()
+                except sqlite3.Error:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                with self._lock:
+                    self._waits += 1
+                try:
+                    conn = self._idle.get(timeout=POOL_WAIT_TIMEOUT)
+                except queue.Empty:
+                    conn, pooled = self._connect(), False
+
+        with self._lock:
+            self._acquired_total += 1
+            if pooled:
+                self._in_use += 1
+            else:
+                self._overflow += 1
+        return conn, pooled
+
+    def release(self, conn, pooled=True):
+        """Trả kết nối về pool (rollback mọi transaction còn dở)."""
+        if not pooled:
+            with self._lock:
+                self._overflow -= 1
+            conn.close()
+            return
+        with self._lock:
+            self._in_use -= 1
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Kết nối hỏng: bỏ đi, lần sau sẽ tạo kết nối mới
+            with self._lock:
+                self._created -= 1
+            conn.close()
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn, pooled = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn, pooled)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'created': self._created,
+                'idle': self._idle.qsize(),
+                'in_use': self._in_use,
+                'overflow': self._overflow,
+                'acquired_total': self._acquired_total,
+                'waits': self._waits,
+            }
+
+
+pool = ConnectionPool(DATABASE_URI, POOL_SIZE)
+
+
+def pooled_connection():
+    """
+    Context manager cho code chạy ngoài request (thread nền, cache...):
+        with pooled_connection() as conn: ...
+    """
+    return pool.connection()
+
+
+def pool_stats():
+    return pool.stats()
+
+
 def get_db_connection():
     """
-    Mở một kết nối DB mới nếu chưa có cho request hiện tại.
+    Lấy một kết nối từ pool nếu chưa có cho request hiện tại.
     """
     if 'db' not in g:
-        g.db = sqlite3.connect(DATABASE_URI, timeout=15)
-        g.db.row_factory = sqlite3.Row
+        g.db, g.db_pooled = pool.acquire()
     return g.db
 
 def close_db(e=None):
     """
-    Đóng kết nối DB nếu nó đã được tạo.
+    Trả kết nối về pool khi request kết thúc.
     """
     db = g.pop('db', None)
+    pooled = g.pop('db_pooled', True)
     if db is not None:
-        db.close()
+        pool.release(db, pooled)
 
 def init_app(app):
     """
     Hàm này sẽ được gọi từ server.py để đăng ký lệnh và teardown.
     """
-    app.teardown_appcontext(close_db)
\ No newline at end of file
+    app.teardown_appcontext(close_db)
+
+    # Chạy các migration còn thiếu (xem migrations.py)
+    import migrations
+    with pooled_connection() as conn:
+        migrations.migrate(conn)
@@ -0,0 +1,133 @@
+# Filename: device_commands.py
+"""
+Downlink from the web UI to the physical scoreboards.
+
+1. The web server calls send() after a web control (inc/dec/reset) or a
+   match start. The command carries a per-device sequence number (Redis
+   INCR command_seq:<device_id>) and the resulting score, and is published
+   on REDIS_COMMAND_CHANNEL.
+2. The device gateway (sock_server.py or async_gateway.py) that holds the
+   board's websocket forwards command_frame(command) to it. The frame
+   carries score_A / score_B, so boards that only know how to display a
+   score already converge.
+3. The board answers {"type": "ack", "seq": n}. The gateway publishes the
+   ack on REDIS_COMMAND_ACK_CHANNEL and ack_listener() (web server) matches
+   it with the command in flight and records the round-trip latency.
+"""
+
+import json
+import threading
+import time
+
+try:
+    from extensions import redis_client, REDIS_COMMAND_CHANNEL, REDIS_COMMAND_ACK_CHANNEL, listen_channel
+except ImportError:
+    redis_client = None
+    REDIS_COMMAND_CHANNEL = "scoreboard_commands"
+    REDIS_COMMAND_ACK_CHANNEL = "scoreboard_command_acks"
+    listen_channel = None
+
+SEQ_KEY_PREFIX = "command_seq:"
+# Commands not acknowledged within this delay are counted as lost
+ACK_TIMEOUT = 5.0
+
+_lock = threading.Lock()
+_in_flight = {}        # (device_id, seq) -> time sent
+_last_acked_seq = {}   # device_id -> highest acknowledged seq
+_stats = {'sent': 0, 'acked': 0, 'expired': 0, 'last_latency_ms': None, 'avg_latency_ms': None}
+
+
+# --- Web server side ---
+
+def send(device_id, action, score_a, score_b):
+    """Publishes a command for one board. Returns its seq, or None if it could not be sent."""
+    if redis_client is None or device_id is None:
+        return None
+    try:
+        seq = redis_client.incr(f"{SEQ_KEY_PREFIX}{device_id}")
+        command = {'device_id': device_id, 'seq': seq, 'action': action, 'score_A': score_a, 'score_B': score_b}
+        with _lock:
+            _in_flight[(device_id, seq)] = time.time()
+            _stats['sent'] += 1
+        redis_client.publish(REDIS_COMMAND_CHANNEL, json.dumps(command))
+        return seq
+    except Exception as e:
+        print(f"[Device Commands] FAILED to send {action} to {device_id}: {e}")
+        return None
+
+
+def _expire_in_flight(now):
+    for key, sent_at in list(_in_flight.items()):
+        if now - sent_at > ACK_TIMEOUT:
+            del _in_flight[key]
+            _stats['expired'] += 1
+
+
+def record_ack(device_id, seq):
+    """Matches an ack with its command. Returns the round-trip latency in ms, or None."""
+    now = time.time()
+    with _lock:
+        _last_acked_seq[device_id] = max(seq, _last_acked_seq.get(device_id, 0))
+        sent_at = _in_flight.pop((device_id, seq), None)
+        _expire_in_flight(now)
+        if sent_at is None:
+            return None
+        latency = (now - sent_at) * 1000
+        _stats['acked'] += 1
+        _stats['last_latency_ms'] = round(latency, 1)
+        previous = _stats['avg_latency_ms']
+        _stats['avg_latency_ms'] = round(latency if previous is None else 0.9 * previous + 0.1 * latency, 1)
+        return latency
+
+
+def _on_ack(data):
+    try:
+        ack = json.loads(data)
+        record_ack(ack['device_id'], int(ack['seq']))
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+        print(f"[Device Commands] Ignoring invalid ack {data}: {e}")
+
+
+def ack_listener():
+    """
+    Records the acks published by the gateways.
+    Meant to run in a background thread of the web server. Resubscribes
+    after a lost Redis connection; the acks missed in between simply let
+    their commands expire (ACK_TIMEOUT).
+    """
+    if redis_client is None:
+        print("Command ack listener: Cannot start, Redis client is not connected.")
+        return
+    listen_channel(redis_client, REDIS_COMMAND_ACK_CHANNEL, _on_ack, 'Device Commands')
+
+
+def stats():
+    with _lock:
+        _expire_in_flight(time.time())
+        return dict(_stats, in_flight=len(_in_flight), last_acked_seq=dict(_last_acked_seq))
+
+
+# --- Gateway side (sock_server.py / async_gateway.py) ---
+
+def parse_command(raw):
+    """Returns the command dict of a message from REDIS_COMMAND_CHANNEL, or None."""
+    try:
+        command = json.loads(raw)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(command, dict) or not command.get('device_id'):
+        return None
+    return command
+
+
+def command_frame(command):
+    """JSON frame sent to the board."""
+    return json.dumps({
+        'type': 'command', 'seq': command['seq'], 'action': command['action'],
+        'score_A': command['score_A'], 'score_B': command['score_B'],
+    })
+
+
+def ack_message(device_id, seq):
+    """Message published on REDIS_COMMAND_ACK_CHANNEL for an ack frame of a board."""
+    return json.dumps({'device_id': device_id, 'seq': int(seq)})
@@ -0,0 +1,162 @@
+# Filename: device_routing.py
+"""
+Process-wide routing table for scoreboard devices:
+    device_id -> (court_id, is_swapped)
+
+Assignments only change through the scoreboard endpoints (assign,
+unassign, toggle-swap) and when a court is deleted, so forwarding a score
+from a device to the browsers never needs to query `scoreboards`.
+
+The table is loaded once from the DB (warm(), or lazily on first use).
+Every change is applied locally after the endpoint commits and published
+on Redis so the other processes apply the same change.
+"""
+
+import json
+import sqlite3
+import threading
+
+import database
+from settings_cache import PROCESS_ID
+
+try:
+    from extensions import redis_client, REDIS_ROUTING_CHANNEL, listen_channel
+except ImportError:
+    redis_client = None
+    REDIS_ROUTING_CHANNEL = "device_routing"
+    listen_channel = None
+
+_lock = threading.Lock()
+_routes = {}      # device_id -> (court_id or None, is_swapped)
+_loaded = False
+
+
+def warm():
+    """(Re)loads the whole table from the DB."""
+    global _loaded
+    try:
+        with database.pooled_connection() as conn:
+            rows = conn.execute('SELECT device_id, court_id, is_swapped FROM scoreboards').fetchall()
+    except sqlite3.Error as e:
+        print(f"[Device Routing] Database error while loading routes: {e}")
+        return
+    with _lock:
+        _routes.clear()
+        for row in rows:
+            _routes[row['device_id']] = (row['court_id'], bool(row['is_swapped']))
+        _loaded = True
+    print(f"[Device Routing] Loaded {len(rows)} scoreboard routes.")
+
+
+def lookup(device_id):
+    """Returns (court_id, is_swapped) of a device; court_id is None if unassigned."""
+    if not _loaded:
+        warm()
+    return _routes.get(device_id, (None, False))
+
+
+def court_of(device_id):
+    return lookup(device_id)[0]
+
+
+def device_ids():
+    """Every known scoreboard device, assigned or not."""
+    if not _loaded:
+        warm()
+    return list(_routes)
+
+
+def device_of(court_id):
+    """Returns the device assigned to a court, or None (also for an id that is not a number)."""
+    try:
+        court_id = int(court_id)
+    except (TypeError, ValueError):
+        return None
+    if not _loaded:
+        warm()
+    for device_id, (device_court, _) in list(_routes.items()):
+        if device_court == court_id:
+            return device_id
+    return None
+
+
+# --- Changes (same semantics as the SQL run by api/scoreboards.py) ---
+
+def _assign(device_id, court_id):
+    for other, (other_court, swapped) in list(_routes.items()):
+        if other_court == court_id:
+            _routes[other] = (None, swapped)
+    _routes[device_id] = (court_id, _routes.get(device_id, (None, False))[1])
+
+
+def _unassign_court(court_id):
+    for device_id, (device_court, swapped) in list(_routes.items()):
+        if device_court == court_id:
+            _routes[device_id] = (None, swapped)
+
+
+def _set_swapped(court_id, is_swapped):
+    for device_id, (device_court, _) in list(_routes.items()):
+        if device_court == court_id:
+            _routes[device_id] = (device_court, is_swapped)
+
+
+_OPERATIONS = {
+    'assign': lambda change: _assign(change['device_id'], change['court_id']),
+    'unassign_court': lambda change: _unassign_court(change['court_id']),
+    'set_swapped': lambda change: _set_swapped(change['court_id'], change['is_swapped']),
+}
+
+
+def _apply(change):
+    with _lock:
+        # Not loaded yet: the next lookup reads the (already committed) DB state
+        if _loaded:
+            _OPERATIONS[change['op']](change)
+
+
+def _publish(change):
+    _apply(change)
+    if redis_client is None:
+        return
+    try:
+        redis_client.publish(REDIS_ROUTING_CHANNEL, json.dumps(dict(change, origin=PROCESS_ID)))
+    except Exception as e:
+        print(f"[Device Routing] FAILED to publish change: {e}")
+
+
+def assign(device_id, court_id):
+    """Call after committing an assignment of device_id to court_id."""
+    _publish({'op': 'assign', 'device_id': device_id, 'court_id': int(court_id)})
+
+
+def unassign_court(court_id):
+    """Call after committing the removal of the board of court_id."""
+    _publish({'op': 'unassign_court', 'court_id': int(court_id)})
+
+
+def set_swapped(court_id, is_swapped):
+    """Call after committing a new is_swapped state for the board of court_id."""
+    _publish({'op': 'set_swapped', 'court_id': int(court_id), 'is_swapped': bool(is_swapped)})
+
+
+def _on_change(data):
+    try:
+        change = json.loads(data)
+        if change.get('origin') != PROCESS_ID:
+            _apply(change)
+    except (json.JSONDecodeError, KeyError, TypeError) as e:
+        print(f"[Device Routing] Ignoring invalid change {data}: {e}")
+
+
+def change_listener():
+    """
+    Applies the changes published by the other processes.
+    Meant to run in a background thread. After a lost Redis connection it
+    resubscribes and reloads the whole table: changes published in between
+    were missed.
+    """
+    if redis_client is None:
+        print("Routing listener: Cannot start, Redis client is not connected.")
+        return
+    listen_channel(redis_client, REDIS_ROUTING_CHANNEL, _on_change, 'Device Routing', on_reconnect=warm)
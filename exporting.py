@@ -0,0 +1,72 @@
+# Filename: exporting.py
+"""
+Streaming CSV / NDJSON exports.
+
+The rows come from a generator (usually iterating a SQLite cursor) and are
+written out in small chunks, so an export never holds the whole result in
+memory, neither on the server nor in the browser (the file is downloaded).
+"""
+
+import csv
+import io
+import json
+
+from flask import Response, stream_with_context
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+# Number of rows written per chunk sent to the client
+CHUNK_ROWS = 200
+
+
+def parse_format(args):
+    """Returns the requested export format ('csv' by default), or raises ValueError."""
+    export_format = (args.get('format') or 'csv').lower()
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Định dạng '{export_format}' không được hỗ trợ (csv, ndjson).")
+    return export_format
+
+
+def _iter_csv(rows, fieldnames):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames, extrasaction='ignore')
+    # BOM so that Excel opens the Vietnamese names correctly
+    buffer.write('\ufeff')
+    writer.writeheader()
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _iter_ndjson(rows):
+    chunk = []
+    for row in rows:
+        chunk.append(json.dumps(row, ensure_ascii=False, default=str))
+        if len(chunk) == CHUNK_ROWS:
+            yield '\n'.join(chunk) + '\n'
+            chunk = []
+    if chunk:
+        yield '\n'.join(chunk) + '\n'
+
+
+def export_response(rows, export_format, fieldnames, filename):
+    """
+    Builds a streamed download response.
+    `rows` is an iterable of dicts; for CSV only `fieldnames` are written.
+    """
+    if export_format == 'csv':
+        body = _iter_csv(rows, fieldnames)
+    else:
+        body = _iter_ndjson(rows)
+    return Response(
+        stream_with_context(body),
+        content_type=EXPORT_FORMATS[export_format],
+        headers={'Content-Disposition': f'attachment; filename="{filename}.{export_format}"'},
+    )
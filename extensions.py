@@ -9,6 +9,7 @@ to avoid circular imports and provide a single source of truth.
 from flask_socketio import SocketIO
 import redis
 import os
+import time
 
 # 1. Initialize SocketIO for the WEB server
 # We use 'threading' as async_mode for compatibility with Flask development server.
@@ -20,8 +21,9 @@ socketio = SocketIO(async_mode='threading', cors_allowed_origins="*")
 # This client connects to the Redis server.
 # It uses REDIS_URL from environment variables if available, 
 # otherwise defaults to localhost.
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:7777/0')
 try:
-    redis_url = os.environ.get('REDIS_URL', 'redis://localhost:7777/0')
+    redis_url = REDIS_URL
     # decode_responses=True ensures we get strings, not bytes, from Redis
     redis_client = redis.Redis.from_url(redis_url, decode_responses=True)
     # Test the connection
@@ -36,5 +38,62 @@ except redis.exceptions.ConnectionError as e:
     redis_client = None
 
 # 3. Define the Redis Channel name
-# This MUST match the channel used by sock_server.py
-REDIS_SCOREBOARD_CHANNEL = "scoreboard_updates"
\ No newline at end of file
+# (Legacy PubSub channel, device scores now go through the stream below)
+REDIS_SCOREBOARD_CHANNEL = "scoreboard_updates"
+
+# Redis Stream carrying device scores from sock_server.py to web_server.py
+# (see score_stream.py). It is trimmed to about SCOREBOARD_STREAM_MAXLEN entries.
+REDIS_SCOREBOARD_STREAM = "scoreboard_stream"
+REDIS_SCOREBOARD_GROUP = "web_server"
+SCOREBOARD_STREAM_MAXLEN = int(os.environ.get('SCOREBOARD_STREAM_MAXLEN', 10000))
+
+# Downlink: commands from the web UI to the boards, and their acks
+# (see device_commands.py)
+REDIS_COMMAND_CHANNEL = "scoreboard_commands"
+REDIS_COMMAND_ACK_CHANNEL = "scoreboard_command_acks"
+
+# 4. Channel used to invalidate the settings cache in every process
+# (see settings_cache.py)
+REDIS_SETTINGS_CHANNEL = "settings_invalidated"
+
+# 5. Channel used to propagate scoreboard assignment changes
+# (see device_routing.py)
+REDIS_ROUTING_CHANNEL = "device_routing"
+
+# 6. Pub/Sub listeners (settings, routing, commands, acks) survive a lost
+# Redis connection: they resubscribe with an exponential backoff.
+PUBSUB_RECONNECT_MIN_DELAY = 0.5
+PUBSUB_RECONNECT_MAX_DELAY = 30
+
+
+def listen_channel(client, channel, handle, name, on_reconnect=None):
+    """
+    Subscribes to `channel` and calls handle(data) for every message, forever.
+    Meant to run in a background thread. When the connection is lost, it
+    resubscribes after a growing delay, then calls on_reconnect(): messages
+    published in between were missed, so local caches should be dropped.
+    """
+    delay = PUBSUB_RECONNECT_MIN_DELAY
+    reconnecting = False
+    while True:
+        pubsub = client.pubsub()
+        try:
+            pubsub.subscribe(channel)
+            if reconnecting:
+                print(f"[{name}] Resubscribed to '{channel}'.")
+                if on_reconnect is not None:
+                    on_reconnect()
+            delay = PUBSUB_RECONNECT_MIN_DELAY
+            for message in pubsub.listen():
+                if message['type'] == 'message':
+                    handle(message['data'])
+        except redis.exceptions.RedisError as e:
+            print(f"[{name}] Lost the subscription to '{channel}' ({e}), retrying in {delay:.1f}s")
+        finally:
+            reconnecting = True
+            try:
+                pubsub.close()
+            except Exception:
+                pass
+        time.sleep(delay)
+        delay = min(delay * 2, PUBSUB_RECONNECT_MAX_DELAY)
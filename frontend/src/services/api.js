@@ -73,8 +73,8 @@ export default {
   getOngoingMatches() {
     return apiClient.get('/matches/ongoing/');
   },
-  getMatchHistory() {
-    return apiClient.get('/matches/history/');
+  getMatchHistory(params = {}) { // limit, cursor, player_id, court_id, session_id, date_from, date_to
+    return apiClient.get('/matches/history/', { params });
   },
 
   // === Settings API (dựa trên settings.py) ===
@@ -112,4 +112,13 @@ export default {
   controlScoreboard(controlData) { // court_id, action
     return apiClient.post('/scoreboards/control/', controlData);
   },
+
+  // === Dashboard API (dựa trên dashboard.py) ===
+  getDashboardSnapshot(etag = null, history = 10) { // 304 (không đổi) nếu etag còn khớp
+    return apiClient.get('/dashboard/snapshot', {
+      params: { history },
+      headers: etag ? { 'If-None-Match': etag } : {},
+      validateStatus: (status) => (status >= 200 && status < 300) || status === 304,
+    });
+  },
 };
\ No newline at end of file
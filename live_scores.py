@@ -0,0 +1,409 @@
+# Filename: live_scores.py
+"""
+Write-behind store for the live (in-match) scores.
+
+Every point is written to a Redis hash `live_score:<device_id>` with the
+fields score_A, score_B and updated_by, and the device is added to the
+`live_scores:dirty` set. Web controls (inc/dec/reset) are applied
+atomically in Redis (HINCRBY, clamped at 0 by a Lua script).
+
+The `scoreboards` table is only a checkpoint: checkpointer() flushes the
+dirty devices every CHECKPOINT_INTERVAL seconds, and finish_match flushes
+the board of its court inside its own transaction. After a crash, Redis
+still holds the latest scores; if Redis itself lost them, the hashes are
+re-seeded from the last checkpoint.
+
+Every score carries a per-device seq (the score_seq:<device_id> counter of
+score_stream.py, shared by the devices, the web controls and the system
+resets) and the id of its writer. A score is stored only if its seq is above
+the last one: the in-memory high-water-mark table drops stale and duplicate
+events (stream replays, retries, a delayed frame racing a web control) in
+O(1), and the Lua guard on the hash keeps the order across processes.
+The marks belong to one Redis epoch (a random token kept in EPOCH_KEY): if
+Redis lost its keys (restart without persistence, FLUSHALL) the token is
+gone, the seq counters restart at 1, and the marks are dropped.
+
+Without Redis every call falls back to writing the table directly.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import database
+import score_stream
+
+try:
+    from extensions import redis_client
+except ImportError:
+    redis_client = None
+
+KEY_PREFIX = "live_score:"
+DIRTY_KEY = "live_scores:dirty"
+FLUSHING_KEY = "live_scores:flushing"
+EPOCH_KEY = "live_scores:epoch"
+CHECKPOINT_INTERVAL = float(os.environ.get('SCORE_CHECKPOINT_INTERVAL', 2))
+
+# Web control actions: (field, delta); 'reset' sets both scores to 0
+ACTIONS = {
+    'inc_a': ('score_A', 1),
+    'dec_a': ('score_A', -1),
+    'inc_b': ('score_B', 1),
+    'dec_b': ('score_B', -1),
+    'reset': (None, 0),
+}
+
+# KEYS: hash, dirty set
+# ARGV: device_id, score_A, score_B, updated_by, seq
+_SET_SCORE_LUA = """
+if tonumber(ARGV[5]) <= tonumber(redis.call('HGET', KEYS[1], 'seq') or '0') then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'score_A', ARGV[2], 'score_B', ARGV[3], 'updated_by', ARGV[4], 'seq', ARGV[5])
+redis.call('SADD', KEYS[2], ARGV[1])
+return 1
+"""
+
+# KEYS: hash, dirty set, seq counter
+# ARGV: device_id, updated_by, seed_A, seed_B, field ('' = reset), delta
+_APPLY_ACTION_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('HSET', KEYS[1], 'score_A', ARGV[3], 'score_B', ARGV[4])
+end
+if ARGV[5] == '' then
+    redis.call('HSET', KEYS[1], 'score_A', 0, 'score_B', 0)
+elseif redis.call('HINCRBY', KEYS[1], ARGV[5], ARGV[6]) < 0 then
+    redis.call('HSET', KEYS[1], ARGV[5], 0)
+end
+local seq = redis.call('INCR', KEYS[3])
+redis.call('HSET', KEYS[1], 'updated_by', ARGV[2], 'seq', seq)
+redis.call('SADD', KEYS[2], ARGV[1])
+local scores = redis.call('HMGET', KEYS[1], 'score_A', 'score_B')
+return {scores[1], scores[2], seq}
+"""
+
+_set_score_script = redis_client.register_script(_SET_SCORE_LUA) if redis_client is not None else None
+_apply_action_script = redis_client.register_script(_APPLY_ACTION_LUA) if redis_client is not None else None
+
+_UPSERT_SQL = """
+    INSERT INTO scoreboards (device_id, score_A, score_B, last_seen, updated_by)
+    VALUES (?, ?, ?, datetime('now', 'localtime'), ?)
+    ON CONFLICT(device_id) DO UPDATE SET
+        score_A = excluded.score_A, score_B = excluded.score_B,
+        last_seen = excluded.last_seen, updated_by = excluded.updated_by
+"""
+
+
+_order_lock = threading.Lock()
+_high_water = {}  # device_id -> (seq, writer) of the last score stored by this process
+_local_seq = {}   # device_id -> last seq given out, when Redis is not connected
+_epoch = None     # EPOCH_KEY token the marks belong to
+_order_stats = {'applied': 0, 'duplicate': 0, 'stale': 0, 'resets': 0}
+
+
+def _key(device_id):
+    return f"{KEY_PREFIX}{device_id}"
+
+
+def _checkpointed_scores(device_id):
+    """Scores of the last checkpoint (used to seed a missing hash)."""
+    with database.pooled_connection() as conn:
+        row = conn.execute('SELECT score_A, score_B FROM scoreboards WHERE device_id = ?', (device_id,)).fetchone()
+    return (row['score_A'], row['score_B']) if row else (0, 0)
+
+
+# --- Ordering ---
+
+def _sync_epoch():
+    """Drops every high-water mark when the Redis epoch changed (its keys were lost)."""
+    global _epoch
+    if redis_client is None:
+        return
+    epoch = redis_client.get(EPOCH_KEY)
+    if epoch is None:
+        redis_client.set(EPOCH_KEY, uuid.uuid4().hex, nx=True)
+        epoch = redis_client.get(EPOCH_KEY)
+    with _order_lock:
+        if epoch != _epoch:
+            if _epoch is not None:
+                _order_stats['resets'] += len(_high_water)
+            _high_water.clear()
+            _epoch = epoch
+
+
+def _reset_marks_above(seqs):
+    # Caller holds _order_lock. INCR only grows: a new seq at or below the
+    # mark means the device's counter was deleted and restarted at 1.
+    for device_id, seq in seqs.items():
+        mark = _high_water.get(device_id)
+        if mark is not None and seq <= mark[0]:
+            del _high_water[device_id]
+            _order_stats['resets'] += 1
+
+
+def next_seqs(device_ids):
+    """Takes the next seq of each device: {device_id: seq} (one pipelined INCR per device)."""
+    device_ids = list(device_ids)
+    if not device_ids:
+        return {}
+    if redis_client is None:
+        with _order_lock:
+            for device_id in device_ids:
+                _local_seq[device_id] = _local_seq.get(device_id, 0) + 1
+            return {device_id: _local_seq[device_id] for device_id in device_ids}
+    pipe = redis_client.pipeline(transaction=False)
+    for device_id in device_ids:
+        pipe.incr(score_stream.seq_key(device_id))
+    seqs = dict(zip(device_ids, pipe.execute()))
+    with _order_lock:
+        _reset_marks_above(seqs)
+    return seqs
+
+
+def _is_fresh(device_id, seq):
+    # Caller holds _order_lock
+    mark = _high_water.get(device_id)
+    if mark is None or seq > mark[0]:
+        return True
+    _order_stats['duplicate' if seq == mark[0] else 'stale'] += 1
+    return False
+
+
+def _advance(device_id, seq, writer):
+    # Caller holds _order_lock
+    mark = _high_water.get(device_id)
+    if mark is None or seq > mark[0]:
+        _high_water[device_id] = (seq, writer)
+    _order_stats['applied'] += 1
+
+
+def seq_total(device_ids):
+    """
+    Sum of the current seq of the devices: it grows with every score
+    written, so it changes whenever one of their live scores may have.
+    """
+    device_ids = list(device_ids)
+    if redis_client is None:
+        with _order_lock:
+            return sum(_local_seq.get(device_id, 0) for device_id in device_ids)
+    if not device_ids:
+        return 0
+    return sum(int(seq or 0) for seq in redis_client.mget([score_stream.seq_key(d) for d in device_ids]))
+
+
+def order_stats():
+    """Counters of the high-water-mark table (scores applied, duplicates and stale ones dropped, marks reset)."""
+    with _order_lock:
+        return dict(_order_stats, devices=len(_high_water))
+
+
+# --- Writes ---
+
+def set_many(scores, updated_by='device', seqs=None):
+    """
+    Stores absolute scores: {device_id: (score_A, score_B)}. `seqs` holds
+    the seq of the events that already have one ({device_id: seq}, e.g.
+    from the score stream); the other scores get a new seq. Scores that are
+    not newer than the last one of their device are dropped.
+    Returns {device_id: seq} of the scores stored.
+    """
+    if not scores:
+        return {}
+    _sync_epoch()
+    seqs = {device_id: seq for device_id, seq in (seqs or {}).items() if seq is not None}
+    seqs.update(next_seqs(device_id for device_id in scores if device_id not in seqs))
+    with _order_lock:
+        fresh = [device_id for device_id in scores if _is_fresh(device_id, seqs[device_id])]
+    if not fresh:
+        return {}
+
+    if redis_client is None:
+        with database.pooled_connection() as conn:
+            try:
+                conn.executemany(_UPSERT_SQL, [(d, *scores[d], updated_by) for d in fresh])
+                conn.commit()
+            except sqlite3.Error:
+                conn.rollback()
+                raise
+        stored = fresh
+    else:
+        pipe = redis_client.pipeline(transaction=False)
+        for device_id in fresh:
+            score_a, score_b = scores[device_id]
+            _set_score_script(keys=[_key(device_id), DIRTY_KEY],
+                              args=[device_id, score_a, score_b, updated_by, seqs[device_id]], client=pipe)
+        stored = [device_id for device_id, applied in zip(fresh, pipe.execute()) if applied]
+
+    with _order_lock:
+        # Refused by the Lua guard: another process already stored a newer score
+        _order_stats['stale'] += len(fresh) - len(stored)
+        for device_id in stored:
+            _advance(device_id, seqs[device_id], updated_by)
+    return {device_id: seqs[device_id] for device_id in stored}
+
+
+def set_scores(device_id, score_a, score_b, updated_by='device', seq=None):
+    """Stores one absolute score. Returns its seq, or None if it was stale."""
+    return set_many({device_id: (score_a, score_b)}, updated_by, {device_id: seq}).get(device_id)
+
+
+def apply_action(device_id, action, updated_by='web'):
+    """Applies a web control action atomically and returns the new (score_A, score_B, seq)."""
+    field, delta = ACTIONS[action]
+    if redis_client is None:
+        score_a, score_b = _apply_action_sql(device_id, field, delta, updated_by)
+        seq = next_seqs([device_id])[device_id]
+    else:
+        _sync_epoch()
+        seed_a, seed_b = _checkpointed_scores(device_id) if not redis_client.exists(_key(device_id)) else (0, 0)
+        score_a, score_b, seq = _apply_action_script(
+            keys=[_key(device_id), DIRTY_KEY, score_stream.seq_key(device_id)],
+            args=[device_id, updated_by, seed_a, seed_b, field or '', delta],
+        )
+    with _order_lock:
+        if redis_client is not None:
+            _reset_marks_above({device_id: seq})
+        _advance(device_id, seq, updated_by)
+    return int(score_a), int(score_b), seq
+
+
+def _apply_action_sql(device_id, field, delta, updated_by):
+    if field is None:
+        assignment = "score_A = 0, score_B = 0"
+    else:
+        assignment = f"{field} = MAX(0, {field} + {int(delta)})"
+    with database.pooled_connection() as conn:
+        try:
+            conn.execute(f"UPDATE scoreboards SET {assignment}, updated_by = ? WHERE device_id = ?", (updated_by, device_id))
+            row = conn.execute('SELECT score_A, score_B FROM scoreboards WHERE device_id = ?', (device_id,)).fetchone()
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+    return (row['score_A'], row['score_B']) if row else (0, 0)
+
+
+# --- Reads ---
+
+def _stored_scores(device_id, score_a, score_b):
+    """(score_A, score_B) read from a live score hash, or None if missing or corrupt (logged, skipped)."""
+    if score_a is None or score_b is None:
+        return None
+    try:
+        return score_stream.parse_score(score_a), score_stream.parse_score(score_b)
+    except ValueError:
+        print(f"[Live Scores] Skipping the corrupt live score of {device_id}: {score_a!r}-{score_b!r}")
+        return None
+
+
+def _read_live(device_ids):
+    # {device_id: (score_A, score_B, seq)} of the devices with a valid live score
+    device_ids = list(device_ids)
+    if redis_client is None or not device_ids:
+        return {}
+    pipe = redis_client.pipeline(transaction=False)
+    for device_id in device_ids:
+        pipe.hmget(_key(device_id), 'score_A', 'score_B', 'seq')
+    live = {}
+    for device_id, (score_a, score_b, seq) in zip(device_ids, pipe.execute()):
+        scores = _stored_scores(device_id, score_a, score_b)
+        if scores is not None:
+            live[device_id] = (*scores, int(seq) if seq else None)
+    return live
+
+
+def get_many(device_ids):
+    """Returns {device_id: (score_A, score_B)} for the devices that have a live score in Redis."""
+    return {device_id: (score_a, score_b) for device_id, (score_a, score_b, _) in _read_live(device_ids).items()}
+
+
+def overlay(boards):
+    """
+    Replaces the checkpointed scores of `boards` (list of dicts from
+    `scoreboards`) with the live ones, and adds the seq of each live score
+    (None for the boards without one).
+    """
+    live = _read_live(board['device_id'] for board in boards)
+    for board in boards:
+        board['seq'] = None
+        if board['device_id'] in live:
+            board['score_A'], board['score_B'], board['seq'] = live[board['device_id']]
+    return boards
+
+
+def epoch():
+    """
+    Token of the current Redis epoch (None without Redis). Sent with the
+    scores: a client seeing it change drops its seq marks, like _sync_epoch().
+    """
+    _sync_epoch()
+    return _epoch
+
+
+# --- Checkpointing ---
+
+def _flush(device_ids, cursor):
+    device_ids = list(device_ids)
+    pipe = redis_client.pipeline(transaction=False)
+    for device_id in device_ids:
+        pipe.hmget(_key(device_id), 'score_A', 'score_B', 'updated_by')
+    rows = []
+    for device_id, (score_a, score_b, updated_by) in zip(device_ids, pipe.execute()):
+        scores = _stored_scores(device_id, score_a, score_b)
+        if scores is not None:
+            rows.append((device_id, *scores, updated_by or 'device'))
+    cursor.executemany(_UPSERT_SQL, rows)
+    return len(rows)
+
+
+def flush_device(device_id, cursor):
+    """
+    Writes the live score of one device through `cursor`, inside the
+    caller's transaction (used by finish_match).
+    """
+    if redis_client is None or device_id is None:
+        return 0
+    redis_client.srem(DIRTY_KEY, device_id)
+    return _flush([device_id], cursor)
+
+
+def checkpoint():
+    """Flushes every dirty device to SQLite in one transaction. Returns the number written."""
+    if redis_client is None:
+        return 0
+    # Swap the dirty set out atomically: points scored during the flush go to a new set
+    if not redis_client.exists(FLUSHING_KEY):
+        try:
+            redis_client.rename(DIRTY_KEY, FLUSHING_KEY)
+        except Exception:
+            return 0  # Nothing dirty (RENAME fails on a missing key)
+
+    device_ids = redis_client.smembers(FLUSHING_KEY)
+    with database.pooled_connection() as conn:
+        try:
+            written = _flush(device_ids, conn.cursor())
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise  # FLUSHING_KEY is kept and retried on the next run
+    redis_client.delete(FLUSHING_KEY)
+    return written
+
+
+def checkpointer():
+    """Runs checkpoint() every CHECKPOINT_INTERVAL seconds. Meant to run in a background thread."""
+    if redis_client is None:
+        print("Score checkpointer: Not needed, Redis client is not connected (scores go to SQLite).")
+        return
+    print(f"💾 Score checkpointer started (every {CHECKPOINT_INTERVAL}s)")
+    while True:
+        time.sleep(CHECKPOINT_INTERVAL)
+        try:
+            written = checkpoint()
+            if written:
+                print(f"[Checkpoint] Flushed {written} live scores to SQLite")
+        except Exception as e:
+            print(f"[Checkpoint] Error: {e}")
+
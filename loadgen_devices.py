@@ -0,0 +1,113 @@
+# Filename: loadgen_devices.py
+"""
+Load generator for the device gateway.
+
+Opens --boards simulated scoreboards on /ws/device (ramped up at --ramp
+connections per second), registers each one with its device_id, then makes
+every board send a score about every --interval seconds for --duration
+seconds. Prints progress every 5 seconds and a summary at the end, plus
+the gateway's own /metrics when it is the asyncio gateway.
+
+    GATEWAY_MODE=async python sock_server.py &
+    python loadgen_devices.py --boards 5000 --interval 2 --duration 60
+
+Needs a high enough file descriptor limit (ulimit -n) on both sides.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import urllib.request
+
+from websockets.asyncio.client import connect
+
+
+class Stats:
+    def __init__(self):
+        self.connected = 0
+        self.failed = 0
+        self.dropped = 0
+        self.sent = 0
+
+
+async def board(index, args, stats, stop_at):
+    device_id = f"LOAD-{index:05d}"
+    try:
+        websocket = await connect(args.url, open_timeout=30, ping_interval=None)
+    except Exception:
+        stats.failed += 1
+        return
+    stats.connected += 1
+    score = {'A': 0, 'B': 0}
+    try:
+        await websocket.send(json.dumps({'device_id': device_id}))
+        # Spread the first points so that the boards do not send in lockstep
+        await asyncio.sleep(random.uniform(0, args.interval))
+        while time.monotonic() < stop_at:
+            side = random.choice('AB')
+            score[side] = (score[side] + 1) % 31
+            await websocket.send(json.dumps({'device_id': device_id, 'score_A': score['A'], 'score_B': score['B']}))
+            stats.sent += 1
+            await asyncio.sleep(random.expovariate(1 / args.interval))
+    except Exception:
+        stats.dropped += 1
+    finally:
+        stats.connected -= 1
+        await websocket.close()
+
+
+async def report(stats, started):
+    previous = 0
+    while True:
+        await asyncio.sleep(5)
+        rate = (stats.sent - previous) / 5
+        previous = stats.sent
+        print(f"[{time.monotonic() - started:6.1f}s] connected={stats.connected} failed={stats.failed} "
+              f"dropped={stats.dropped} sent={stats.sent} ({rate:.0f} scores/s)")
+
+
+def gateway_metrics(url):
+    metrics_url = url.replace('ws://', 'http://').replace('wss://', 'https://').rsplit('/ws/', 1)[0] + '/metrics'
+    try:
+        with urllib.request.urlopen(metrics_url, timeout=5) as response:
+            return json.loads(response.read())
+    except Exception:
+        return None  # Not the asyncio gateway (or /metrics not reachable)
+
+
+async def main(args):
+    stats = Stats()
+    started = time.monotonic()
+    stop_at = started + args.boards / args.ramp + args.duration
+    reporter = asyncio.create_task(report(stats, started))
+
+    tasks = []
+    for index in range(args.boards):
+        tasks.append(asyncio.create_task(board(index, args, stats, stop_at)))
+        if (index + 1) % max(1, args.ramp // 10) == 0:
+            await asyncio.sleep(0.1)
+    peak = 0
+    while any(not task.done() for task in tasks):
+        peak = max(peak, stats.connected)
+        await asyncio.sleep(0.5)
+    reporter.cancel()
+
+    elapsed = time.monotonic() - started
+    print("--- Summary ---")
+    print(f"boards={args.boards} peak_connected={peak} failed={stats.failed} dropped={stats.dropped}")
+    print(f"scores sent={stats.sent} in {elapsed:.1f}s ({stats.sent / args.duration:.0f} scores/s during the test)")
+    metrics = gateway_metrics(args.url)
+    if metrics:
+        print(f"gateway: {json.dumps(metrics)}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='ws://localhost:5001/ws/device')
+    parser.add_argument('--boards', type=int, default=5000)
+    parser.add_argument('--interval', type=float, default=2.0, help='mean seconds between two points of a board')
+    parser.add_argument('--duration', type=float, default=60.0, help='seconds of scoring once all boards are connected')
+    parser.add_argument('--ramp', type=int, default=500, help='new connections per second')
+    asyncio.run(main(parser.parse_args()))
@@ -1,50 +1,20 @@
 # logic.py
 
 import itertools
+import math
+import threading
+import time
 from datetime import datetime
-import sqlite3
-from database import get_db_connection
+import settings_cache
 
-def load_settings():
-    """Tải tất cả cấu hình từ DB và trả về một dictionary."""
-    conn = None
-    try:
-        conn = sqlite3.connect('badminton.db')
-        conn.row_factory = sqlite3.Row
-        settings_rows = conn.execute('SELECT key, value FROM settings').fetchall()
-        settings = {row['key']: row['value'] for row in settings_rows}
-    except sqlite3.Error as e:
-        print(f"Lỗi database khi tải settings: {e}")
-        settings = {} # Trả về dict rỗng nếu lỗi
-    finally:
-        if conn:
-            conn.close()
-
-    # Giá trị mặc định phòng trường hợp DB lỗi hoặc thiếu key
-    defaults = {
-        'SCALING_FACTOR': 400, 'ELO_BASE': 10, 'FEMALE_ELO_BONUS': 50,
-        'REST_PRIORITY_WEIGHT': 0.01, 'LOW_GAMES_PENALTY_WEIGHT': 0.1,
-        'REMATCH_PENALTY_WEIGHT': 50, 'K_FACTOR_NEW': 48,
-        'K_FACTOR_MID': 32, 'K_FACTOR_STABLE': 24
-    }
-
-    # Ép kiểu các giá trị về đúng định dạng số, dùng giá trị mặc định nếu lỗi
-    numeric_keys = {
-        'SCALING_FACTOR': float, 'ELO_BASE': float, 'FEMALE_ELO_BONUS': float,
-        'REST_PRIORITY_WEIGHT': float, 'LOW_GAMES_PENALTY_WEIGHT': float,
-        'REMATCH_PENALTY_WEIGHT': float, 'K_FACTOR_NEW': int,
-        'K_FACTOR_MID': int, 'K_FACTOR_STABLE': int
-    }
-
-    processed_settings = {}
-    for key, cast_func in numeric_keys.items():
-        try:
-            processed_settings[key] = cast_func(settings.get(key, defaults[key]))
-        except (ValueError, TypeError):
-            processed_settings[key] = defaults[key]
-            print(f"Warning: Could not cast setting '{key}'. Reverting to default.")
+try:
+    import numpy as np
+except ImportError:  # Không có NumPy thì dùng đường chấm điểm thuần Python
+    np = None
 
-    return processed_settings
+def load_settings():
+    """Trả về dictionary cấu hình đã ép kiểu (đọc từ cache trong bộ nhớ, không mở DB)."""
+    return settings_cache.get_settings()
 
 def get_dynamic_k_factor(player, settings):
     """Lấy K-Factor dựa trên số trận đã chơi của người chơi."""
@@ -56,103 +26,537 @@ def get_dynamic_k_factor(player, settings):
     else:
         return settings.get('K_FACTOR_STABLE', 24)
 
+# Ba cách chia 4 người (theo vị trí trong nhóm) thành 2 đội: (a0, a1) vs (b0, b1)
+PAIRING_ORDERS = ((0, 1, 2, 3), (0, 2, 1, 3), (0, 3, 1, 2))
+
 def find_best_pairing_for_group(group_of_4, settings):
     """Với một nhóm 4 người, tìm ra cách chia đội cân bằng nhất."""
     p = group_of_4
-    possible_pairings = [
-        ((p[0], p[1]), (p[2], p[3])),
-        ((p[0], p[2]), (p[1], p[3])),
-        ((p[0], p[3]), (p[1], p[2]))
-    ]
+    elo = [_virtual_elo(player, settings) for player in p]
     best_pairing, min_elo_diff = None, float('inf')
 
-    for team_a, team_b in possible_pairings:
-        def get_virtual_elo(player):
-            base_elo = player['elo_rating']
-            if player.get('gender') == 'Nữ':
-                return base_elo + settings.get('FEMALE_ELO_BONUS', 50)
-            return base_elo
-
-        elo_team_a = (get_virtual_elo(team_a[0]) + get_virtual_elo(team_a[1])) / 2
-        elo_team_b = (get_virtual_elo(team_b[0]) + get_virtual_elo(team_b[1])) / 2
+    for a0, a1, b0, b1 in PAIRING_ORDERS:
+        elo_team_a = (elo[a0] + elo[a1]) / 2
+        elo_team_b = (elo[b0] + elo[b1]) / 2
         elo_diff = abs(elo_team_a - elo_team_b)
 
         if elo_diff < min_elo_diff:
             min_elo_diff = elo_diff
-            best_pairing = (list(team_a), list(team_b))
+            best_pairing = ([p[a0], p[a1]], [p[b0], p[b1]])
             
     return best_pairing, min_elo_diff
 
-def suggest_matches(active_players, empty_courts, rules, conn):
-    """Thuật toán chính để gợi ý các trận đấu."""
-    settings = load_settings()
-    if len(active_players) < 4: return []
-    num_matches_to_suggest = min(len(empty_courts), len(active_players) // 4)
-    if num_matches_to_suggest == 0: return []
-    
-    possible_groups = list(itertools.combinations(active_players, 4))
-    scored_groups = []
-    now = datetime.now()
+# --- Cache lịch sử cặp đôi (pair_history) ---
+# Dùng chung cho cả process: {(min_id, max_id): times_played}.
+# Nạp một lần từ DB. Dict được trả ra là một ảnh chụp KHÔNG BAO GIỜ bị sửa:
+# sau khi finish_match commit, apply_pair_history_increments thay nó bằng
+# một bản sao đã cộng thêm (copy-on-write), nên người đọc không cần khóa.
+_pair_history_cache = None
+_pair_history_lock = threading.Lock()
 
-    for group in possible_groups:
-        pairing, elo_diff = find_best_pairing_for_group(group, settings)
-        score = elo_diff
-        
-        if rules.get('prioritize_rest'):
-            total_rest_time = 0
-            for p in group:
-                if p['session_last_played']: # <-- THAY ĐỔI Ở ĐÂY
-                    last_played = datetime.fromisoformat(p['session_last_played']) # <-- THAY ĐỔI Ở ĐÂY
-                    total_rest_time += (now - last_played).total_seconds()
-                else:
-                    total_rest_time += 999999
-            if total_rest_time > 0:
-                score -= (total_rest_time / 4) * settings.get('REST_PRIORITY_WEIGHT', 0.01)
+def get_pair_history_map(conn):
+    """Trả về ảnh chụp (chỉ đọc) của map lịch sử cặp đôi, chỉ đọc DB ở lần gọi đầu tiên."""
+    global _pair_history_cache
+    with _pair_history_lock:
+        if _pair_history_cache is None:
+            rows = conn.execute('SELECT player1_id, player2_id, times_played FROM pair_history').fetchall()
+            _pair_history_cache = {(row[0], row[1]): row[2] for row in rows}
+        return _pair_history_cache
+
+def invalidate_pair_history_cache():
+    """Xóa cache, lần đọc sau sẽ nạp lại từ DB."""
+    global _pair_history_cache
+    with _pair_history_lock:
+        _pair_history_cache = None
+
+def apply_pair_history_increments(keys):
+    """
+    Cộng các cặp `keys` (trả về bởi update_pair_history) vào cache, SAU khi
+    transaction đã commit. Tạo ảnh chụp mới thay vì sửa ảnh chụp đang được đọc.
+    """
+    global _pair_history_cache
+    with _pair_history_lock:
+        if _pair_history_cache is None:
+            return
+        updated = dict(_pair_history_cache)
+        for key in keys:
+            updated[key] = updated.get(key, 0) + 1
+        _pair_history_cache = updated
+
+def _pair_times(pair_history, p1_id, p2_id):
+    key = (p1_id, p2_id) if p1_id < p2_id else (p2_id, p1_id)
+    return pair_history.get(key, 0)
+
+# Quy tắc mặc định của việc xếp trận: dùng khi request không gửi quy tắc (api/suggestions.parse_rules)
+# và luôn dùng cho trận kế tiếp của một sân vừa trống (next_match), để hai đường xếp cùng một thứ tự
+DEFAULT_RULES = {'prioritize_rest': True, 'prioritize_low_games': False, 'avoid_rematch': False}
+
+# --- Cấu hình engine gợi ý ---
+# 'exhaustive': duyệt toàn bộ C(n,4) nhóm (chính xác, chỉ dùng được khi ít người).
+# 'fast': chọn nhóm quanh từng người "ưu tiên" theo lân cận ELO, ~O(n log n + sân * K^3).
+# 'auto': tự chọn 'exhaustive' khi số nhóm đủ nhỏ, ngược lại dùng 'fast'.
+EXHAUSTIVE_MAX_GROUPS = 5000
+FAST_ENGINE_NEIGHBORS = 8       # Số người gần ELO nhất được xét cùng mỗi người "neo"
+FAST_ENGINE_POOL_SLACK = 8      # Số người dự bị thêm vào pool ngoài 4 * số sân
+FAST_ENGINE_TIME_BUDGET = 0.04  # Giây dành cho bước tối ưu cục bộ (đổi người giữa các sân)
+ASSIGNMENT_MAX_CANDIDATES = 2000  # Số nhóm tốt nhất đưa vào bước xếp sân tối ưu
+ASSIGNMENT_TIME_BUDGET = 0.025    # Giây tối đa cho bước xếp sân (branch and bound)
+PROGRESS_EVERY_GROUPS = 1000      # Engine thuần Python: gọi progress sau mỗi ngần này nhóm
+
+class PlanCancelled(Exception):
+    """Hàm progress ném ra để dừng plan_matches giữa chừng (vd. job gợi ý đã bị thay thế)."""
+
+def _virtual_elo(player, settings):
+    base_elo = player['elo_rating']
+    if player.get('gender') == 'Nữ':
+        return base_elo + settings.get('FEMALE_ELO_BONUS', 50)
+    return base_elo
+
+def _rest_seconds(player, now):
+    if player['session_last_played']:
+        last_played = datetime.fromisoformat(player['session_last_played'])
+        return (now - last_played).total_seconds()
+    return 999999
+
+def score_group(group, settings, rules, now, pair_history):
+    """Tính điểm (càng thấp càng tốt) và cách chia đội tốt nhất cho một nhóm 4 người."""
+    pairing, elo_diff = find_best_pairing_for_group(group, settings)
+    score = elo_diff
+
+    if rules.get('prioritize_rest'):
+        total_rest_time = 0
+        for p in group:
+            total_rest_time += _rest_seconds(p, now)
+        if total_rest_time > 0:
+            score -= (total_rest_time / 4) * settings.get('REST_PRIORITY_WEIGHT', 0.01)
+
+    if rules.get('prioritize_low_games'):
+        score += sum(p['session_matches_played'] for p in group) * settings.get('LOW_GAMES_PENALTY_WEIGHT', 0.1)
+
+    if rules.get('avoid_rematch'):
+        team_a, team_b = pairing
+        rematch_penalty = _pair_times(pair_history, team_a[0]['id'], team_a[1]['id']) + \
+                          _pair_times(pair_history, team_b[0]['id'], team_b[1]['id'])
+        score += rematch_penalty * settings.get('REMATCH_PENALTY_WEIGHT', 50)
+
+    return score, pairing
+
+# --- Chấm điểm theo lô (NumPy) ---
+# Dữ liệu người chơi được chuyển thành mảng một lần cho mỗi request, sau đó
+# mỗi lô nhóm được chấm điểm bằng vài phép toán vector. Kết quả giống hệt
+# score_group (cùng thứ tự phép tính, cùng cách chọn cặp khi bằng điểm).
+
+def _build_player_arrays(active_players, settings, rules, now, pair_history):
+    """Chuyển danh sách người chơi thành các mảng NumPy (ELO ảo, thời gian nghỉ, số trận)."""
+    n = len(active_players)
+    arrays = {
+        'elo': np.array([_virtual_elo(p, settings) for p in active_players], dtype=np.float64),
+        'rest': np.array([_rest_seconds(p, now) for p in active_players], dtype=np.float64),
+        'matches': np.array([p['session_matches_played'] for p in active_players], dtype=np.int64),
+        'pair': None,
+    }
+    if rules.get('avoid_rematch'):
+        index_of = {p['id']: i for i, p in enumerate(active_players)}
+        pair = np.zeros((n, n), dtype=np.int64)
+        for (p1_id, p2_id), times in pair_history.items():
+            i, j = index_of.get(p1_id), index_of.get(p2_id)
+            if i is not None and j is not None:
+                pair[i, j] = pair[j, i] = times
+        arrays['pair'] = pair
+    return arrays
+
+def _score_groups_batch(arrays, groups, settings, rules):
+    """
+    Chấm điểm nhiều nhóm cùng lúc.
+    groups: mảng (G, 4) chỉ số người chơi. Trả về (điểm, chỉ số cách chia đội trong PAIRING_ORDERS).
+    """
+    rows = np.arange(len(groups))
+    elo = arrays['elo'][groups]
+    diffs = np.empty((len(groups), len(PAIRING_ORDERS)), dtype=np.float64)
+    for k, (a0, a1, b0, b1) in enumerate(PAIRING_ORDERS):
+        diffs[:, k] = np.abs((elo[:, a0] + elo[:, a1]) / 2 - (elo[:, b0] + elo[:, b1]) / 2)
+    best = diffs.argmin(axis=1)  # argmin lấy cách chia đầu tiên khi bằng nhau, như vòng lặp thuần Python
+    scores = diffs[rows, best]
+
+    if rules.get('prioritize_rest'):
+        rest = arrays['rest'][groups]
+        total_rest_time = rest[:, 0] + rest[:, 1] + rest[:, 2] + rest[:, 3]
+        scores = np.where(total_rest_time > 0,
+                          scores - (total_rest_time / 4) * settings.get('REST_PRIORITY_WEIGHT', 0.01),
+                          scores)
+
+    if rules.get('prioritize_low_games'):
+        matches = arrays['matches'][groups]
+        scores = scores + (matches[:, 0] + matches[:, 1] + matches[:, 2] + matches[:, 3]) * settings.get('LOW_GAMES_PENALTY_WEIGHT', 0.1)
+
+    if rules.get('avoid_rematch'):
+        ordered = np.take_along_axis(groups, np.asarray(PAIRING_ORDERS)[best], axis=1)
+        pair = arrays['pair']
+        rematch_penalty = pair[ordered[:, 0], ordered[:, 1]] + pair[ordered[:, 2], ordered[:, 3]]
+        scores = scores + rematch_penalty * settings.get('REMATCH_PENALTY_WEIGHT', 50)
+
+    return scores, best
+
+def _pairing_from(active_players, members, order_index):
+    a0, a1, b0, b1 = PAIRING_ORDERS[order_index]
+    return ([active_players[members[a0]], active_players[members[a1]]],
+            [active_players[members[b0]], active_players[members[b1]]])
+
+def _make_scorer(active_players, settings, rules, now, pair_history):
+    """
+    Trả về hàm score(members_list) -> [(score, pairing), ...] cho một danh sách
+    nhóm (mỗi nhóm là 4 chỉ số trong active_players). Dùng NumPy nếu có,
+    ngược lại quay về score_group.
+    """
+    if np is None:
+        def score(members_list):
+            return [score_group([active_players[i] for i in members], settings, rules, now, pair_history)
+                    for members in members_list]
+        return score
+
+    arrays = _build_player_arrays(active_players, settings, rules, now, pair_history)
 
+    def score(members_list):
+        if not members_list:
+            return []
+        groups = np.asarray(members_list, dtype=np.intp).reshape(-1, 4)
+        scores, best = _score_groups_batch(arrays, groups, settings, rules)
+        return [(group_score, _pairing_from(active_players, members, order_index))
+                for group_score, members, order_index in zip(scores.tolist(), members_list, best.tolist())]
+    return score
+
+def _groups_exhaustive(active_players, settings, rules, now, pair_history, progress=None):
+    """Chấm điểm toàn bộ C(n,4) nhóm, trả về các nhóm theo thứ tự điểm tăng dần."""
+    if np is None:
+        scored_groups = []
+        for count, members in enumerate(itertools.combinations(range(len(active_players)), 4)):
+            if progress is not None and count % PROGRESS_EVERY_GROUPS == 0:
+                progress('scoring')
+            score, pairing = score_group([active_players[i] for i in members], settings, rules, now, pair_history)
+            scored_groups.append({'score': score, 'pairing': pairing, 'members': list(members)})
+        scored_groups.sort(key=lambda x: x['score'])
+        return scored_groups
+    if progress is not None:
+        progress('scoring')
+    return _groups_exhaustive_vectorized(active_players, settings, rules, now, pair_history)
+
+def _groups_exhaustive_vectorized(active_players, settings, rules, now, pair_history):
+    """Như _groups_exhaustive nhưng chấm điểm mọi nhóm trong một lô và chỉ tạo dict khi cần."""
+    n = len(active_players)
+    num_groups = math.comb(n, 4)
+    groups = np.fromiter(itertools.chain.from_iterable(itertools.combinations(range(n), 4)),
+                         dtype=np.intp, count=num_groups * 4).reshape(num_groups, 4)
+    arrays = _build_player_arrays(active_players, settings, rules, now, pair_history)
+    scores, best = _score_groups_batch(arrays, groups, settings, rules)
+    for g in np.argsort(scores, kind='stable'):
+        members = groups[g].tolist()
+        yield {'score': float(scores[g]), 'pairing': _pairing_from(active_players, members, int(best[g])), 'members': members}
+
+def _nearest_by_elo(order, pos, used, k):
+    """Lấy k chỉ số chưa dùng gần vị trí pos nhất trong danh sách đã sắp theo ELO."""
+    result = []
+    left, right = pos - 1, pos + 1
+    while len(result) < k and (left >= 0 or right < len(order)):
+        if right < len(order) and (left < 0 or right - pos <= pos - left):
+            if order[right] not in used:
+                result.append(order[right])
+            right += 1
+        else:
+            if order[left] not in used:
+                result.append(order[left])
+            left -= 1
+    return result
+
+def _groups_fast(active_players, num_matches, settings, rules, now, pair_history, progress=None):
+    """
+    Engine gợi ý nhanh cho danh sách người chơi lớn.
+    1. Lọc pool gồm 4 * số sân (+ dự bị) người có priority tốt nhất.
+    2. Lần lượt lấy người ưu tiên nhất làm "neo", chỉ chấm điểm các nhóm tạo
+       từ K người gần ELO nhất với người đó.
+    3. Đổi người giữa các nhóm đã chọn nếu tổng điểm giảm (giới hạn thời gian).
+    Trả về (các nhóm đã chọn, mọi nhóm ứng viên đã chấm điểm).
+    """
+    priorities = [_player_priority(p, settings, rules, now) for p in active_players]
+    by_priority = sorted(range(len(active_players)), key=lambda i: priorities[i])
+    pool = by_priority[:num_matches * 4 + FAST_ENGINE_POOL_SLACK]
+    score = _make_scorer(active_players, settings, rules, now, pair_history)
+
+    elos = {i: _virtual_elo(active_players[i], settings) for i in pool}
+    elo_order = sorted(pool, key=lambda i: elos[i])
+    elo_position = {idx: pos for pos, idx in enumerate(elo_order)}
+
+    used = set()
+    chosen = []
+    alternatives = []  # Mọi nhóm đã chấm điểm, dùng làm ứng viên cho bước xếp sân
+    for anchor in pool:
+        if len(chosen) >= num_matches:
+            break
+        if anchor in used:
+            continue
+        if progress is not None:
+            progress('scoring')
+        used.add(anchor)
+        neighbors = _nearest_by_elo(elo_order, elo_position[anchor], used, FAST_ENGINE_NEIGHBORS)
+        if len(neighbors) < 3:
+            used.discard(anchor)
+            break
+
+        candidates = [(anchor,) + trio for trio in itertools.combinations(neighbors, 3)]
+        best = None
+        for members, (group_score, pairing) in zip(candidates, score(candidates)):
+            alternatives.append({'score': group_score, 'pairing': pairing, 'members': list(members)})
+            if best is None or group_score < best[0]:
+                best = (group_score, pairing, members)
+        used.update(best[2])
+        chosen.append({'score': best[0], 'pairing': best[1], 'members': list(best[2])})
+
+    _improve_by_swaps(chosen, score, progress)
+    chosen.sort(key=lambda x: x['score'])
+    alternatives.sort(key=lambda x: x['score'])
+    return chosen, alternatives
+
+# 16 cách đổi 1 người của nhóm i lấy 1 người của nhóm j
+_SWAPS = tuple(itertools.product(range(4), range(4)))
+
+def _improve_by_swaps(chosen, score, progress=None):
+    """Tối ưu cục bộ: đổi chỗ 2 người giữa 2 nhóm nếu tổng điểm giảm."""
+    deadline = time.perf_counter() + FAST_ENGINE_TIME_BUDGET
+    improved = True
+    while improved:
+        improved = False
+        for gi, gj in itertools.combinations(chosen, 2):
+            start = 0
+            while start < len(_SWAPS):
+                if time.perf_counter() > deadline:
+                    return
+                if progress is not None:
+                    progress('improving')
+                # Chấm điểm mọi phép đổi còn lại của cặp nhóm này trong một lô,
+                # rồi áp dụng phép đổi cải thiện đầu tiên (theo thứ tự a, b)
+                candidates = []
+                for a, b in _SWAPS[start:]:
+                    members_i, members_j = list(gi['members']), list(gj['members'])
+                    members_i[a], members_j[b] = members_j[b], members_i[a]
+                    candidates.extend((members_i, members_j))
+                results = score(candidates)
+
+                applied = None
+                for t in range(len(candidates) // 2):
+                    (score_i, pairing_i), (score_j, pairing_j) = results[2 * t], results[2 * t + 1]
+                    if score_i + score_j < gi['score'] + gj['score'] - 1e-9:
+                        gi.update(score=score_i, pairing=pairing_i, members=candidates[2 * t])
+                        gj.update(score=score_j, pairing=pairing_j, members=candidates[2 * t + 1])
+                        applied = t
+                        break
+                if applied is None:
+                    break
+                improved = True
+                start += applied + 1
+
+def _select_engine(rules, num_players):
+    """
+    'fast' nếu được yêu cầu, nếu không thì vét cạn khi số nhóm không vượt
+    EXHAUSTIVE_MAX_GROUPS. Giới hạn áp dụng cả khi yêu cầu 'exhaustive'
+    (engine đến từ body của request: không được dựng C(n, 4) nhóm tùy ý).
+    """
+    if rules.get('engine') == 'fast':
+        return 'fast'
+    return 'exhaustive' if math.comb(num_players, 4) <= EXHAUSTIVE_MAX_GROUPS else 'fast'
+
+# --- Xếp nhóm vào các sân trống ---
+
+def _group_mask(group):
+    mask = 0
+    for i in group['members']:
+        mask |= 1 << i
+    return mask
+
+def _greedy_assignment(scored_groups, num_matches):
+    """Duyệt danh sách đã sắp xếp một lần, lấy nhóm đầu tiên không trùng người với các nhóm đã chọn."""
+    picked, used = [], 0
+    for group in scored_groups:
+        mask = _group_mask(group)
+        if mask & used:
+            continue
+        picked.append(group)
+        used |= mask
+        if len(picked) >= num_matches:
+            break
+    return picked
+
+def _player_priority(player, settings, rules, now):
+    """
+    Phần điểm chỉ phụ thuộc vào từng người chơi (nghỉ lâu, ít trận).
+    Điểm của một nhóm = chênh lệch ELO + tổng các phần này + phạt gặp lại,
+    nên người có priority thấp luôn "kéo" điểm nhóm xuống.
+    """
+    priority = 0
+    if rules.get('prioritize_rest'):
+        priority -= _rest_seconds(player, now) / 4 * settings.get('REST_PRIORITY_WEIGHT', 0.01)
+    if rules.get('prioritize_low_games'):
+        priority += player['session_matches_played'] * settings.get('LOW_GAMES_PENALTY_WEIGHT', 0.1)
+    return priority
+
+def _player_floors(active_players, settings, rules, now):
+    """
+    Cận dưới phần điểm mà mỗi người chơi đóng góp vào điểm nhóm: điểm nhóm
+    luôn >= tổng các giá trị này (chênh lệch ELO và phạt gặp lại không âm).
+    Trả về None nếu có trọng số âm (khi đó cận này không còn đúng).
+    """
+    weights = ('REST_PRIORITY_WEIGHT', 'LOW_GAMES_PENALTY_WEIGHT', 'REMATCH_PENALTY_WEIGHT')
+    if any(settings.get(key, 0) < 0 for key in weights):
+        return None
+    floors = []
+    for p in active_players:
+        floor = 0
+        if rules.get('prioritize_rest'):
+            floor += min(0, -_rest_seconds(p, now) / 4 * settings.get('REST_PRIORITY_WEIGHT', 0.01))
         if rules.get('prioritize_low_games'):
-            score += sum(p['session_matches_played'] for p in group) * settings.get('LOW_GAMES_PENALTY_WEIGHT', 0.1) # <-- THAY ĐỔI Ở ĐÂY
-        
-        if rules.get('avoid_rematch'):
-            team_a, team_b = pairing
-            def get_pair_history(p1_id, p2_id, db_cursor):
-                player_ids = sorted([p1_id, p2_id])
-                res = db_cursor.execute('SELECT times_played FROM pair_history WHERE player1_id = ? AND player2_id = ?', (player_ids[0], player_ids[1])).fetchone()
-                return res['times_played'] if res else 0
-            cursor = conn.cursor()
-            rematch_penalty = get_pair_history(team_a[0]['id'], team_a[1]['id'], cursor) + \
-                              get_pair_history(team_b[0]['id'], team_b[1]['id'], cursor)
-            score += rematch_penalty * settings.get('REMATCH_PENALTY_WEIGHT', 50)
-
-        scored_groups.append({'score': score, 'pairing': pairing})
-
-    scored_groups.sort(key=lambda x: x['score'])
+            floor += p['session_matches_played'] * settings.get('LOW_GAMES_PENALTY_WEIGHT', 0.1)
+        floors.append(floor)
+    return floors
+
+def _optimal_assignment(candidates, num_matches, incumbent, floors, progress=None):
+    """
+    Branch and bound: chọn num_matches nhóm rời nhau có tổng điểm nhỏ nhất
+    trong danh sách ứng viên (đã sắp xếp tăng dần theo điểm).
+    Cận dưới cho `need` nhóm còn thiếu = max(tổng `need` điểm nhỏ nhất còn lại,
+    tổng 4 * need cận dưới nhỏ nhất của những người chưa được xếp).
+    Trả về (các nhóm được chọn, True nếu đã duyệt hết trong thời gian cho phép).
+    progress('assigning', groups) được gọi mỗi khi tìm được lời giải tốt hơn
+    và progress('assigning') định kỳ trong lúc duyệt.
+    """
+    scores = [group['score'] for group in candidates]
+    masks = [_group_mask(group) for group in candidates]
+    prefix = [0.0]
+    for group_score in scores:
+        prefix.append(prefix[-1] + group_score)
+    floor_order = sorted(range(len(floors)), key=floors.__getitem__) if floors is not None else None
+
+    def players_bound(used, need):
+        if floor_order is None:
+            return float('-inf')
+        total, count = 0, 0
+        for i in floor_order:
+            if not used >> i & 1:
+                total += floors[i]
+                count += 1
+                if count == 4 * need:
+                    break
+        return total
+
+    # Lời giải ban đầu (greedy hoặc engine nhanh) làm cận trên
+    incumbent_total = sum(group['score'] for group in incumbent) if len(incumbent) == num_matches else float('inf')
+    best = {'total': incumbent_total, 'picked': None}
+    deadline = time.perf_counter() + ASSIGNMENT_TIME_BUDGET
+    state = {'nodes': 0, 'timed_out': False}
+    picked = []
+
+    def search(start, used, total):
+        if len(picked) == num_matches:
+            if total < best['total'] - 1e-6:
+                best['total'], best['picked'] = total, list(picked)
+                if progress is not None:
+                    progress('assigning', [candidates[i] for i in picked])
+            return
+        need = num_matches - len(picked)
+        if total + players_bound(used, need) >= best['total'] - 1e-6:
+            return
+        for i in range(start, len(candidates) - need + 1):
+            if total + prefix[i + need] - prefix[i] >= best['total'] - 1e-6:
+                return  # Các ứng viên phía sau chỉ có điểm lớn hơn
+            if masks[i] & used:
+                continue
+            state['nodes'] += 1
+            if state['nodes'] % 256 == 0:
+                if progress is not None:
+                    progress('assigning')
+                if time.perf_counter() > deadline:
+                    state['timed_out'] = True
+            if state['timed_out']:
+                return
+            picked.append(i)
+            search(i + 1, used | masks[i], total + scores[i])
+            picked.pop()
+
+    search(0, 0, 0.0)
+    if best['picked'] is None:
+        return incumbent, not state['timed_out']
+    return [candidates[i] for i in best['picked']], not state['timed_out']
+
+def _court_suggestions(empty_courts, groups):
+    """Gán các nhóm (điểm tốt nhất trước) cho các sân trống theo thứ tự."""
     suggestions = []
-    used_player_ids = set()
-
-    for court in empty_courts:
-        best_available_match = None
-        for group in scored_groups:
-            player_ids_in_group = {p['id'] for p in group['pairing'][0]} | {p['id'] for p in group['pairing'][1]}
-            if not player_ids_in_group.intersection(used_player_ids):
-                best_available_match = group
-                break
-        
-        if best_available_match:
-            team_a, team_b = best_available_match['pairing']
-            suggestions.append({
-                'court_id': court['id'], 'court_name': court['name'],
-                'team_A': team_a, 'team_B': team_b,
-                'balance_score': round(best_available_match['score'], 2)
-            })
-            used_player_ids.update({p['id'] for p in team_a} | {p['id'] for p in team_b})
-        
-        if len(suggestions) >= num_matches_to_suggest: break
-            
+    for court, group in zip(empty_courts, sorted(groups, key=lambda x: x['score'])):
+        team_a, team_b = group['pairing']
+        suggestions.append({
+            'court_id': court['id'], 'court_name': court['name'],
+            'team_A': team_a, 'team_B': team_b,
+            'balance_score': round(group['score'], 2)
+        })
     return suggestions
 
+def plan_matches(active_players, empty_courts, rules, conn, progress=None):
+    """
+    Gợi ý trận đấu cho các sân trống và báo cáo kết quả tối ưu:
+    {'suggestions': [...], 'objective': tổng điểm các trận, 'optimal': True nếu
+    kết quả chắc chắn tối ưu (engine exhaustive, ứng viên không bị cắt ở
+    ASSIGNMENT_MAX_CANDIDATES và bước xếp sân đã duyệt hết trong thời gian
+    cho phép), 'engine': 'exhaustive' | 'fast'}.
+
+    progress(stage, suggestions) (tùy chọn) được gọi định kỳ với stage là
+    'scoring' | 'improving' | 'assigning'; suggestions là kết quả tốt nhất
+    tới lúc đó (cùng định dạng với plan['suggestions']) hoặc None. Hàm này
+    có thể ném PlanCancelled để dừng việc tính toán.
+    """
+    plan = {'suggestions': [], 'objective': 0, 'optimal': True, 'engine': None}
+    settings = load_settings()
+    if len(active_players) < 4: return plan
+    num_matches_to_suggest = min(len(empty_courts), len(active_players) // 4)
+    if num_matches_to_suggest == 0: return plan
+
+    report = None
+    if progress is not None:
+        def report(stage, groups=None):
+            progress(stage, _court_suggestions(empty_courts, groups) if groups is not None else None)
+
+    now = datetime.now()
+    # Đọc lịch sử cặp đôi một lần (từ cache), vòng lặp chấm điểm không chạm DB
+    pair_history = get_pair_history_map(conn) if rules.get('avoid_rematch') else {}
+    plan['engine'] = _select_engine(rules, len(active_players))
+    if plan['engine'] == 'fast':
+        incumbent, candidates = _groups_fast(active_players, num_matches_to_suggest, settings, rules, now, pair_history, report)
+        candidates = candidates[:ASSIGNMENT_MAX_CANDIDATES]
+        all_candidates = False  # Chỉ các nhóm quanh các "neo"
+    else:
+        all_candidates = math.comb(len(active_players), 4) <= ASSIGNMENT_MAX_CANDIDATES
+        scored_groups = _groups_exhaustive(active_players, settings, rules, now, pair_history, report)
+        scored_groups = iter(scored_groups)
+        candidates = list(itertools.islice(scored_groups, ASSIGNMENT_MAX_CANDIDATES))
+        incumbent = _greedy_assignment(itertools.chain(candidates, scored_groups), num_matches_to_suggest)
+    if report is not None:
+        report('assigning', incumbent)
+
+    floors = _player_floors(active_players, settings, rules, now)
+    chosen, search_complete = _optimal_assignment(candidates, num_matches_to_suggest, incumbent, floors, report)
+    plan['optimal'] = search_complete and all_candidates
+
+    # Nhóm điểm tốt nhất được gán cho sân trống đầu tiên
+    plan['suggestions'] = _court_suggestions(empty_courts, chosen)
+    plan['objective'] = round(sum(group['score'] for group in chosen), 2)
+    return plan
+
+def suggest_matches(active_players, empty_courts, rules, conn):
+    """Thuật toán chính để gợi ý các trận đấu."""
+    return plan_matches(active_players, empty_courts, rules, conn)['suggestions']
+
 def update_pair_history(team_players, cursor):
-    """Cập nhật bảng pair_history cho một đội gồm 2 người chơi."""
-    if len(team_players) != 2: return
+    """
+    Cập nhật bảng pair_history cho một đội gồm 2 người chơi. Trả về khóa
+    (min_id, max_id) của cặp (None nếu không phải đội 2 người) để gọi
+    apply_pair_history_increments sau khi commit.
+    """
+    if len(team_players) != 2: return None
     player_ids = sorted([p['id'] for p in team_players])
     p1_id, p2_id = player_ids[0], player_ids[1]
     
@@ -162,4 +566,6 @@ def update_pair_history(team_players, cursor):
         ON CONFLICT(player1_id, player2_id) DO UPDATE SET
             times_played = times_played + 1,
             last_played_together = datetime('now', 'localtime')
-    """, (p1_id, p2_id))
\ No newline at end of file
+    """, (p1_id, p2_id))
+
+    return (p1_id, p2_id)
\ No newline at end of file
@@ -0,0 +1,88 @@
+# Filename: match_events.py
+"""
+Typed delta events for the match state.
+
+begin_match / finish_match emit one 'match_state_changed' event carrying
+the rows they changed (the match, its court, its players) instead of a
+bare "something changed" message, so the dashboards patch their local
+state without re-fetching every list. When finish_match also starts the
+next match on the freed court (AUTO_DISPATCH), both travel in a single
+MATCH_TURNOVER event.
+
+Every event has a version: Redis INCR match_state_version, shared by all
+web server processes (a local counter without Redis). A client applies an
+event only if its version directly follows the one it holds, and falls
+back to a full refresh (GET /api/dashboard/snapshot) when it detects a gap.
+
+The version covers the whole dashboard state: the other changes shown on
+the dashboard (courts, players, sessions, scoreboard assignments) call
+bump_version() without emitting a delta, so the next delta is seen as a
+gap, and the snapshot's ETag changes.
+"""
+
+import threading
+
+import rooms
+
+try:
+    from extensions import redis_client
+except ImportError:
+    redis_client = None
+
+VERSION_KEY = "match_state_version"
+
+# Event types
+MATCH_STARTED = 'match_started'
+MATCH_FINISHED = 'match_finished'
+# finish_match with AUTO_DISPATCH: the finished match and the one started on its court
+MATCH_TURNOVER = 'match_turnover'
+
+_lock = threading.Lock()
+_local_version = 0
+
+
+def current_version():
+    if redis_client is not None:
+        try:
+            return int(redis_client.get(VERSION_KEY) or 0)
+        except Exception as e:
+            print(f"[Match Events] FAILED to read the version: {e}")
+    with _lock:
+        return _local_version
+
+
+def _next_version():
+    # A version taken from the local counter after a Redis error is seen as
+    # a gap by the clients, which then simply do a full refresh.
+    global _local_version
+    if redis_client is not None:
+        try:
+            return redis_client.incr(VERSION_KEY)
+        except Exception as e:
+            print(f"[Match Events] FAILED to increment the version: {e}")
+    with _lock:
+        _local_version += 1
+        return _local_version
+
+
+def bump_version():
+    """Marks a committed change of the dashboard state that has no delta event."""
+    return _next_version()
+
+
+def emit(event_type, message, **rows):
+    """
+    Emits a delta event once the change is committed. `rows` are the changed
+    rows (match=..., court=..., players=[...]). Returns the payload.
+    Sent to the dashboards, the room of the match's court and, for a
+    finished match (MATCH_FINISHED / MATCH_TURNOVER), the history pages.
+    """
+    payload = dict(rows, type=event_type, version=_next_version(), message=message)
+    targets = [rooms.ROOM_DASHBOARD]
+    if event_type in (MATCH_FINISHED, MATCH_TURNOVER):
+        targets.append(rooms.ROOM_HISTORY)
+    court_id = (rows.get('match') or {}).get('court_id') or (rows.get('court') or {}).get('id')
+    if court_id is not None:
+        targets.append(rooms.court_room(court_id))
+    rooms.emit_to('match_state_changed', payload, targets)
+    return payload
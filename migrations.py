@@ -0,0 +1,142 @@
+# Filename: migrations.py
+"""
+Versioned schema migrations.
+
+The schema version is stored in `PRAGMA user_version`. Every migration
+whose version is higher runs once, in its own transaction, in order.
+database.init_app() calls migrate() at startup.
+
+HOT_QUERIES lists the queries on the request hot paths together with the
+index each one must use. verify_query_plans() runs EXPLAIN QUERY PLAN on
+them and raises AssertionError if one falls back to a table scan:
+
+    python migrations.py          # apply migrations, then verify the plans
+"""
+
+import sqlite3
+import sys
+
+import queries
+from rating import DEFAULT_ELO, DEFAULT_SKILL_LEVEL, SKILL_LEVEL_ELO_STEP
+
+
+def _add_elo_rating(conn):
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(players)')}
+    if 'elo_rating' in columns:
+        return
+    conn.execute(f'ALTER TABLE players ADD COLUMN elo_rating REAL NOT NULL DEFAULT {DEFAULT_ELO}')
+    # Seed from skill_level (same formula as rating.initial_rating)
+    conn.execute(
+        'UPDATE players SET elo_rating = ? + (COALESCE(skill_level, ?) - ?) * ?',
+        (DEFAULT_ELO, DEFAULT_SKILL_LEVEL, DEFAULT_SKILL_LEVEL, SKILL_LEVEL_ELO_STEP)
+    )
+
+
+# (table, statement)
+HOT_PATH_INDEXES = (
+    # History / keyset pagination: finished matches ordered by end time
+    ('matches', 'CREATE INDEX IF NOT EXISTS idx_matches_status_end_time ON matches (status, end_time, id)'),
+    # begin_match busy check and "empty courts" lookups
+    ('matches', 'CREATE INDEX IF NOT EXISTS idx_matches_court_status ON matches (court_id, status)'),
+    # Matches of one player (covering: no lookup in match_players itself)
+    ('match_players', 'CREATE INDEX IF NOT EXISTS idx_match_players_player ON match_players (player_id, match_id, team)'),
+    # Every scoreboard control call resolves the board by court
+    ('scoreboards', 'CREATE INDEX IF NOT EXISTS idx_scoreboards_court ON scoreboards (court_id)'),
+    # Available players / rested-players reset in finish_match
+    ('players', 'CREATE INDEX IF NOT EXISTS idx_players_active ON players (is_active, consecutive_matches)'),
+)
+
+
+def _existing_tables(conn):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def _add_hot_path_indexes(conn):
+    # Older databases (e.g. blank_template.db) have no scoreboards table yet
+    tables = _existing_tables(conn)
+    for table, statement in HOT_PATH_INDEXES:
+        if table in tables:
+            conn.execute(statement)
+
+
+# (version, description, function(conn)) — append only, never renumber
+MIGRATIONS = (
+    (1, 'Add players.elo_rating', _add_elo_rating),
+    (2, 'Indexes for the hot queries', _add_hot_path_indexes),
+)
+
+
+def get_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn):
+    """Applies every pending migration. Returns the list of versions applied."""
+    applied = []
+    current = get_version(conn)
+    for version, description, apply in MIGRATIONS:
+        if version <= current:
+            continue
+        try:
+            conn.execute('BEGIN')
+            apply(conn)
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+        print(f"[Migrations] Applied {version}: {description}")
+        applied.append(version)
+    return applied
+
+
+# name -> (table, query, parameters, plan fragment that must appear, usually an index)
+# The queries are the statements the API runs (queries.py), not look-alikes.
+HOT_QUERIES = {
+    'ongoing_matches': (
+        'matches', queries.ongoing_matches_query(), (), 'idx_matches_status'),
+    'ongoing_match': (
+        'matches', queries.ongoing_matches_query(by_match=True), (1,), 'SEARCH m USING INTEGER PRIMARY KEY'),
+    'match_history': (
+        'matches', queries.history_query([queries.FINISHED_CLAUSE], limited=True),
+        (50,), 'idx_matches_status_end_time'),
+    'match_history_next_page': (
+        'matches', queries.history_query([queries.FINISHED_CLAUSE, queries.AFTER_CLAUSE], limited=True),
+        ('2000-01-01 00:00:00', 1, 50), 'idx_matches_status_end_time'),
+    'match_history_by_player': (
+        'match_players', queries.history_query([queries.FINISHED_CLAUSE, queries.PLAYER_CLAUSE], limited=True),
+        (1, 50), 'idx_match_players_player'),
+    'begin_match_busy_check': (
+        'matches', queries.BUSY_COURT_QUERY, (1,), 'idx_matches_court_status'),
+    'finish_match_rested_players': (
+        'players', queries.RESET_RESTED_PLAYERS, (), 'idx_players_active'),
+    'scoreboard_swap': (
+        'scoreboards', queries.SWAP_SCOREBOARD, (1,), 'idx_scoreboards_court'),
+    'available_players': (
+        'players', queries.AVAILABLE_PLAYERS_QUERY, (), 'idx_players_active'),
+}
+
+
+def verify_query_plans(conn):
+    """Asserts that every query in HOT_QUERIES is answered through its index."""
+    plans = {}
+    tables = _existing_tables(conn)
+    for name, (table, query, params, index) in HOT_QUERIES.items():
+        if table not in tables:
+            continue
+        details = [row[-1] for row in conn.execute(f'EXPLAIN QUERY PLAN {query}', params)]
+        plans[name] = details
+        assert any(index in detail for detail in details), \
+            f"Query '{name}' does not use {index}: {details}"
+    return plans
+
+
+if __name__ == '__main__':
+    database_uri = sys.argv[1] if len(sys.argv) > 1 else 'badminton.db'
+    connection = sqlite3.connect(database_uri)
+    connection.isolation_level = None  # migrate() manages its own transactions
+    migrate(connection)
+    print(f"Schema version: {get_version(connection)}")
+    for query_name, plan in verify_query_plans(connection).items():
+        print(f"OK  {query_name}: {' | '.join(plan)}")
+    connection.close()
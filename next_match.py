@@ -0,0 +1,246 @@
+# Filename: next_match.py
+"""
+Incremental "next match" suggester for a single freed court.
+
+The full suggester (logic.plan_matches) rescores every group of the
+available players on each call. When one court frees up only the best
+group is needed, so this module keeps, per session and in memory, a
+ranked pool of candidate groups of the eligible players (present, not
+resting after 2 consecutive matches, not in an ongoing or queued match):
+
+- A player entering the pool (or whose row changed) is scored with the
+  NEIGHBORS players closest to them by ELO: C(NEIGHBORS, 3) new groups
+  (scored like the full engine, with its batch scorer). A player leaving the
+  pool gets a new generation, which invalidates their groups lazily.
+  The groups of the players who stay are not regenerated, so beyond
+  NEIGHBORS + 1 players the pool is a heuristic, like the 'fast' engine.
+- Rest times advance without rescoring: with 'prioritize_rest' the score
+  of a group at time t is intercept - slope * m * t, where m is the number
+  of members who already played this session (the others have a constant
+  rest time). Groups are kept in one heap per m ordered by intercept, so
+  the best group is the best of the 5 heap tops.
+
+begin_match / finish_match call update() with the rows they changed;
+next_group() also re-reads the eligible rows (one query) and applies what
+changed elsewhere (queue, players page, another server process), and
+rebuilds the pool when the session or the settings change.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime
+
+import logic
+
+# Number of ELO neighbors grouped with each player (exact for up to NEIGHBORS + 1 players)
+NEIGHBORS = 16
+# The heaps are compacted when they hold COMPACT_RATIO times more entries than after the last compaction
+COMPACT_RATIO = 3
+COMPACT_MIN_ENTRIES = 5000
+
+# Fields of a player row the score depends on
+FINGERPRINT_FIELDS = ('elo_rating', 'gender', 'session_matches_played', 'session_last_played')
+
+PLAYERS_QUERY = """
+    SELECT p.*, EXISTS (
+        SELECT 1 FROM match_players mp JOIN matches m ON m.id = mp.match_id
+        WHERE mp.player_id = p.id AND m.status IN ('ongoing', 'queued')
+    ) AS busy
+    FROM players p WHERE p.is_active = 1
+"""
+
+
+def _eligible(player, busy):
+    return player['is_active'] == 1 and player['consecutive_matches'] < 2 and not busy
+
+
+def _fingerprint(player):
+    return tuple(player[field] for field in FINGERPRINT_FIELDS)
+
+
+class CandidatePool:
+    """Ranked candidate groups of one session (see the module docstring)."""
+
+    def __init__(self, session_id, settings):
+        self.session_id = session_id
+        self.settings = settings
+        self.origin = datetime.now()
+        # Same rules as the default suggestions, so both rank the players the same way
+        self.rules = dict(logic.DEFAULT_RULES)
+        self.slope = settings.get('REST_PRIORITY_WEIGHT', 0.01) / 4 if self.rules['prioritize_rest'] else 0
+        self.players = {}        # id -> row of an eligible player
+        self.fingerprints = {}   # id -> fingerprint of the row the groups were scored with
+        self.generation = {}     # id -> generation of the player's groups
+        self.heaps = [[] for _ in range(5)]  # m -> [(intercept, n, members, generations, pairing ids)]
+        self._generations = itertools.count()
+        self._entries = itertools.count()
+        self.compacted_size = 0
+        self.stats = {'players_updated': 0, 'groups_scored': 0, 'last_update_ms': None, 'compactions': 0}
+
+    def _elapsed(self, now):
+        return (now - self.origin).total_seconds()
+
+    def remove(self, player_id):
+        self.players.pop(player_id, None)
+        self.fingerprints.pop(player_id, None)
+        self.generation.pop(player_id, None)
+
+    def apply(self, players, pair_history):
+        """(Re)inserts the eligible rows of `players` (list of (row, eligible)) and scores their new groups."""
+        started = time.perf_counter()
+        entering = []
+        for player, eligible in players:
+            if not eligible:
+                self.remove(player['id'])
+                continue
+            self.players[player['id']] = player  # Rows without a score change (e.g. name) are not rescored
+            if self.fingerprints.get(player['id']) != _fingerprint(player):
+                self.fingerprints[player['id']] = _fingerprint(player)
+                self.generation[player['id']] = next(self._generations)
+                entering.append(player['id'])
+        if not entering:
+            return
+
+        elos = {pid: logic._virtual_elo(p, self.settings) for pid, p in self.players.items()}
+        groups = set()
+        for pid in entering:
+            others = sorted((other for other in self.players if other != pid),
+                            key=lambda other: abs(elos[other] - elos[pid]))[:NEIGHBORS]
+            for trio in itertools.combinations(others, 3):
+                groups.add(tuple(sorted((pid,) + trio)))
+
+        # Scored in one batch (NumPy when available), same scores as logic.score_group
+        now = datetime.now()
+        t = self._elapsed(now)
+        groups = list(groups)
+        active = list(self.players.values())
+        index = {player['id']: i for i, player in enumerate(active)}
+        score_groups = logic._make_scorer(active, self.settings, self.rules, now, pair_history)
+        results = score_groups([[index[pid] for pid in members] for members in groups])
+        new_entries = [[] for _ in self.heaps]
+        for members, (score, (team_a, team_b)) in zip(groups, results):
+            played = sum(1 for pid in members if self.players[pid]['session_last_played'])
+            new_entries[played].append((score + self.slope * played * t, next(self._entries), members,
+                                        tuple(self.generation[pid] for pid in members),
+                                        ([p['id'] for p in team_a], [p['id'] for p in team_b])))
+        for heap, entries in zip(self.heaps, new_entries):
+            if len(entries) * 8 < len(heap):
+                for entry in entries:
+                    heapq.heappush(heap, entry)
+            else:
+                heap.extend(entries)
+                heapq.heapify(heap)
+
+        self.stats['players_updated'] += len(entering)
+        self.stats['groups_scored'] += len(groups)
+        self.stats['last_update_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        self._maybe_compact()
+
+    def _valid(self, entry):
+        return all(self.generation.get(pid) == gen for pid, gen in zip(entry[2], entry[3]))
+
+    def _maybe_compact(self):
+        size = sum(len(heap) for heap in self.heaps)
+        if self.compacted_size == 0:
+            self.compacted_size = size  # First build: nothing is stale yet
+            return
+        if size < max(COMPACT_MIN_ENTRIES, COMPACT_RATIO * self.compacted_size):
+            return
+        for m, heap in enumerate(self.heaps):
+            self.heaps[m] = [entry for entry in heap if self._valid(entry)]
+            heapq.heapify(self.heaps[m])
+        self.compacted_size = sum(len(heap) for heap in self.heaps)
+        self.stats['compactions'] += 1
+
+    def best(self, now=None):
+        """(score at `now`, team_A ids, team_B ids) of the best valid group, or None."""
+        t = self._elapsed(now or datetime.now())
+        best = None
+        for m, heap in enumerate(self.heaps):
+            while heap and not self._valid(heap[0]):
+                heapq.heappop(heap)
+            if heap:
+                score = heap[0][0] - self.slope * m * t
+                if best is None or score < best[0]:
+                    best = (score, heap[0][4][0], heap[0][4][1])
+        return best
+
+    def snapshot(self):
+        return dict(self.stats, session_id=self.session_id, players=len(self.players),
+                    entries=sum(len(heap) for heap in self.heaps))
+
+
+_lock = threading.Lock()
+_pool = None
+
+
+def _current_pool(conn):
+    """The pool of the active session (rebuilt when the session or the settings changed), or None."""
+    global _pool
+    session = conn.execute("SELECT id FROM sessions WHERE status = 'active'").fetchone()
+    if session is None:
+        _pool = None
+        return None
+    settings = logic.load_settings()
+    if _pool is None or _pool.session_id != session['id'] or _pool.settings != settings:
+        _pool = CandidatePool(session['id'], dict(settings))
+    return _pool
+
+
+def _reset():
+    global _pool
+    _pool = None
+
+
+def update(conn, players, busy_ids=()):
+    """
+    Hook of begin_match / finish_match, after the commit: `players` are the
+    changed player rows, `busy_ids` the ones now in an ongoing match.
+    Does nothing before the first next_group() call of the session.
+    """
+    busy_ids = set(busy_ids)
+    with _lock:
+        if _pool is None:
+            return
+        try:
+            _pool.apply([(p, _eligible(p, p['id'] in busy_ids)) for p in players],
+                        logic.get_pair_history_map(conn))
+        except Exception as e:
+            print(f"[Next Match] FAILED to update the pool, it will be rebuilt: {e}")
+            _reset()
+
+
+def next_group(conn, exclude_ids=()):
+    """
+    Best next group of the active session: {'score', 'team_A': [rows], 'team_B': [rows]}
+    or None (no session, fewer than 4 eligible players). The players in
+    `exclude_ids` are left out of the pool (their groups are rescored when
+    they come back, on their next update).
+    """
+    excluded = set(exclude_ids)
+    with _lock:
+        pool = _current_pool(conn)
+        if pool is None:
+            return None
+        rows = [dict(row) for row in conn.execute(PLAYERS_QUERY)]
+        seen = {row['id'] for row in rows}
+        for player_id in [pid for pid in pool.players if pid not in seen]:
+            pool.remove(player_id)
+        pool.apply([(row, _eligible(row, row.pop('busy')) and row['id'] not in excluded) for row in rows],
+                   logic.get_pair_history_map(conn))
+        best = pool.best()
+        if best is None:
+            return None
+        score, team_a, team_b = best
+        return {
+            'score': round(score, 2),
+            'team_A': [pool.players[pid] for pid in team_a],
+            'team_B': [pool.players[pid] for pid in team_b],
+        }
+
+
+def stats():
+    with _lock:
+        return _pool.snapshot() if _pool is not None else None
@@ -0,0 +1,69 @@
+# Filename: queries.py
+"""
+SQL of the request hot paths.
+
+The API modules run these statements and migrations.HOT_QUERIES checks the
+plan of the very same strings, so the index check cannot drift from the
+code (see migrations.verify_query_plans).
+"""
+
+# Ongoing matches with their players; by_match adds the `m.id = ?` filter
+_ONGOING_MATCHES = """
+    SELECT m.id as match_id, m.court_id, c.name as court_name, m.start_time,
+           p.id as player_id, p.name as player_name, mp.team
+    FROM matches m JOIN courts c ON m.court_id = c.id
+    JOIN match_players mp ON m.id = mp.match_id
+    JOIN players p ON mp.player_id = p.id
+    WHERE m.status = 'ongoing' {match_filter} ORDER BY m.id, mp.team;
+"""
+
+
+def ongoing_matches_query(by_match=False):
+    return _ONGOING_MATCHES.format(match_filter='AND m.id = ?' if by_match else '')
+
+
+# History filters / keyset pagination on matches (alias m)
+FINISHED_CLAUSE = "m.status = 'finished'"
+PLAYER_CLAUSE = 'm.id IN (SELECT match_id FROM match_players WHERE player_id = ?)'
+AFTER_CLAUSE = '(m.end_time, m.id) < (?, ?)'
+
+_HISTORY = """
+    SELECT
+        m.id as match_id, m.end_time, m.winning_team, m.score_A, m.score_B,
+        c.name as court_name, p.id as player_id, p.name as player_name,
+        mp.team
+    FROM (
+        SELECT m.id, m.court_id, m.end_time, m.winning_team, m.score_A, m.score_B
+        FROM matches m
+        WHERE {where}
+        ORDER BY m.end_time DESC, m.id DESC
+        {limit}
+    ) m
+    LEFT JOIN courts c ON m.court_id = c.id
+    JOIN match_players mp ON m.id = mp.match_id
+    JOIN players p ON mp.player_id = p.id
+    ORDER BY m.end_time DESC, m.id DESC, mp.team;
+"""
+
+
+def history_query(clauses, limited=False):
+    """Finished matches (newest first) matching `clauses`; `limited` adds a `LIMIT ?` parameter."""
+    return _HISTORY.format(where=' AND '.join(clauses), limit='LIMIT ?' if limited else '')
+
+
+BUSY_COURT_QUERY = "SELECT id FROM matches WHERE court_id = ? AND status = 'ongoing'"
+
+# Players present and not in an ongoing match (their consecutive_matches is reset)
+RESTING_PLAYERS_CONDITION = """
+    is_active = 1 AND consecutive_matches != 0
+    AND id NOT IN (
+        SELECT mp.player_id FROM match_players mp
+        JOIN matches m ON m.id = mp.match_id
+        WHERE m.status = 'ongoing'
+    )
+"""
+RESET_RESTED_PLAYERS = f"UPDATE players SET consecutive_matches = 0 WHERE {RESTING_PLAYERS_CONDITION}"
+
+AVAILABLE_PLAYERS_QUERY = "SELECT * FROM players WHERE is_active = 1 AND consecutive_matches < 2 ORDER BY name ASC"
+
+SWAP_SCOREBOARD = "UPDATE scoreboards SET is_swapped = NOT is_swapped WHERE court_id = ?"
@@ -0,0 +1,131 @@
+# rating.py
+"""
+ELO rating engine for doubles (and singles) matches.
+
+- Expected score uses the team averages:
+  E_A = 1 / (1 + ELO_BASE ** ((R_B - R_A) / SCALING_FACTOR))
+- Every player moves by their own K-factor (logic.get_dynamic_k_factor),
+  based on the matches they had played BEFORE this one.
+- apply_match_ratings writes the new ratings of all players of a match with
+  a single executemany, inside the caller's transaction (finish_match).
+- recompute_all_ratings replays the whole `matches` history in one
+  streaming pass and rewrites every stored rating.
+"""
+
+import itertools
+
+from logic import get_dynamic_k_factor
+
+DEFAULT_ELO = 1500
+SKILL_LEVEL_ELO_STEP = 100  # Rating gap between two consecutive skill levels
+DEFAULT_SKILL_LEVEL = 3
+
+
+def initial_rating(skill_level):
+    """Starting rating of a new player, seeded from their skill level."""
+    try:
+        level = float(skill_level)
+    except (TypeError, ValueError):
+        level = DEFAULT_SKILL_LEVEL
+    return DEFAULT_ELO + (level - DEFAULT_SKILL_LEVEL) * SKILL_LEVEL_ELO_STEP
+
+
+def expected_score(team_rating, opponent_rating, settings):
+    """Probability that a team with team_rating beats one with opponent_rating."""
+    elo_base = settings.get('ELO_BASE', 10)
+    scaling_factor = settings.get('SCALING_FACTOR', 400)
+    return 1 / (1 + elo_base ** ((opponent_rating - team_rating) / scaling_factor))
+
+
+def rating_changes(players, winning_team, settings):
+    """
+    Computes the new rating of every player of one match.
+    `players` is a list of dicts with id, team ('A'/'B'), elo_rating and
+    total_matches_played. Returns a list of (new_rating, player_id), ready
+    to be passed to executemany.
+    """
+    teams = {'A': [], 'B': []}
+    for player in players:
+        teams[player['team']].append(player['elo_rating'])
+    if not teams['A'] or not teams['B']:
+        return []
+
+    team_rating = {team: sum(ratings) / len(ratings) for team, ratings in teams.items()}
+    expected = {
+        'A': expected_score(team_rating['A'], team_rating['B'], settings),
+        'B': expected_score(team_rating['B'], team_rating['A'], settings),
+    }
+
+    updates = []
+    for player in players:
+        actual = 1 if player['team'] == winning_team else 0
+        k_factor = get_dynamic_k_factor(player, settings)
+        new_rating = player['elo_rating'] + k_factor * (actual - expected[player['team']])
+        updates.append((new_rating, player['id']))
+    return updates
+
+
+def apply_match_ratings(cursor, match_id, winning_team, settings):
+    """
+    Updates the ratings of the players of a finished match.
+    Must be called inside the finish transaction, BEFORE the players'
+    total_matches_played is incremented (the K-factor depends on it).
+    """
+    rows = cursor.execute(
+        '''SELECT p.id, p.elo_rating, p.total_matches_played, mp.team
+           FROM match_players mp JOIN players p ON p.id = mp.player_id
+           WHERE mp.match_id = ?''',
+        (match_id,)
+    ).fetchall()
+    players = [
+        {'id': row['id'], 'elo_rating': row['elo_rating'], 'team': row['team'],
+         'total_matches_played': row['total_matches_played'] or 0}
+        for row in rows
+    ]
+    updates = rating_changes(players, winning_team, settings)
+    cursor.executemany('UPDATE players SET elo_rating = ? WHERE id = ?', updates)
+    return updates
+
+
+def recompute_all_ratings(conn, settings):
+    """
+    Recomputes every rating from scratch by replaying all finished matches
+    in chronological order. Rows are streamed from the cursor, only the
+    current rating and match count of each player are kept in memory.
+    Returns the number of matches replayed.
+    """
+    ratings = {}
+    matches_played = {}
+    for row in conn.execute('SELECT id, skill_level FROM players'):
+        ratings[row[0]] = initial_rating(row[1])
+        matches_played[row[0]] = 0
+
+    cursor = conn.execute(
+        '''SELECT m.id AS match_id, m.winning_team, mp.player_id, mp.team
+           FROM matches m
+           JOIN match_players mp ON mp.match_id = m.id
+           JOIN players p ON p.id = mp.player_id
+           WHERE m.status = 'finished' AND m.winning_team IS NOT NULL
+           ORDER BY m.end_time, m.id'''
+    )
+
+    replayed = 0
+    for (match_id, winning_team), rows in itertools.groupby(cursor, key=lambda row: (row[0], row[1])):
+        players = [
+            {'id': row[2], 'team': row[3], 'elo_rating': ratings[row[2]],
+             'total_matches_played': matches_played[row[2]]}
+            for row in rows
+        ]
+        for new_rating, player_id in rating_changes(players, winning_team, settings):
+            ratings[player_id] = new_rating
+        for player in players:
+            matches_played[player['id']] += 1
+        replayed += 1
+
+    conn.executemany(
+        'UPDATE players SET elo_rating = ? WHERE id = ?',
+        ((rating, player_id) for player_id, rating in ratings.items())
+    )
+    conn.commit()
+    return replayed
+
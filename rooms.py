@@ -0,0 +1,71 @@
+# Filename: rooms.py
+"""
+Socket.IO rooms of the web clients.
+
+A client joins only the rooms of what it renders (the 'subscribe' event,
+handled in web_server.py), and the server emits into rooms, so an event
+costs one send per interested client instead of one per connected client:
+
+- ROOM_DASHBOARD: every court (scores, swaps, assignments, match deltas)
+- ROOM_HISTORY: finished matches
+- suggestion_job_room(job_id) = 'suggestions:<job_id>': progress of one
+  background suggestion job, joined by the page that started it
+- court_room(court_id) = 'court:<id>': a single court (spectator screens)
+
+Flask-SocketIO 4 takes one room per emit, so an event meant for several
+rooms is emitted once per room. A client should join the dashboard OR
+court rooms; score_updated carries a seq, so a duplicate is ignored anyway.
+"""
+
+try:
+    from extensions import socketio
+except ImportError:
+    socketio = None
+
+ROOM_DASHBOARD = 'dashboard'
+ROOM_HISTORY = 'history'
+COURT_ROOM_PREFIX = 'court:'
+SUGGESTION_JOB_ROOM_PREFIX = 'suggestions:'
+
+
+def court_room(court_id):
+    return f"{COURT_ROOM_PREFIX}{court_id}"
+
+
+def suggestion_job_room(job_id):
+    return f"{SUGGESTION_JOB_ROOM_PREFIX}{job_id}"
+
+
+def _is_job_id(value):
+    # uuid4().hex of api/suggestions.py
+    return len(value) == 32 and all(char in '0123456789abcdef' for char in value)
+
+
+def is_valid_room(name):
+    if name in (ROOM_DASHBOARD, ROOM_HISTORY):
+        return True
+    if not isinstance(name, str):
+        return False
+    if name.startswith(COURT_ROOM_PREFIX):
+        return name[len(COURT_ROOM_PREFIX):].isdigit()
+    return name.startswith(SUGGESTION_JOB_ROOM_PREFIX) and _is_job_id(name[len(SUGGESTION_JOB_ROOM_PREFIX):])
+
+
+def emit_to(event, payload, rooms):
+    for room in rooms:
+        socketio.emit(event, payload, room=room)
+
+
+def emit_court_event(event, payload, court_id):
+    """An event about one court: to its room and to the dashboards."""
+    emit_to(event, payload, (court_room(court_id), ROOM_DASHBOARD))
+
+
+def emit_score_updates(updates):
+    """
+    A batch of score updates (redis_listener): the whole batch to the
+    dashboards in one event, and each update to the room of its court.
+    """
+    socketio.emit('score_updated', {'updates': updates}, room=ROOM_DASHBOARD)
+    for update in updates:
+        socketio.emit('score_updated', update, room=court_room(update['court_id']))
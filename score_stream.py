@@ -0,0 +1,196 @@
+# Filename: score_stream.py
+"""
+Durable device -> web pipeline on a Redis Stream.
+
+sock_server appends every device score to REDIS_SCOREBOARD_STREAM with
+XADD (trimmed to about SCOREBOARD_STREAM_MAXLEN entries). web_server reads
+it through the consumer group REDIS_SCOREBOARD_GROUP with XREADGROUP and
+acknowledges each batch with XACK once it is stored. Scores published
+while the web server is down or slow stay in the stream and are replayed;
+entries left pending by a consumer that died are claimed after
+CLAIM_MIN_IDLE_MS.
+
+Every entry carries a per-device sequence number (INCR score_seq:<device_id>,
+taken atomically with the XADD). The same counter is used by the web
+writers (live_scores), so the scores of a device are totally ordered and a
+replayed or delayed entry can be recognised as stale.
+"""
+
+import os
+import socket
+import time
+
+try:
+    from extensions import (redis_client, REDIS_SCOREBOARD_STREAM,
+                            REDIS_SCOREBOARD_GROUP, SCOREBOARD_STREAM_MAXLEN)
+except ImportError:
+    redis_client = None
+    REDIS_SCOREBOARD_STREAM = "scoreboard_stream"
+    REDIS_SCOREBOARD_GROUP = "web_server"
+    SCOREBOARD_STREAM_MAXLEN = 10000
+
+# A stable name, so a restarted web server first re-reads its own pending entries
+CONSUMER_NAME = os.environ.get('SCOREBOARD_CONSUMER', f"web-{socket.gethostname()}")
+# Entries pending longer than this on another consumer are taken over
+CLAIM_MIN_IDLE_MS = 30000
+CLAIM_INTERVAL = 30
+
+SEQ_KEY_PREFIX = "score_seq:"
+
+# KEYS: stream, seq counter of the device
+# ARGV: maxlen, device_id, score_A, score_B, source
+PUBLISH_SCORE_LUA = """
+local seq = redis.call('INCR', KEYS[2])
+redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[1], '*',
+           'device_id', ARGV[2], 'score_A', ARGV[3], 'score_B', ARGV[4], 'source', ARGV[5], 'seq', seq)
+return seq
+"""
+
+_publish_script = redis_client.register_script(PUBLISH_SCORE_LUA) if redis_client is not None else None
+
+_last_claim = 0.0
+
+
+def seq_key(device_id):
+    return f"{SEQ_KEY_PREFIX}{device_id}"
+
+
+# --- Producer (sock_server) ---
+
+def parse_score(value):
+    """
+    A score sent by a device (an int or a decimal string) as a non-negative
+    int. Raises ValueError for anything else (None, bools, floats, text).
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"Invalid score: {value!r}")
+    score = int(value)
+    if score < 0:
+        raise ValueError(f"Invalid score: {value!r}")
+    return score
+
+
+def score_entry(device_id, score_a, score_b, source='sock_server'):
+    """Fields of one stream entry (shared by every producer, see async_gateway.py)."""
+    return {'device_id': device_id, 'score_A': score_a, 'score_B': score_b, 'source': source}
+
+
+def publish_call(fields):
+    """(keys, args) of PUBLISH_SCORE_LUA for the fields of score_entry()."""
+    return (
+        [REDIS_SCOREBOARD_STREAM, seq_key(fields['device_id'])],
+        [SCOREBOARD_STREAM_MAXLEN, fields['device_id'], fields['score_A'], fields['score_B'], fields['source']],
+    )
+
+
+def publish_score(device_id, score_a, score_b, source='sock_server'):
+    """Appends one score to the stream. Returns its seq."""
+    keys, args = publish_call(score_entry(device_id, score_a, score_b, source))
+    return _publish_script(keys=keys, args=args)
+
+
+# --- Consumer (web_server) ---
+
+def ensure_group():
+    """Creates the consumer group (and the stream) if needed."""
+    try:
+        redis_client.xgroup_create(REDIS_SCOREBOARD_STREAM, REDIS_SCOREBOARD_GROUP, id='0', mkstream=True)
+    except Exception as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+
+def _drop_trimmed(entries):
+    """
+    Pending entries trimmed from the stream (MAXLEN) come back without
+    fields (None or empty): there is nothing left to store, so they are
+    acknowledged right away instead of staying pending forever. Returns the
+    other entries.
+    """
+    ack([entry_id for entry_id, fields in entries if not fields])
+    return [entry for entry in entries if entry[1]]
+
+
+def _flatten(response):
+    # [[stream, [(id, fields), ...]]] -> [(id, fields), ...]
+    return [entry for _, entries in (response or []) for entry in entries]
+
+
+def _entries(response):
+    return _drop_trimmed(_flatten(response))
+
+
+def read_own_pending(count):
+    """
+    Entries delivered to this consumer but never acknowledged (e.g. before a
+    crash). Returns [] only once nothing is pending any more.
+    """
+    while True:
+        response = redis_client.xreadgroup(
+            REDIS_SCOREBOARD_GROUP, CONSUMER_NAME, {REDIS_SCOREBOARD_STREAM: '0'}, count=count
+        )
+        raw = _flatten(response)
+        entries = _drop_trimmed(raw)
+        if entries or not raw:
+            return entries
+        # A page of trimmed entries only: they are acknowledged now, read the next page
+
+
+def claim_stale(count):
+    """Takes over the entries left pending too long by other consumers."""
+    global _last_claim
+    now = time.monotonic()
+    if now - _last_claim < CLAIM_INTERVAL:
+        return []
+    _last_claim = now
+    response = redis_client.xautoclaim(
+        REDIS_SCOREBOARD_STREAM, REDIS_SCOREBOARD_GROUP, CONSUMER_NAME,
+        min_idle_time=CLAIM_MIN_IDLE_MS, start_id='0-0', count=count,
+    )
+    return _drop_trimmed(response[1])
+
+
+def read_batch(count, block_ms, window):
+    """
+    Blocks up to block_ms for new entries. Once the first entries arrive,
+    waits the rest of `window` seconds and reads once more, so that a burst
+    of points ends up in a single batch. Returns [(id, fields), ...].
+    """
+    entries = _entries(redis_client.xreadgroup(
+        REDIS_SCOREBOARD_GROUP, CONSUMER_NAME, {REDIS_SCOREBOARD_STREAM: '>'}, count=count, block=block_ms
+    ))
+    if entries and len(entries) < count and window > 0:
+        time.sleep(window)
+        entries += _entries(redis_client.xreadgroup(
+            REDIS_SCOREBOARD_GROUP, CONSUMER_NAME, {REDIS_SCOREBOARD_STREAM: '>'}, count=count - len(entries)
+        ))
+    return entries
+
+
+def ack(entry_ids):
+    if entry_ids:
+        redis_client.xack(REDIS_SCOREBOARD_STREAM, REDIS_SCOREBOARD_GROUP, *entry_ids)
+
+
+def stats():
+    """Length of the stream and pending / lag figures of the consumer group."""
+    if redis_client is None:
+        return {'error': 'Redis client is not connected'}
+    pending = redis_client.xpending(REDIS_SCOREBOARD_STREAM, REDIS_SCOREBOARD_GROUP)
+    groups = {group['name']: group for group in redis_client.xinfo_groups(REDIS_SCOREBOARD_STREAM)}
+    group = groups.get(REDIS_SCOREBOARD_GROUP, {})
+    oldest_pending_ms = None
+    if pending['pending']:
+        oldest_ms = int(pending['min'].split('-')[0])
+        oldest_pending_ms = max(0, int(time.time() * 1000) - oldest_ms)
+    return {
+        'stream': REDIS_SCOREBOARD_STREAM,
+        'length': redis_client.xlen(REDIS_SCOREBOARD_STREAM),
+        'max_length': SCOREBOARD_STREAM_MAXLEN,
+        'group': REDIS_SCOREBOARD_GROUP,
+        'pending': pending['pending'],
+        'oldest_pending_ms': oldest_pending_ms,
+        'consumers': {consumer['name']: consumer['pending'] for consumer in pending['consumers']},
+        'lag': group.get('lag'),  # Entries not yet delivered to the group (Redis >= 7)
+        'last_delivered_id': group.get('last-delivered-id'),
+    }
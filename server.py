@@ -5,6 +5,8 @@ import os
 import json
 from extensions import broadcast_to_web, esp_clients, web_clients
 import database
+import device_routing
+import live_scores
 
 # Import các Blueprint từ thư mục 'api'
 from api.players import players_api
@@ -14,6 +16,8 @@ from api.matches import matches_api
 from api.sessions import sessions_api
 from api.settings import settings_api 
 from api.scoreboards import scoreboards_api
+from api.system import system_api
+from api.dashboard import dashboard_api
 
 # --- Cấu hình và Khởi tạo Ứng dụng ---
 app = Flask(__name__,
@@ -37,6 +41,8 @@ app.register_blueprint(matches_api, url_prefix='/api')
 app.register_blueprint(settings_api, url_prefix='/api') 
 app.register_blueprint(sessions_api, url_prefix='/api') 
 app.register_blueprint(scoreboards_api, url_prefix='/api')
+app.register_blueprint(system_api, url_prefix='/api')
+app.register_blueprint(dashboard_api, url_prefix='/api')
 
 
 
@@ -116,23 +122,14 @@ def ws_device_endpoint(ws):
             if 'score_A' in msg and 'score_B' in msg and device_id:
                 score_a, score_b = msg['score_A'], msg['score_B']
                 
-                # Database Logic
-                conn = get_db_connection()
-                cursor = conn.cursor()
-                cursor.execute(
-                    "UPDATE scoreboards SET score_A = ?, score_B = ?, last_seen = datetime('now', 'localtime'), updated_by = 'device' WHERE device_id = ?",
-                    (score_a, score_b, device_id)
-                )
-                if cursor.rowcount == 0:
-                    cursor.execute("INSERT INTO scoreboards (device_id, score_A, score_B, last_seen) VALUES (?, ?, ?, datetime('now', 'localtime'))", (device_id, score_a, score_b))
-                conn.commit()
+                # Live score store (Redis, checkpointed to SQLite); stale scores are dropped
+                if live_scores.set_scores(device_id, score_a, score_b) is None:
+                    continue
                 
-                scoreboard = cursor.execute("SELECT court_id FROM scoreboards WHERE device_id = ?", (device_id,)).fetchone()
-                conn.close()
-                
-                # Notify Web Clients
-                if scoreboard and scoreboard['court_id'] is not None:
-                    payload = {'type': 'score_updated', 'payload': {'court_id': scoreboard['court_id'], 'score_A': score_a, 'score_B': score_b}}
+                # Notify Web Clients (court resolved from the in-memory routing table)
+                court_id = device_routing.court_of(device_id)
+                if court_id is not None:
+                    payload = {'type': 'score_updated', 'payload': {'court_id': court_id, 'score_A': score_a, 'score_B': score_b}}
                     broadcast_to_web(json.dumps(payload))
 
     except Exception as e:
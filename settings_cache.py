@@ -0,0 +1,150 @@
+# Filename: settings_cache.py
+"""
+Cache dùng chung trong tiến trình cho bảng `settings`.
+
+Bảng chỉ được đọc một lần rồi giữ trong bộ nhớ (cả giá trị dạng chuỗi
+gốc cho GET /api/settings lẫn giá trị đã ép kiểu cho logic.py).
+Sau khi PUT /api/settings commit, cache được xóa ở tiến trình hiện tại và
+một thông báo được publish lên Redis để các tiến trình khác (web_server)
+cũng bỏ bản sao của mình. Lần đọc kế tiếp sẽ nạp lại từ DB.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import uuid
+
+import database
+
+try:
+    from extensions import redis_client, REDIS_SETTINGS_CHANNEL, listen_channel
+except ImportError:
+    redis_client = None
+    REDIS_SETTINGS_CHANNEL = "settings_invalidated"
+    listen_channel = None
+
+# Giá trị mặc định khi không đọc được DB hoặc thiếu khóa
+DEFAULTS = {
+    'SCALING_FACTOR': 400, 'ELO_BASE': 10, 'FEMALE_ELO_BONUS': 50,
+    'REST_PRIORITY_WEIGHT': 0.01, 'LOW_GAMES_PENALTY_WEIGHT': 0.1,
+    'REMATCH_PENALTY_WEIGHT': 50, 'K_FACTOR_NEW': 48,
+    'K_FACTOR_MID': 32, 'K_FACTOR_STABLE': 24, 'AUTO_DISPATCH': 0
+}
+
+# Kiểu dữ liệu của từng thiết lập
+NUMERIC_KEYS = {
+    'SCALING_FACTOR': float, 'ELO_BASE': float, 'FEMALE_ELO_BONUS': float,
+    'REST_PRIORITY_WEIGHT': float, 'LOW_GAMES_PENALTY_WEIGHT': float,
+    'REMATCH_PENALTY_WEIGHT': float, 'K_FACTOR_NEW': int,
+    'K_FACTOR_MID': int, 'K_FACTOR_STABLE': int, 'AUTO_DISPATCH': int
+}
+
+# Định danh tiến trình này, để bỏ qua thông báo do chính nó gửi
+PROCESS_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+_lock = threading.Lock()
+_generation = 0   # Tăng lên sau mỗi lần xóa cache
+_snapshot = None  # (raw_settings, typed_settings), luôn được thay cả cặp
+
+
+def _cast_settings(raw):
+    """Ép các giá trị chuỗi sang kiểu số, dùng giá trị mặc định nếu không ép được."""
+    typed = {}
+    for key, cast_func in NUMERIC_KEYS.items():
+        try:
+            typed[key] = cast_func(raw.get(key, DEFAULTS[key]))
+        except (ValueError, TypeError):
+            typed[key] = DEFAULTS[key]
+            print(f"Warning: Could not cast setting '{key}'. Reverting to default.")
+    return typed
+
+
+def _read_settings_table():
+    """Bảng settings dưới dạng {key: value}, hoặc None nếu không đọc được."""
+    try:
+        with database.pooled_connection() as conn:
+            rows = conn.execute('SELECT key, value FROM settings').fetchall()
+        return {row['key']: row['value'] for row in rows}
+    except sqlite3.Error as e:
+        print(f"[Settings Cache] Database error while loading settings: {e}")
+        return None
+
+
+def _get_snapshot():
+    global _snapshot
+    snapshot = _snapshot
+    if snapshot is not None:
+        return snapshot
+
+    generation = _generation
+    raw = _read_settings_table()
+    if raw is None:
+        # Giá trị mặc định chỉ cho lần gọi này: lần nạp lỗi không được cache, lần sau đọc lại
+        return ({}, _cast_settings({}))
+    snapshot = (raw, _cast_settings(raw))
+    with _lock:
+        # Chỉ lưu kết quả vừa nạp nếu không ai xóa cache trong lúc đó
+        if generation == _generation:
+            _snapshot = snapshot
+    return snapshot
+
+
+def get_settings():
+    """Các thiết lập đã ép kiểu (lấy từ bộ nhớ)."""
+    return dict(_get_snapshot()[1])
+
+
+def get_raw_settings():
+    """Các thiết lập đúng như lưu trong bảng (giá trị chuỗi)."""
+    return dict(_get_snapshot()[0])
+
+
+def invalidate():
+    """Xóa cache thiết lập của tiến trình này."""
+    global _snapshot, _generation
+    with _lock:
+        _generation += 1
+        _snapshot = None
+
+
+def publish_invalidation():
+    """Xóa cache ở tiến trình này và báo các tiến trình khác làm tương tự."""
+    invalidate()
+    if redis_client is None:
+        return
+    try:
+        redis_client.publish(REDIS_SETTINGS_CHANNEL, json.dumps({'origin': PROCESS_ID}))
+    except Exception as e:
+        print(f"[Settings Cache] FAILED to publish invalidation: {e}")
+
+
+def _on_invalidation(data):
+    try:
+        origin = json.loads(data).get('origin')
+    except (json.JSONDecodeError, AttributeError):
+        origin = None
+    if origin != PROCESS_ID:
+        invalidate()
+        print("[Settings Cache] Invalidated by another process.")
+
+
+def invalidation_listener():
+    """
+    Lắng nghe kênh settings và xóa cache với mỗi thông báo của tiến trình
+    khác. Chạy trong một thread nền. Khi mất kết nối Redis, listener tự
+    đăng ký lại (xem extensions.listen_channel) và xóa cache, vì các thông
+    báo gửi trong lúc mất kết nối đã bị lỡ.
+    """
+    if redis_client is None:
+        print("Settings listener: Cannot start, Redis client is not connected.")
+        return
+    listen_channel(redis_client, REDIS_SETTINGS_CHANNEL, _on_invalidation, 'Settings Cache',
+                   on_reconnect=invalidate)
+
+
+def start_invalidation_listener():
+    """Chạy invalidation_listener trong một daemon thread."""
+    thread = threading.Thread(target=invalidation_listener, name='settings-invalidation', daemon=True)
+    thread.start()
+    return thread
@@ -6,27 +6,37 @@ This server's sole purpose is to handle raw WebSocket connections
 from ESP32/ESP8266 devices using flask-sock.
 
 It listens on the /ws/device endpoint.
-When it receives data from a device, it immediately publishes that
-data to a Redis PubSub channel for the main web_server to process.
+When it receives data from a device, it immediately appends that
+data to a Redis Stream for the main web_server to process (see score_stream.py).
 
 This server runs as a separate process on a different port (e.g., 5001).
+With GATEWAY_MODE=async it runs async_gateway.py instead (same protocol,
+same Redis contract, asyncio instead of one thread per board).
 """
 
 from flask import Flask
 from flask_sock import Sock
 import json
 import os
+import threading
 import time
 
 # Import the Redis client and channel name from our extensions
 # Note: This file ONLY imports what it needs for Redis.
 # It does NOT import socketio or database logic.
 try:
-    from extensions import redis_client, REDIS_SCOREBOARD_CHANNEL
+    from extensions import (redis_client, REDIS_SCOREBOARD_STREAM, REDIS_COMMAND_CHANNEL,
+                            REDIS_COMMAND_ACK_CHANNEL, listen_channel)
 except ImportError:
     print("Could not import extensions.py. Make sure it exists.")
     redis_client = None
-    REDIS_SCOREBOARD_CHANNEL = "scoreboard_updates"
+    REDIS_SCOREBOARD_STREAM = "scoreboard_stream"
+    REDIS_COMMAND_CHANNEL = "scoreboard_commands"
+    REDIS_COMMAND_ACK_CHANNEL = "scoreboard_command_acks"
+    listen_channel = None
+
+import device_commands
+import score_stream
 
 # --- App Initialization ---
 app = Flask(__name__)
@@ -40,6 +50,14 @@ if redis_client is None:
     print("Please check your Redis server connection.")
     print("-------------")
 
+# Print every frame received and every score published (off by default: one line per point)
+VERBOSE = os.environ.get('GATEWAY_VERBOSE', '0') == '1'
+
+# Registry of the boards connected to THIS process: device_id -> websocket.
+# Used to push the web commands (see device_commands.py) to the right board.
+device_sockets = {}
+device_sockets_lock = threading.Lock()
+
 
 # --- WebSocket Endpoint for Hardware ---
 
@@ -59,7 +77,8 @@ def ws_device_endpoint(ws):
                 print(f"[{device_id or 'Unknown'}] Received empty data. Closing connection.")
                 break
                 
-            print(f"[Recv from ESP {device_id or ''}]: {data}")
+            if VERBOSE:
+                print(f"[Recv from ESP {device_id or ''}]: {data}")
 
             try:
                 msg = json.loads(data)
@@ -70,29 +89,39 @@ def ws_device_endpoint(ws):
             # Register the device_id on first message
             if 'device_id' in msg and device_id is None:
                 device_id = msg['device_id']
+                with device_sockets_lock:
+                    device_sockets[device_id] = ws
                 print(f"Registered device: {device_id}")
 
+            # Acknowledgement of a command pushed by command_listener()
+            if msg.get('type') == 'ack' and device_id and 'seq' in msg:
+                if redis_client:
+                    try:
+                        redis_client.publish(REDIS_COMMAND_ACK_CHANNEL, device_commands.ack_message(device_id, msg['seq']))
+                    except Exception as e:
+                        print(f"[{device_id}] FAILED to publish ack: {e}")
+                continue
+
             # Check for score update payload
             # We only care about messages that contain a score
             if 'score_A' in msg and 'score_B' in msg and device_id:
                 
-                # --- NEW LOGIC: Publish to Redis ---
+                # --- NEW LOGIC: Append to the Redis Stream ---
+                try:
+                    score_a = score_stream.parse_score(msg['score_A'])
+                    score_b = score_stream.parse_score(msg['score_B'])
+                except ValueError:
+                    print(f"[Warning] [{device_id}] Received invalid scores: {data}")
+                    continue
+
                 if redis_client:
                     try:
-                        # We must re-serialize the data (or just pass 'data')
-                        # to send it over Redis.
-                        # Let's create a standardized payload.
-                        redis_payload = json.dumps({
-                            'device_id': device_id,
-                            'score_A': msg['score_A'],
-                            'score_B': msg['score_B'],
-                            'source': 'sock_server'
-                        })
+                        # The entry stays in the stream until web_server acknowledges it,
+                        # so nothing is lost if web_server restarts or lags.
+                        seq = score_stream.publish_score(device_id, score_a, score_b)
                         
-                        # Publish the payload to the channel
-                        redis_client.publish(REDIS_SCOREBOARD_CHANNEL, redis_payload)
-                        
-                        print(f"[{device_id}] Published to Redis channel '{REDIS_SCOREBOARD_CHANNEL}'")
+                        if VERBOSE:
+                            print(f"[{device_id}] Appended to Redis stream '{REDIS_SCOREBOARD_STREAM}' (seq {seq})")
                     
                     except Exception as e:
                         print(f"[{device_id}] FAILED to publish to Redis: {e}")
@@ -107,17 +136,59 @@ def ws_device_endpoint(ws):
     except Exception as e:
         print(f"🔌 ESP device {device_id or ''} connection error: {e}")
     finally:
+        with device_sockets_lock:
+            if device_id and device_sockets.get(device_id) is ws:
+                del device_sockets[device_id]
         print(f"🔌 ESP device {device_id or ''} disconnected.")
 
 
+# --- Downlink: web commands -> boards ---
+
+def push_command(data):
+    """Pushes one command of the command channel to its board, if it is connected to this process."""
+    command = device_commands.parse_command(data)
+    if command is None:
+        return
+    with device_sockets_lock:
+        ws = device_sockets.get(command['device_id'])
+    if ws is None:
+        return  # Board connected to another gateway (or offline)
+    try:
+        ws.send(device_commands.command_frame(command))
+    except Exception as e:
+        print(f"[{command['device_id']}] FAILED to push command {command.get('seq')}: {e}")
+
+
+def command_listener():
+    """
+    Subscribes to the command channel and pushes every command to the board
+    if it is connected to this process. Meant to run in a background thread.
+    Resubscribes after a lost Redis connection (see extensions.listen_channel).
+    """
+    if redis_client is None:
+        print("Command listener: Cannot start, Redis client is not connected.")
+        return
+    listen_channel(redis_client, REDIS_COMMAND_CHANNEL, push_command, 'Command Listener')
+
+
 # --- Run the Server ---
 if __name__ == '__main__':
     # We run this server on a DIFFERENT port than the main web server
     # e.g., Web server runs on 5000, Sock server runs on 5001
     port = int(os.environ.get('SOCK_PORT', 5001))
     host = os.environ.get('SOCK_HOST', '0.0.0.0')
+
+    # GATEWAY_MODE=async: serve the boards with the asyncio gateway instead
+    # (one coroutine per board, for deployments with thousands of boards)
+    if os.environ.get('GATEWAY_MODE', 'threaded') == 'async':
+        import async_gateway
+        async_gateway.main()
+        raise SystemExit(0)
     
     print("--- Starting Hardware Sock Server ---")
+
+    # Push the web commands to the boards connected here
+    threading.Thread(target=command_listener, name='device-commands', daemon=True).start()
     print(f"Listening on ws://{host}:{port}")
     
     # Use a production-ready server like gevent or gunicorn in production
@@ -10,6 +10,18 @@ let courtSlots = {
 };
 let draggedPlayerId = null;
 
+// Gợi ý tự động: job chạy nền (api/suggestions.py), tiến độ nhận qua socket.io
+const SUGGESTION_DEBOUNCE_MS = 400;
+const SUGGESTION_POLL_MS = 1000;
+const suggestionClientId = Math.random().toString(36).slice(2);
+let selectedForSuggestion = new Set();
+let suggestionActive = false;
+let suggestionJobId = null;
+let suggestionJobFinished = false;
+let suggestionTimer = null;
+let currentSuggestions = [];
+let suggestionSocket = null;
+
 // === API CALLS ===
 async function apiCall(url, method = 'GET', body = null) {
     const options = { method, headers: { 'Content-Type': 'application/json' } };
@@ -48,7 +60,8 @@ function renderAvailablePlayerList() {
                 div.classList.add('on-court');
             }
 
-            div.innerHTML = `<label>${player.name} (Level: ${player.skill_level})</label>`;
+            const checked = selectedForSuggestion.has(player.id) ? 'checked' : '';
+            div.innerHTML = `<label><input type="checkbox" class="suggest-select" ${checked}> ${player.name} (Level: ${player.skill_level})</label>`;
             container.appendChild(div);
         });
 }
@@ -98,8 +111,116 @@ function updateUIStates() {
     renderCourt();
 }
 
+function renderSuggestions(suggestions) {
+    currentSuggestions = suggestions || [];
+    const container = document.getElementById('suggestion-list');
+    container.innerHTML = currentSuggestions.map((s, index) => `
+        <div class="player-select-item">
+            <strong>${s.court_name}</strong>: ${s.team_A.join(' & ')} vs ${s.team_B.join(' & ')}
+            <button class="button button--secondary suggestion-use-btn" data-index="${index}">Dùng</button>
+            <div><small>${s.reasoning || ''}</small></div>
+        </div>`).join('');
+}
+
+const SUGGESTION_STAGES = {
+    loading: 'Đang tải dữ liệu...',
+    scoring: 'Đang tính (kết quả tạm thời)...',
+    improving: 'Đang tối ưu (kết quả tạm thời)...',
+    assigning: 'Đang xếp sân (kết quả tạm thời)...',
+    ai: 'Đã có gợi ý nội bộ, đang chờ AI...',
+};
+
+function handleSuggestionJob(job) {
+    // Bỏ qua các job cũ (đã bị thay thế) và các trạng thái đến sau khi job đã kết thúc
+    if (!job || job.job_id !== suggestionJobId || suggestionJobFinished) return;
+    const status = document.getElementById('suggestion-status');
+    if (job.status === 'done') {
+        suggestionJobFinished = true;
+        const fromAI = job.result && job.result.source === 'ai';
+        status.textContent = job.suggestions.length === 0 ? 'Không có gợi ý (hết sân trống?)'
+            : fromAI ? 'Gợi ý từ AI' : 'Gợi ý từ thuật toán nội bộ';
+    } else if (job.status === 'failed' || job.status === 'cancelled') {
+        suggestionJobFinished = true;
+        status.textContent = job.status === 'failed' ? `Lỗi: ${job.error}` : 'Đã hủy.';
+    } else {
+        status.textContent = SUGGESTION_STAGES[job.stage] || 'Đang chờ...';
+    }
+    renderSuggestions(job.suggestions);
+}
+
+function suggestionJobRoom(jobId) {
+    return `suggestions:${jobId}`;
+}
+
+// Vào phòng riêng của job (rời phòng job cũ), rồi lấy trạng thái hiện tại một lần
+// cho các sự kiện đã gửi trước khi vào phòng
+function followSuggestionJob(jobId, previousJobId) {
+    if (previousJobId) suggestionSocket.emit('unsubscribe', { rooms: [suggestionJobRoom(previousJobId)] });
+    suggestionSocket.emit('subscribe', { rooms: [suggestionJobRoom(jobId)] }, async () => {
+        handleSuggestionJob(await apiCall(`/api/suggestions/jobs/${jobId}`));
+    });
+}
+
+async function pollSuggestionJob(jobId) {
+    while (jobId === suggestionJobId && !suggestionJobFinished) {
+        handleSuggestionJob(await apiCall(`/api/suggestions/jobs/${jobId}`));
+        await new Promise(resolve => setTimeout(resolve, SUGGESTION_POLL_MS));
+    }
+}
+
+async function startSuggestionJob() {
+    const playerIds = [...selectedForSuggestion];
+    document.getElementById('suggestion-panel').style.display = '';
+    if (playerIds.length < 4) {
+        if (suggestionJobId && !suggestionJobFinished) apiCall(`/api/suggestions/jobs/${suggestionJobId}`, 'DELETE');
+        suggestionJobId = null;
+        document.getElementById('suggestion-status').textContent = 'Chọn ít nhất 4 người chơi để gợi ý.';
+        renderSuggestions([]);
+        return;
+    }
+
+    // Job mới của cùng client_id hủy job cũ phía server
+    document.getElementById('suggestion-status').textContent = 'Đang tính gợi ý...';
+    const job = await apiCall('/api/suggestions/jobs', 'POST', { player_ids: playerIds, client_id: suggestionClientId });
+    if (!job) return;
+    const previousJobId = suggestionJobId;
+    suggestionJobId = job.job_id;
+    suggestionJobFinished = false;
+    if (suggestionSocket) {
+        followSuggestionJob(job.job_id, previousJobId);
+    } else {
+        pollSuggestionJob(job.job_id);
+    }
+}
+
+function scheduleSuggestionJob() {
+    if (!suggestionActive) return;
+    clearTimeout(suggestionTimer);
+    suggestionTimer = setTimeout(startSuggestionJob, SUGGESTION_DEBOUNCE_MS);
+}
+
 // === EVENT HANDLERS ===
 
+function handleSuggestionSelect(e) {
+    if (!e.target.classList.contains('suggest-select')) return;
+    const playerId = parseInt(e.target.closest('[data-player-id]').dataset.playerId, 10);
+    if (e.target.checked) {
+        selectedForSuggestion.add(playerId);
+    } else {
+        selectedForSuggestion.delete(playerId);
+    }
+    scheduleSuggestionJob();
+}
+
+function handleUseSuggestion(e) {
+    const button = e.target.closest('.suggestion-use-btn');
+    if (!button) return;
+    const suggestion = currentSuggestions[parseInt(button.dataset.index, 10)];
+    courtSlots.teamA = [...suggestion.team_A_ids];
+    courtSlots.teamB = [...suggestion.team_B_ids];
+    updateUIStates();
+}
+
 async function handleConfirmMatch() {
     const team_A = courtSlots.teamA.map(id => ({ id }));
     const team_B = courtSlots.teamB.map(id => ({ id }));
@@ -200,8 +321,24 @@ function initializeDragDropListeners() {
 export default async function init() {
     const players = await apiCall('/api/players/available');
     availablePlayers = players || [];
+    selectedForSuggestion = new Set(availablePlayers.map(p => p.id));
     
     document.getElementById('confirm-match-btn').addEventListener('click', handleConfirmMatch);
+    document.getElementById('suggest-start-btn').addEventListener('click', () => {
+        suggestionActive = true;
+        startSuggestionJob();
+    });
+    document.getElementById('player-list-container').addEventListener('change', handleSuggestionSelect);
+    document.getElementById('suggestion-list').addEventListener('click', handleUseSuggestion);
+
+    if (window.io) {
+        suggestionSocket = io();
+        // Sau khi kết nối lại: vào lại phòng của job đang chạy
+        suggestionSocket.on('connect', () => {
+            if (suggestionJobId && !suggestionJobFinished) followSuggestionJob(suggestionJobId);
+        });
+        suggestionSocket.on('suggestion_job', handleSuggestionJob);
+    }
     
     initializeDragDropListeners(); 
     
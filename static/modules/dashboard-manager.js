@@ -4,6 +4,14 @@
 let allPlayers = [];
 let socket;
 let scoreboardStates = {};
+let lastScoreSeq = {}; // device_id -> seq of the last score shown
+let scoreEpoch = null; // Redis epoch the seqs belong to (they restart at 1 in a new one)
+let ongoingMatches = [];
+let queuedMatches = [];
+let historyMatches = [];
+let matchStateVersion = null; // Version of the match state shown (see match_state_changed)
+let snapshotEtag = null; // ETag of the last /api/dashboard/snapshot received
+const DASHBOARD_HISTORY_SIZE = 10;
 
 // --- UTILITY FUNCTIONS ---
 
@@ -136,8 +144,7 @@ function renderDashboardHistory(matches) {
         container.innerHTML = '<div class="list-item-placeholder">No match history yet.</div>';
         return;
     }
-    const recentMatches = matches.slice(0, 10);
-    recentMatches.forEach(match => {
+    matches.forEach(match => {
         const div = document.createElement('div');
         div.className = 'history-item-v2';
         const teamAPlayers = match.team_A.map(p => p.name.split(' ').pop()).join(' & ');
@@ -200,19 +207,42 @@ function renderScoreboardManager(allBoards, allCourts) {
 
 // --- DATA & STATE MANAGEMENT ---
 
-async function refreshDashboard() {
-    const [players, ongoing, history, queued, boards] = await Promise.all([
-        apiCall('/api/players'),
-        apiCall('/api/matches/ongoing'),
-        apiCall('/api/matches/history'),
-        apiCall('/api/matches/queued'),
-        apiCall('/api/scoreboards')
-    ]);
+/**
+ * Fetches the whole dashboard in one request, conditional on the last ETag.
+ * @returns {Promise<object|null>} The snapshot, or null if nothing changed (304) or on error.
+ */
+async function fetchDashboardSnapshot() {
+    const headers = snapshotEtag ? { 'If-None-Match': snapshotEtag } : {};
+    try {
+        // no-store: the 304 must reach this code, not be answered by the browser cache
+        const response = await fetch(`/api/dashboard/snapshot?history=${DASHBOARD_HISTORY_SIZE}`, { headers, cache: 'no-store' });
+        if (response.status === 304) return null;
+        if (!response.ok) throw new Error(`Server error: ${response.status}`);
+        snapshotEtag = response.headers.get('ETag');
+        return await response.json();
+    } catch (error) {
+        console.error('Dashboard snapshot error:', error);
+        return null;
+    }
+}
 
-    allPlayers = players || [];
+async function refreshDashboard() {
+    const snapshot = await fetchDashboardSnapshot();
+    if (!snapshot) return; // Unchanged since the last snapshot (or error): keep the current state
+
+    matchStateVersion = snapshot.version;
+    allPlayers = snapshot.players;
+    ongoingMatches = snapshot.ongoing;
+    queuedMatches = snapshot.queued;
+    historyMatches = snapshot.history;
+    renderSessionStatus(snapshot.session);
     
+    // The seq marks start again from the snapshot (its epoch may be a new one)
+    scoreEpoch = snapshot.score_epoch;
+    lastScoreSeq = {};
     scoreboardStates = {};
-    (boards || []).forEach(board => {
+    snapshot.scoreboards.forEach(board => {
+        if (board.seq != null) lastScoreSeq[board.device_id] = board.seq;
         if(board.court_id) {
             scoreboardStates[board.court_id] = {
                 is_swapped: board.is_swapped,
@@ -222,18 +252,61 @@ async function refreshDashboard() {
         }
     });
     
+    renderMatchState();
+}
+
+function renderMatchState() {
     renderActivePlayers(allPlayers);
-    renderOngoingMatches(ongoing);
-    renderDashboardHistory(history);
-    renderQueuedMatches(queued);
+    renderOngoingMatches(ongoingMatches);
+    renderDashboardHistory(historyMatches);
+    renderQueuedMatches(queuedMatches);
 
-    // Initial score sync after render
+    // Score sync after render
     Object.keys(scoreboardStates).forEach(courtId => {
         const state = scoreboardStates[courtId];
         updateScoreDisplay(courtId, state.score_A, state.score_B);
     });
 }
 
+/**
+ * Patches the local state with a match_state_changed delta (changed match and player rows).
+ * @returns {boolean} false if the event type is unknown (the caller then refreshes everything).
+ */
+function applyMatchDelta(delta) {
+    (delta.players || []).forEach(player => {
+        const index = allPlayers.findIndex(p => p.id === player.id);
+        if (index >= 0) allPlayers[index] = player;
+        else allPlayers.push(player);
+    });
+
+    const started = (match) => {
+        queuedMatches = queuedMatches.filter(m => m.id !== match.id);
+        ongoingMatches = ongoingMatches.filter(m => m.id !== match.id).concat([match]).sort((a, b) => a.id - b.id);
+        if (scoreboardStates[match.court_id]) {
+            scoreboardStates[match.court_id].score_A = 0;
+            scoreboardStates[match.court_id].score_B = 0;
+        }
+    };
+    const finished = (match) => {
+        ongoingMatches = ongoingMatches.filter(m => m.id !== match.id);
+        historyMatches = [match].concat(historyMatches.filter(m => m.id !== match.id)).slice(0, DASHBOARD_HISTORY_SIZE);
+    };
+
+    if (delta.type === 'match_started') {
+        started(delta.match);
+    } else if (delta.type === 'match_finished') {
+        finished(delta.match);
+    } else if (delta.type === 'match_turnover') {
+        // Trận kết thúc và trận tiếp theo bắt đầu ngay trên cùng sân (AUTO_DISPATCH)
+        finished(delta.match);
+        started(delta.started_match);
+    } else {
+        return false;
+    }
+    renderMatchState();
+    return true;
+}
+
 function updateScoreDisplay(courtId, scoreA, scoreB) {
     const isSwapped = scoreboardStates[courtId]?.is_swapped || false;
     const scoreAEl = document.getElementById(`score-a-${courtId}`);
@@ -252,7 +325,6 @@ async function handleStartSession() {
         const result = await apiCall('/api/sessions/start', 'POST');
         if (result) {
             alert(result.message);
-            await checkSessionStatus();
             await refreshDashboard();
         }
     }
@@ -263,17 +335,15 @@ async function handleEndSession() {
         const result = await apiCall('/api/sessions/end', 'POST');
         if (result) {
             alert(result.message);
-            await checkSessionStatus();
             await refreshDashboard();
         }
     }
 }
 
-async function checkSessionStatus() {
+function renderSessionStatus(session) {
     const statusText = document.getElementById('session-status-text');
     const buttonsContainer = document.getElementById('session-action-buttons');
     buttonsContainer.innerHTML = '';
-    const session = await apiCall('/api/sessions/current');
 
     if (session) {
         const startTime = new Date(session.start_time).toLocaleString('vi-VN');
@@ -455,16 +525,36 @@ async function openScoreboardManager() {
 function connectWebSocket() {
     socket = io();
 
-    socket.on('connect', () => console.log('✅ Connected to web server via Socket.IO!'));
+    // Rooms are per connection: join again after every (re)connection.
+    // The dashboard renders every court, so it only needs the 'dashboard' room.
+    socket.on('connect', () => {
+        console.log('✅ Connected to web server via Socket.IO!');
+        socket.emit('subscribe', { rooms: ['dashboard'] });
+    });
+    // Events may have been missed while disconnected
+    socket.io.on('reconnect', () => refreshDashboard());
     
     // Listen for score updates (from device OR web UI)
+    // The device listener sends batches ({updates: [...]}), the API single updates
     socket.on('score_updated', (data) => {
         console.log('EVENT [score_updated]:', data);
-        if (scoreboardStates[data.court_id]) {
-            scoreboardStates[data.court_id].score_A = data.score_A;
-            scoreboardStates[data.court_id].score_B = data.score_B;
-        }
-        updateScoreDisplay(data.court_id, data.score_A, data.score_B);
+        (data.updates || [data]).forEach(update => {
+            // The server's seq counters restarted (Redis lost its keys): forget the old marks
+            if (update.epoch && update.epoch !== scoreEpoch) {
+                scoreEpoch = update.epoch;
+                lastScoreSeq = {};
+            }
+            // Events can arrive out of order (device vs web UI): ignore older ones
+            if (update.seq != null && update.device_id) {
+                if (update.seq <= (lastScoreSeq[update.device_id] || 0)) return;
+                lastScoreSeq[update.device_id] = update.seq;
+            }
+            if (scoreboardStates[update.court_id]) {
+                scoreboardStates[update.court_id].score_A = update.score_A;
+                scoreboardStates[update.court_id].score_B = update.score_B;
+            }
+            updateScoreDisplay(update.court_id, update.score_A, update.score_B);
+        });
     });
     
     // Listen for swap state changes
@@ -476,10 +566,16 @@ function connectWebSocket() {
         }
     });
 
-    // Listen for general match state changes (begin/finish)
+    // Listen for match state deltas (begin/finish): patch the local state,
+    // refresh everything only when a version is missing
     socket.on('match_state_changed', (data) => {
-        console.log(`EVENT [match_state_changed]: ${data.message}`);
-        refreshDashboard(); // The simplest way to update the entire UI
+        console.log(`EVENT [match_state_changed]: ${data.message}`, data);
+        if (matchStateVersion !== null && data.version <= matchStateVersion) return; // Already loaded
+        if (matchStateVersion !== null && data.version === matchStateVersion + 1 && applyMatchDelta(data)) {
+            matchStateVersion = data.version;
+            return;
+        }
+        refreshDashboard();
     });
     
     socket.on('disconnect', () => console.log('❌ Disconnected from web server.'));
@@ -489,7 +585,6 @@ function connectWebSocket() {
 
 export default function init() {
     // Initial data load
-    checkSessionStatus();
     refreshDashboard();
     
     // Connect to WebSocket
@@ -498,7 +593,8 @@ export default function init() {
     // Bind all event listeners
     document.getElementById('manage-courts-btn').addEventListener('click', () => { window.location.href = '/manage-courts'; });
     document.getElementById('suggest-btn').addEventListener('click', () => { window.location.href = '/create'; });
-    document.getElementById('export-history-btn').addEventListener('click', () => { window.location.href = '/history'; });
+    // Tải file CSV do server stream (không tải toàn bộ lịch sử vào trình duyệt)
+    document.getElementById('export-history-btn').addEventListener('click', () => { window.location.href = '/api/matches/history/export?format=csv'; });
     document.getElementById('manage-scoreboards-btn').addEventListener('click', openScoreboardManager);
 
     const attendanceModal = document.getElementById('attendance-modal');
@@ -35,11 +35,22 @@ function populatePlayerDetailModal(player) {
     document.getElementById('player-detail-modal').style.display = 'block';
 }
 
-/** [CẬP NHẬT] Hàm render danh sách lịch sử */
-function renderHistoryList(matches) {
+// Trạng thái phân trang: cursor của trang kế tiếp (null = đã hết)
+const HISTORY_PAGE_SIZE = 30;
+let nextCursor = null;
+
+/**
+ * [CẬP NHẬT] Hàm render danh sách lịch sử (append = nối thêm vào cuối danh sách,
+ * prepend = chèn lên đầu, dùng cho trận vừa kết thúc)
+ */
+function renderHistoryList(matches, append = false, prepend = false) {
     const container = document.getElementById('history-list-container');
-    container.innerHTML = '';
-    if (!matches || matches.length === 0) {
+    if (prepend) {
+        container.querySelector('.list-item-placeholder')?.remove();
+        append = true;
+    }
+    if (!append) container.innerHTML = '';
+    if (!append && (!matches || matches.length === 0)) {
         container.innerHTML = '<div class="list-item-placeholder">Chưa có trận đấu nào trong lịch sử.</div>';
         return;
     }
@@ -68,7 +79,8 @@ function renderHistoryList(matches) {
                 <div class="vs-separator"><span class="score-display">${match.score_A} - ${match.score_B}</span></div>
                 ${renderTeam(match.team_B, 'B')}
             </div>`;
-        container.appendChild(card);
+        if (prepend) container.prepend(card);
+        else container.appendChild(card);
     });
 }
 
@@ -83,15 +95,43 @@ async function handlePlayerNameClick(event) {
     }
 }
 
-async function fetchAndRenderHistory() {
-    const historyData = await apiCall('/api/matches/history');
-    if (historyData) renderHistoryList(historyData);
+/** [CẬP NHẬT] Tải một trang lịch sử; append = true để tải tiếp trang sau */
+async function fetchAndRenderHistory(append = false) {
+    const params = new URLSearchParams({ limit: HISTORY_PAGE_SIZE });
+    if (append && nextCursor) params.set('cursor', nextCursor);
+
+    const loadMoreBtn = document.getElementById('history-load-more-btn');
+    if (loadMoreBtn) loadMoreBtn.disabled = true;
+
+    const historyData = await apiCall(`/api/matches/history?${params}`);
+    if (historyData) {
+        renderHistoryList(historyData.matches, append);
+        nextCursor = historyData.next_cursor;
+    }
+
+    if (loadMoreBtn) {
+        loadMoreBtn.disabled = false;
+        loadMoreBtn.style.display = nextCursor ? '' : 'none';
+    }
 }
 
 /** [CẬP NHẬT] Hàm khởi tạo */
 export default function init() {
     fetchAndRenderHistory();
 
+    const loadMoreBtn = document.getElementById('history-load-more-btn');
+    if (loadMoreBtn) loadMoreBtn.addEventListener('click', () => fetchAndRenderHistory(true));
+
+    // Trận vừa kết thúc được chèn lên đầu danh sách (chỉ nhận sự kiện của room 'history')
+    if (window.io) {
+        const socket = io();
+        socket.on('connect', () => socket.emit('subscribe', { rooms: ['history'] }));
+        socket.on('match_state_changed', (data) => {
+            const finished = data.type === 'match_finished' || data.type === 'match_turnover';
+            if (finished && data.match) renderHistoryList([data.match], false, true);
+        });
+    }
+
     // Sử dụng event delegation để xử lý click hiệu quả
     document.getElementById('history-list-container').addEventListener('click', handlePlayerNameClick);
 
@@ -0,0 +1,159 @@
+import os
+import shutil
+import sqlite3
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The modules live at the repository root (no package)
+sys.path.insert(0, ROOT)
+
+import database  # noqa: E402
+import migrations  # noqa: E402
+
+# Scratch database of the Redis server of the app: it is flushed by the tests
+TEST_REDIS_URL = os.environ.get('TEST_REDIS_URL', 'redis://localhost:7777/15')
+
+# Modules holding a Redis client (None = the SQLite / in-process fallbacks)
+REDIS_MODULES = ('live_scores', 'match_events', 'device_commands', 'device_routing', 'settings_cache', 'score_stream')
+
+
+def _reset_process_caches(monkeypatch):
+    import device_routing
+    import live_scores
+    import logic
+    import next_match
+    import settings_cache
+
+    settings_cache.invalidate()
+    logic.invalidate_pair_history_cache()
+    next_match._reset()
+    monkeypatch.setattr(device_routing, '_routes', {})
+    monkeypatch.setattr(device_routing, '_loaded', False)
+    monkeypatch.setattr(live_scores, '_high_water', {})
+    monkeypatch.setattr(live_scores, '_local_seq', {})
+    monkeypatch.setattr(live_scores, '_epoch', None)
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """
+    A migrated copy of badminton.db served by database.pool, with an active
+    session, no match in play, every player absent and no Redis. Yields an
+    autocommit connection to the copy.
+    """
+    path = tmp_path / 'badminton.db'
+    shutil.copy(os.path.join(ROOT, 'badminton.db'), path)
+    conn = sqlite3.connect(path)
+    conn.isolation_level = None  # migrate() manages its own transactions
+    migrations.migrate(conn)
+    conn.execute("UPDATE matches SET status = 'finished' WHERE status IN ('ongoing', 'queued')")
+    conn.execute("UPDATE sessions SET status = 'finished'")
+    conn.execute("INSERT INTO sessions (status) VALUES ('active')")
+    conn.execute('UPDATE players SET is_active = 0, consecutive_matches = 0')
+
+    for name in REDIS_MODULES:
+        monkeypatch.setattr(sys.modules.get(name) or __import__(name), 'redis_client', None)
+    monkeypatch.setattr(database, 'pool', database.ConnectionPool(str(path), 2))
+    _reset_process_caches(monkeypatch)
+    yield conn
+    conn.close()
+    _reset_process_caches(monkeypatch)
+
+
+@pytest.fixture
+def redis_db(monkeypatch):
+    """A flushed scratch Redis database used by live_scores / score_stream (skips without Redis)."""
+    import redis
+
+    client = redis.Redis.from_url(TEST_REDIS_URL, decode_responses=True)
+    try:
+        client.ping()
+    except redis.exceptions.ConnectionError:
+        pytest.skip(f"Redis is not reachable at {TEST_REDIS_URL}")
+    client.flushdb()
+    for name in ('live_scores', 'score_stream'):
+        monkeypatch.setattr(__import__(name), 'redis_client', client)
+    yield client
+    client.flushdb()
+
+
+def activate_players(conn, count):
+    """Marks the first `count` players present; returns their ids."""
+    ids = [row[0] for row in conn.execute('SELECT id FROM players ORDER BY id LIMIT ?', (count,))]
+    conn.execute(f"UPDATE players SET is_active = 1 WHERE id IN ({','.join('?' for _ in ids)})", ids)
+    return ids
+
+
+def set_setting(conn, key, value):
+    import settings_cache
+
+    conn.execute('INSERT INTO settings (key, value) VALUES (?, ?) '
+                  'ON CONFLICT(key) DO UPDATE SET value = excluded.value', (key, str(value)))
+    settings_cache.invalidate()
+
+
+def api_client(*blueprints):
+    """Test client of a Flask app serving `blueprints` under /api (socket.io events go nowhere)."""
+    from flask import Flask
+    from extensions import socketio
+
+    app = Flask(__name__)
+    for blueprint in blueprints:
+        app.register_blueprint(blueprint, url_prefix='/api')
+    app.teardown_appcontext(database.close_db)
+    socketio.init_app(app)
+    return app.test_client()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """The backoff delays of extensions.listen_channel (not actually slept)."""
+    import extensions
+
+    delays = []
+    monkeypatch.setattr(extensions.time, 'sleep', delays.append)
+    return delays
+
+
+class Done(Exception):
+    pass
+
+
+class ScriptedClient:
+    """
+    Stands in for a Redis client whose connection drops: each pubsub() plays
+    the next session, an exception (subscribe fails) or a list of messages
+    and exceptions. Raises Done once every session was played.
+    """
+
+    def __init__(self, *sessions):
+        self.sessions = list(sessions)
+        self.subscriptions = 0
+
+    def pubsub(self):
+        if not self.sessions:
+            raise Done()
+        return ScriptedPubSub(self, self.sessions.pop(0))
+
+
+class ScriptedPubSub:
+    def __init__(self, client, session):
+        self.client, self.session = client, session
+
+    def subscribe(self, channel):
+        if isinstance(self.session, Exception):
+            raise self.session
+        self.client.subscriptions += 1
+
+    def listen(self):
+        yield {'type': 'subscribe', 'data': 1}
+        for item in self.session:
+            if isinstance(item, Exception):
+                raise item
+            yield {'type': 'message', 'data': item}
+
+    def close(self):
+        pass
@@ -0,0 +1,67 @@
+import asyncio
+import json
+
+import pytest
+
+import async_gateway
+import score_stream
+from conftest import TEST_REDIS_URL
+
+
+class Board:
+    """Stands in for a board's websocket: yields `frames`, records what is sent back."""
+
+    remote_address = ('10.0.0.7', 40000)
+
+    def __init__(self, frames):
+        self.frames = [frame if isinstance(frame, str) else json.dumps(frame) for frame in frames]
+        self.sent = []
+
+    def __aiter__(self):
+        return self._frames()
+
+    async def _frames(self):
+        for frame in self.frames:
+            yield frame
+
+    async def send(self, frame):
+        self.sent.append(frame)
+
+
+def run_gateway(frames):
+    """Feeds `frames` to a gateway on the scratch Redis database and publishes what was queued."""
+    import redis.asyncio as aioredis
+
+    async def scenario():
+        client = aioredis.from_url(TEST_REDIS_URL, decode_responses=True)
+        try:
+            gateway = async_gateway.DeviceGateway(client)
+            await gateway.handle(Board(frames))
+            publisher = asyncio.create_task(gateway.publisher())
+            while not gateway.queue.empty() or not gateway.totals['published']:
+                await asyncio.sleep(0.01)
+            publisher.cancel()
+            return gateway.totals
+        finally:
+            await client.aclose()
+    return asyncio.run(asyncio.wait_for(scenario(), 5))
+
+
+# --- Score validation before queueing (user-016) ---
+
+def test_bad_scores_are_counted_and_do_not_sink_the_batch(redis_db):
+    totals = run_gateway([
+        {'device_id': 'SB-1'},
+        {'score_A': 1, 'score_B': 0},
+        {'score_A': None, 'score_B': 0},
+        {'score_A': 'abc', 'score_B': 0},
+        {'score_A': 2, 'score_B': -1},
+        'not json',
+        {'score_A': '2', 'score_B': 0},
+    ])
+
+    assert (totals['scores'], totals['invalid_frames'], totals['publish_errors']) == (2, 4, 0)
+    assert totals['published'] == 2
+    entries = redis_db.xrange(score_stream.REDIS_SCOREBOARD_STREAM)
+    assert [(fields['score_A'], fields['score_B'], fields['seq']) for _, fields in entries] == \
+        [('1', '0', '1'), ('2', '0', '2')]
@@ -0,0 +1,53 @@
+import pytest
+
+import live_scores
+import match_events
+from api import dashboard
+from conftest import api_client
+
+
+@pytest.fixture
+def api(db):
+    return api_client(dashboard.dashboard_api)
+
+
+def snapshot(api, etag=None, **args):
+    headers = {'If-None-Match': etag} if etag else {}
+    return api.get('/api/dashboard/snapshot', query_string=args, headers=headers)
+
+
+# --- Conditional dashboard snapshot (user-020) ---
+
+def test_snapshot_holds_every_list_and_is_revalidated_with_its_etag(api):
+    response = snapshot(api, history=3)
+    body = response.get_json()
+    assert {'session', 'ongoing', 'queued', 'history', 'courts', 'players', 'available_players',
+            'scoreboards', 'version', 'score_epoch'} <= set(body)
+    assert len(body['history']) == 3
+    assert response.headers['Cache-Control'] == 'no-cache'
+
+    unchanged = snapshot(api, response.headers['ETag'], history=3)
+    assert unchanged.status_code == 304 and unchanged.headers['ETag'] == response.headers['ETag']
+
+
+def test_etag_depends_on_the_history_size(api):
+    etag = snapshot(api, history=3).headers['ETag']
+    other = snapshot(api, etag, history=5)
+    assert other.status_code == 200 and other.headers['ETag'] != etag
+    assert len(other.get_json()['history']) == 5
+
+
+def test_etag_changes_with_the_state_version_and_the_live_scores(api):
+    etag = snapshot(api).headers['ETag']
+    match_events.bump_version()
+    response = snapshot(api, etag)
+    assert response.status_code == 200
+
+    etag = response.headers['ETag']
+    live_scores.set_scores('SB-001', 1, 0)  # The board of a court
+    assert snapshot(api, etag).status_code == 200
+
+
+def test_invalid_history_size_is_rejected(api):
+    response = snapshot(api, history='ten')
+    assert response.status_code == 400 and 'error' in response.get_json()
@@ -0,0 +1,28 @@
+import pytest
+import redis
+
+import device_commands
+from conftest import Done, ScriptedClient
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(device_commands, '_in_flight', {})
+    monkeypatch.setattr(device_commands, '_last_acked_seq', {})
+
+
+def ack(device_id, seq):
+    return device_commands.ack_message(device_id, seq)
+
+
+# --- Listeners reconnect (user-017) ---
+
+def test_ack_listener_keeps_recording_after_a_lost_connection(sleeps, monkeypatch):
+    lost = redis.ConnectionError('Connection reset by peer')
+    monkeypatch.setattr(device_commands, 'redis_client',
+                        ScriptedClient([ack('SB-1', 1), lost], lost, [ack('SB-1', 3), 'not json', ack('SB-2', 1)]))
+
+    with pytest.raises(Done):
+        device_commands.ack_listener()
+    assert device_commands.stats()['last_acked_seq'] == {'SB-1': 3, 'SB-2': 1}
+
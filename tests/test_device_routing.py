@@ -0,0 +1,40 @@
+import json
+
+import pytest
+import redis
+
+import device_routing
+import settings_cache
+from conftest import Done, ScriptedClient
+
+
+@pytest.fixture
+def routes(db):
+    device_routing.warm()
+    assert device_routing.lookup('SB-001') == (2, True)
+    return db
+
+
+def test_changes_of_other_processes_are_applied(routes):
+    device_routing._on_change(json.dumps({'op': 'set_swapped', 'court_id': 2, 'is_swapped': False,
+                                          'origin': settings_cache.PROCESS_ID}))
+    assert device_routing.lookup('SB-001') == (2, True)  # Its own change, already applied
+
+    device_routing._on_change(json.dumps({'op': 'set_swapped', 'court_id': 2, 'is_swapped': False,
+                                          'origin': 'another-process'}))
+    assert device_routing.lookup('SB-001') == (2, False)
+    device_routing._on_change('{"op": "unknown"')  # Ignored
+    assert device_routing.lookup('SB-001') == (2, False)
+
+
+# --- Listener reconnects (user-013) ---
+
+def test_table_is_reloaded_after_a_lost_subscription(routes, sleeps, monkeypatch):
+    # Committed by another process while this one was disconnected: the message is missed
+    routes.execute("UPDATE scoreboards SET court_id = 3 WHERE device_id = 'SB-001'")
+    lost = redis.ConnectionError('Connection reset by peer')
+    monkeypatch.setattr(device_routing, 'redis_client', ScriptedClient([lost], []))
+
+    with pytest.raises(Done):
+        device_routing.change_listener()
+    assert device_routing.court_of('SB-001') == 3
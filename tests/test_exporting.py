@@ -0,0 +1,59 @@
+import csv
+import io
+import json
+
+import pytest
+
+import exporting
+from api import matches, players
+from conftest import api_client
+
+
+@pytest.fixture
+def api(db):
+    return api_client(matches.matches_api, players.players_api)
+
+
+def read_csv(response):
+    text = response.get_data(as_text=True)
+    assert text.startswith('\ufeff')  # BOM for Excel
+    return list(csv.DictReader(io.StringIO(text[1:])))
+
+
+def test_history_export_matches_the_paginated_history(db, api):
+    history = api.get('/api/matches/history/', query_string={'limit': 200}).get_json()['matches']
+
+    response = api.get('/api/matches/history/export')
+    assert response.content_type.startswith('text/csv')
+    assert 'match_history.csv' in response.headers['Content-Disposition']
+    rows = read_csv(response)
+    assert [int(row['id']) for row in rows] == [match['id'] for match in history]
+    assert list(rows[0]) == matches.HISTORY_EXPORT_FIELDS
+    assert rows[0]['team_A'] == ' & '.join(player['name'] for player in history[0]['team_A'])
+
+    response = api.get('/api/matches/history/export', query_string={'format': 'ndjson'})
+    assert response.content_type.startswith('application/x-ndjson')
+    assert [json.loads(line) for line in response.get_data(as_text=True).splitlines()] == history
+
+
+def test_history_export_applies_the_filters(db, api):
+    player_id = db.execute('SELECT player_id FROM match_players ORDER BY match_id LIMIT 1').fetchone()[0]
+    expected = api.get('/api/matches/history/', query_string={'player_id': player_id, 'limit': 200}).get_json()
+    rows = read_csv(api.get('/api/matches/history/export', query_string={'player_id': player_id}))
+    assert [int(row['id']) for row in rows] == [match['id'] for match in expected['matches']] != []
+
+
+def test_players_export_streams_every_player(db, api, monkeypatch):
+    monkeypatch.setattr(exporting, 'CHUNK_ROWS', 2)  # Several chunks
+    names = [name for name, in db.execute('SELECT name FROM players ORDER BY name ASC')]
+
+    response = api.get('/api/players/export', query_string={'format': 'ndjson'})
+    assert response.is_streamed
+    assert [json.loads(line)['name'] for line in response.get_data(as_text=True).splitlines()] == names
+    assert [row['name'] for row in read_csv(api.get('/api/players/export'))] == names
+
+
+def test_unknown_export_format_is_rejected(db, api):
+    for url in ('/api/matches/history/export', '/api/players/export'):
+        response = api.get(url, query_string={'format': 'xlsx'})
+        assert response.status_code == 400 and 'error' in response.get_json()
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+import redis
+
+import extensions
+import settings_cache
+from conftest import Done, ScriptedClient
+
+
+def listen(client, **kwargs):
+    received, reconnects = [], []
+    with pytest.raises(Done):
+        extensions.listen_channel(client, 'chan', received.append, 'Test',
+                                  on_reconnect=lambda: reconnects.append(len(received)), **kwargs)
+    return received, reconnects
+
+
+# --- Pub/Sub listeners reconnect (user-003) ---
+
+def test_listener_resubscribes_after_a_lost_connection(sleeps):
+    lost = redis.ConnectionError('Connection reset by peer')
+    client = ScriptedClient(['a', lost], lost, lost, ['b', 'c'])
+
+    received, reconnects = listen(client)
+    assert received == ['a', 'b', 'c']
+    assert client.subscriptions == 2
+    # Backoff while Redis is down, reset once subscribed again
+    assert sleeps == [0.5, 1.0, 2.0, 0.5]
+    # The local cache is dropped once, when subscribed again (before the next message)
+    assert reconnects == [1]
+
+
+def test_backoff_is_capped(sleeps):
+    lost = redis.ConnectionError('Connection refused')
+    listen(ScriptedClient(*[lost] * 10))
+    assert max(sleeps) == extensions.PUBSUB_RECONNECT_MAX_DELAY
+
+
+def test_settings_are_dropped_on_reconnect_and_on_other_processes_messages(db, sleeps, monkeypatch):
+    settings_cache.get_settings()
+    assert settings_cache._snapshot is not None
+    settings_cache._on_invalidation(json.dumps({'origin': settings_cache.PROCESS_ID}))
+    assert settings_cache._snapshot is not None  # Its own message
+
+    settings_cache._on_invalidation(json.dumps({'origin': 'another-process'}))
+    assert settings_cache._snapshot is None
+
+    settings_cache.get_settings()
+    lost = redis.ConnectionError('Connection reset by peer')
+    monkeypatch.setattr(settings_cache, 'redis_client', ScriptedClient([lost], []))
+    with pytest.raises(Done):
+        settings_cache.invalidation_listener()
+    assert settings_cache._snapshot is None
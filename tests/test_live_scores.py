@@ -0,0 +1,67 @@
+import pytest
+
+import live_scores
+import score_stream
+
+
+@pytest.fixture
+def client(redis_db):
+    return redis_db
+
+
+def test_stale_and_duplicate_scores_are_dropped(client):
+    assert live_scores.set_many({'dev-1': (1, 0)}, seqs={'dev-1': 5}) == {'dev-1': 5}
+    assert live_scores.set_many({'dev-1': (2, 0)}, seqs={'dev-1': 5}) == {}
+    assert live_scores.set_many({'dev-1': (0, 0)}, seqs={'dev-1': 3}) == {}
+    assert client.hget(live_scores._key('dev-1'), 'score_A') == '1'
+
+
+def test_marks_reset_when_redis_lost_its_keys(client):
+    for point in range(1, 6):
+        live_scores.set_scores('dev-1', point, 0)
+    assert live_scores._high_water['dev-1'][0] == 5
+
+    client.flushdb()  # Restart without persistence: the seq counters restart at 1
+    seq = client.incr(score_stream.seq_key('dev-1'))  # Taken by the score stream
+    assert live_scores.set_many({'dev-1': (1, 0)}, seqs={'dev-1': seq}) == {'dev-1': 1}
+    assert live_scores.set_scores('dev-1', 2, 0) == 2
+    assert client.hget(live_scores._key('dev-1'), 'score_A') == '2'
+    # The order still holds in the new epoch
+    assert live_scores.set_many({'dev-1': (0, 0)}, seqs={'dev-1': 1}) == {}
+
+
+def test_mark_reset_when_the_seq_counter_restarts(client):
+    for point in range(1, 4):
+        live_scores.set_scores('dev-1', point, 0)
+    live_scores.set_scores('dev-2', 7, 7)
+
+    client.delete(score_stream.seq_key('dev-1'), live_scores._key('dev-1'))
+    assert live_scores.set_scores('dev-1', 1, 0) == 1
+    assert live_scores._high_water['dev-1'][0] == 1
+    assert live_scores._high_water['dev-2'][0] == 1
+
+
+def test_corrupt_live_scores_are_skipped_and_the_checkpoint_completes(db, redis_db):
+    live_scores.set_scores('SB-001', 4, 2)
+    redis_db.hset(live_scores._key('SB-BAD'), mapping={'score_A': 'abc', 'score_B': '1'})
+    redis_db.sadd(live_scores.DIRTY_KEY, 'SB-BAD')
+
+    assert live_scores.get_many(['SB-001', 'SB-BAD']) == {'SB-001': (4, 2)}
+    assert live_scores.checkpoint() == 1
+    assert not redis_db.exists(live_scores.FLUSHING_KEY)
+    assert db.execute("SELECT score_A, score_B FROM scoreboards WHERE device_id = 'SB-001'").fetchone() == (4, 2)
+    assert db.execute("SELECT COUNT(*) FROM scoreboards WHERE device_id = 'SB-BAD'").fetchone() == (0,)
+
+
+# --- Seq marks of the clients (user-018) ---
+
+def test_boards_carry_the_seq_and_the_epoch_changes_with_the_counters(client):
+    live_scores.set_scores('SB-001', 3, 1)
+    first = live_scores.epoch()
+    boards = live_scores.overlay([{'device_id': 'SB-001', 'score_A': 0, 'score_B': 0},
+                                  {'device_id': 'SB-OFF', 'score_A': 2, 'score_B': 2}])
+    assert [(b['score_A'], b['score_B'], b['seq']) for b in boards] == [(3, 1, 1), (2, 2, None)]
+
+    client.flushdb()  # The seq counters restart at 1: clients must drop their marks
+    assert live_scores.set_scores('SB-001', 1, 0) == 1
+    assert live_scores.epoch() not in (None, first)
@@ -0,0 +1,176 @@
+import itertools
+import random
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import logic
+import settings_cache
+
+SETTINGS = dict(settings_cache.DEFAULTS)
+ALL_RULES = {'prioritize_rest': True, 'prioritize_low_games': True, 'avoid_rematch': True}
+NOW = datetime(2025, 10, 14, 20, 0, 0)
+
+
+def make_players(count, seed=0):
+    rng = random.Random(seed)
+    players = []
+    for i in range(1, count + 1):
+        played = rng.randrange(4)
+        last_played = (NOW - timedelta(seconds=rng.randrange(60, 3600))).isoformat(sep=' ') if played else None
+        players.append({
+            'id': i, 'name': f'P{i}', 'gender': rng.choice(('Nam', 'Nữ')), 'skill_level': 3,
+            'elo_rating': 1200 + rng.randrange(600), 'session_matches_played': played,
+            'session_last_played': last_played, 'consecutive_matches': 0, 'is_active': 1,
+        })
+    return players
+
+
+def make_pair_history(players, seed=0):
+    rng = random.Random(seed)
+    history = {}
+    for _ in range(len(players) * 2):
+        p1, p2 = sorted(rng.sample([p['id'] for p in players], 2))
+        history[(p1, p2)] = history.get((p1, p2), 0) + 1
+    return history
+
+
+def make_courts(count):
+    return [{'id': i, 'name': f'Sân {i}'} for i in range(1, count + 1)]
+
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch):
+    """Default settings and an empty pair history, without a database."""
+    monkeypatch.setattr(logic, 'load_settings', lambda: dict(SETTINGS))
+    monkeypatch.setattr(logic, '_pair_history_cache', {})
+
+
+def assert_valid_plan(suggestions, players, courts):
+    ids = {p['id'] for p in players}
+    seen = set()
+    for suggestion, court in zip(suggestions, courts):
+        assert suggestion['court_id'] == court['id']
+        members = [p['id'] for p in suggestion['team_A'] + suggestion['team_B']]
+        assert len(suggestion['team_A']) == len(suggestion['team_B']) == 2
+        assert set(members) <= ids and not seen.intersection(members)
+        seen.update(members)
+
+
+# --- Fast engine (user-001) ---
+
+def test_fast_engine_fills_every_court_with_the_same_score_terms(monkeypatch):
+    players, courts = make_players(60), make_courts(8)
+    monkeypatch.setattr(logic, '_pair_history_cache', make_pair_history(players))
+    plan = logic.plan_matches(players, courts, dict(ALL_RULES, engine='fast'), None)
+
+    assert plan['engine'] == 'fast'
+    assert len(plan['suggestions']) == len(courts)
+    assert_valid_plan(plan['suggestions'], players, courts)
+    # Same shape and same scoring as the exhaustive engine
+    assert set(plan['suggestions'][0]) == {'court_id', 'court_name', 'team_A', 'team_B', 'balance_score'}
+    now = datetime.now()
+    for suggestion in plan['suggestions']:
+        group = suggestion['team_A'] + suggestion['team_B']
+        score, _ = logic.score_group(group, SETTINGS, ALL_RULES, now, logic._pair_history_cache)
+        assert suggestion['balance_score'] == pytest.approx(round(score, 2), abs=0.02)
+
+
+def test_auto_engine_switches_to_fast_on_large_groups():
+    assert logic._select_engine({'engine': 'auto'}, 12) == 'exhaustive'
+    assert logic._select_engine({'engine': 'auto'}, 60) == 'fast'
+
+
+def test_requested_exhaustive_engine_is_capped():
+    # The engine comes from the request body: C(200, 4) groups must never be built
+    assert logic._select_engine({'engine': 'exhaustive'}, 12) == 'exhaustive'
+    assert logic._select_engine({'engine': 'exhaustive'}, 200) == 'fast'
+    assert logic._select_engine({'engine': 'fast'}, 12) == 'fast'
+    plan = logic.plan_matches(make_players(200), make_courts(4), dict(ALL_RULES, engine='exhaustive'), None)
+    assert plan['engine'] == 'fast' and len(plan['suggestions']) == 4
+
+
+def test_fast_engine_handles_200_players_and_20_courts_under_100ms():
+    players, courts = make_players(200), make_courts(20)
+    rules = dict(ALL_RULES, engine='fast')
+    timings = []
+    for _ in range(3):
+        started = time.perf_counter()
+        plan = logic.plan_matches(players, courts, rules, None)
+        timings.append(time.perf_counter() - started)
+    assert len(plan['suggestions']) == 20
+    assert_valid_plan(plan['suggestions'], players, courts)
+    assert min(timings) < 0.1, timings
+
+
+# --- Vectorized NumPy scoring (user-004) ---
+
+RULE_SETS = [
+    {},
+    {'prioritize_rest': True},
+    {'prioritize_low_games': True},
+    {'avoid_rematch': True},
+    ALL_RULES,
+]
+
+
+@pytest.mark.parametrize('rules', RULE_SETS)
+def test_vectorized_scores_match_the_scalar_path(rules):
+    pytest.importorskip('numpy')
+    players = make_players(14, seed=4)
+    for p in players[::3]:
+        p['elo_rating'] = 1500  # Ties between pairings: the same pairing must be picked
+    history = make_pair_history(players, seed=4)
+    groups = [list(members) for members in itertools.combinations(range(len(players)), 4)]
+
+    batch = logic._make_scorer(players, SETTINGS, rules, NOW, history)(groups)
+    for members, (score, pairing) in zip(groups, batch):
+        expected_score, expected_pairing = logic.score_group([players[i] for i in members], SETTINGS, rules, NOW, history)
+        assert score == expected_score
+        assert pairing == expected_pairing
+
+
+def test_vectorized_exhaustive_order_matches_the_scalar_path(monkeypatch):
+    pytest.importorskip('numpy')
+    players = make_players(12, seed=5)
+    history = make_pair_history(players, seed=5)
+    vectorized = list(logic._groups_exhaustive(players, SETTINGS, ALL_RULES, NOW, history))
+    monkeypatch.setattr(logic, 'np', None)
+    scalar = logic._groups_exhaustive(players, SETTINGS, ALL_RULES, NOW, history)
+
+    assert [g['members'] for g in vectorized] == [g['members'] for g in scalar]
+    assert [g['score'] for g in vectorized] == [g['score'] for g in scalar]
+
+
+# --- Optimal court assignment (user-005) ---
+
+def best_total_by_brute_force(groups, num_matches):
+    best = float('inf')
+    for combo in itertools.combinations(groups, num_matches):
+        members = [i for group in combo for i in group['members']]
+        if len(set(members)) == len(members):
+            best = min(best, sum(group['score'] for group in combo))
+    return best
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_assignment_is_optimal_over_disjoint_groups(monkeypatch, seed):
+    players, courts = make_players(10, seed=seed), make_courts(2)
+    monkeypatch.setattr(logic, '_pair_history_cache', make_pair_history(players, seed=seed))
+    plan = logic.plan_matches(players, courts, dict(ALL_RULES, engine='exhaustive'), None)
+
+    assert plan['optimal'] is True
+    assert_valid_plan(plan['suggestions'], players, courts)
+    groups = list(logic._groups_exhaustive(players, SETTINGS, ALL_RULES, datetime.now(), logic._pair_history_cache))
+    assert plan['objective'] == pytest.approx(best_total_by_brute_force(groups, 2), abs=0.05)
+    greedy = logic._greedy_assignment(groups, 2)
+    assert plan['objective'] <= round(sum(group['score'] for group in greedy), 2) + 0.01
+
+
+def test_plan_is_not_reported_optimal_over_partial_candidates(monkeypatch):
+    players, courts = make_players(12), make_courts(3)
+    assert logic.plan_matches(players, courts, dict(ALL_RULES, engine='exhaustive'), None)['optimal'] is True
+    assert logic.plan_matches(players, courts, dict(ALL_RULES, engine='fast'), None)['optimal'] is False
+    monkeypatch.setattr(logic, 'ASSIGNMENT_MAX_CANDIDATES', 50)
+    assert logic.plan_matches(players, courts, dict(ALL_RULES, engine='exhaustive'), None)['optimal'] is False
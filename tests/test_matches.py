@@ -0,0 +1,245 @@
+import pytest
+import redis
+
+import live_scores
+import match_events
+import rooms
+from api import matches
+from conftest import activate_players, api_client, set_setting
+
+
+@pytest.fixture
+def api(db):
+    return api_client(matches.matches_api)
+
+
+def setup_players(db, count, auto_dispatch):
+    set_setting(db, 'AUTO_DISPATCH', auto_dispatch)
+    ids = activate_players(db, count)
+    court_id = db.execute('SELECT id FROM courts ORDER BY id').fetchone()[0]
+    return ids, court_id
+
+
+def queue(api, team_a, team_b):
+    response = api.post('/api/matches/queue', json={'team_A': [{'id': i} for i in team_a],
+                                                    'team_B': [{'id': i} for i in team_b]})
+    assert response.status_code == 201
+    return response.get_json()['match_id']
+
+
+def play(api, players, court_id):
+    match_id = queue(api, players[:2], players[2:4])
+    assert api.post(f'/api/matches/{match_id}/begin', json={'court_id': court_id}).status_code == 200
+    return match_id
+
+
+def finish(api, match_id):
+    response = api.post(f'/api/matches/{match_id}/finish', json={'score_A': 21, 'score_B': 15})
+    assert response.status_code == 200
+    return response.get_json()['started_match_id']
+
+
+def match_players(db, match_id):
+    return {row[0] for row in db.execute('SELECT player_id FROM match_players WHERE match_id = ?', (match_id,))}
+
+
+def test_queued_match_with_a_finisher_is_skipped(db, api):
+    ids, court_id = setup_players(db, 8, matches.AUTO_DISPATCH_QUEUE)
+    finished_id = play(api, ids[:4], court_id)
+    queue(api, [ids[0], ids[4]], ids[5:7])  # Oldest, but ids[0] has just played
+    expected = queue(api, ids[4:6], ids[6:8])
+
+    assert finish(api, finished_id) == expected
+    assert db.execute('SELECT status, court_id FROM matches WHERE id = ?', (expected,)).fetchone() == ('ongoing', court_id)
+
+
+def test_suggested_match_leaves_the_finishers_out(db, api):
+    ids, court_id = setup_players(db, 6, matches.AUTO_DISPATCH_SUGGEST)
+    finished_id = play(api, ids[:4], court_id)
+    assert finish(api, finished_id) is None  # Only 2 other players
+
+    ids, court_id = setup_players(db, 8, matches.AUTO_DISPATCH_SUGGEST)
+    finished_id = play(api, ids[:4], court_id)
+    started_id = finish(api, finished_id)
+    assert match_players(db, started_id) == set(ids[4:])
+
+
+def test_failed_dispatch_still_finishes_the_match(db, api, monkeypatch):
+    ids, court_id = setup_players(db, 8, matches.AUTO_DISPATCH_SUGGEST)
+    finished_id = play(api, ids[:4], court_id)
+
+    def fail(*args):
+        raise RuntimeError('boom')
+    monkeypatch.setattr(matches, 'start_match', fail)
+
+    assert finish(api, finished_id) is None
+    assert db.execute('SELECT status FROM matches WHERE id = ?', (finished_id,)).fetchone() == ('finished',)
+    # The match inserted by the dispatch was rolled back with it
+    assert db.execute("SELECT COUNT(*) FROM matches WHERE status IN ('queued', 'ongoing')").fetchone() == (0,)
+
+
+# --- finish_match transaction (user-007) ---
+
+def player_stats(db, ids):
+    rows = db.execute(f"""SELECT id, total_matches_played, total_wins, session_matches_played, session_wins,
+                                 consecutive_matches FROM players WHERE id IN ({','.join('?' for _ in ids)}) ORDER BY id""", ids)
+    return {row[0]: row[1:] for row in rows}
+
+
+def pair_times(db, p1, p2):
+    row = db.execute('SELECT times_played FROM pair_history WHERE player1_id = ? AND player2_id = ?',
+                     (min(p1, p2), max(p1, p2))).fetchone()
+    return row[0] if row else 0
+
+
+def test_finish_updates_every_table_in_one_transaction(db, api):
+    ids, court_id = setup_players(db, 6, matches.AUTO_DISPATCH_OFF)
+    db.execute('UPDATE players SET consecutive_matches = 1 WHERE id = ?', (ids[5],))  # Has been resting
+    before = player_stats(db, ids)
+    turns = db.execute('SELECT session_turns FROM courts WHERE id = ?', (court_id,)).fetchone()[0]
+    pairs = pair_times(db, ids[0], ids[1]), pair_times(db, ids[2], ids[3])
+
+    finish(api, play(api, ids[:4], court_id))  # Team A (ids[0], ids[1]) wins 21-15
+
+    after = player_stats(db, ids)
+    for pid in ids[:4]:
+        won = 1 if pid in ids[:2] else 0
+        total, wins, session, session_wins, _ = before[pid]
+        assert after[pid][:4] == ((total or 0) + 1, (wins or 0) + won, session + 1, session_wins + won)
+    assert after[ids[5]][4] == 0 and after[ids[4]] == before[ids[4]]
+    assert db.execute('SELECT session_turns FROM courts WHERE id = ?', (court_id,)).fetchone()[0] == turns + 1
+    assert (pair_times(db, ids[0], ids[1]), pair_times(db, ids[2], ids[3])) == (pairs[0] + 1, pairs[1] + 1)
+
+
+def test_redis_failure_rolls_the_finish_back(db, api, monkeypatch):
+    ids, court_id = setup_players(db, 4, matches.AUTO_DISPATCH_OFF)
+    match_id = play(api, ids, court_id)
+    before = player_stats(db, ids)
+
+    flush_device, down = live_scores.flush_device, [True]
+
+    def unreachable(*args):
+        if down[0]:
+            raise redis.ConnectionError('Redis is down')
+        return flush_device(*args)
+    monkeypatch.setattr(live_scores, 'flush_device', unreachable)
+
+    response = api.post(f'/api/matches/{match_id}/finish', json={'score_A': 21, 'score_B': 15})
+    assert response.status_code == 500 and 'Redis is down' in response.get_json()['error']
+    assert db.execute('SELECT status FROM matches WHERE id = ?', (match_id,)).fetchone() == ('ongoing',)
+    assert player_stats(db, ids) == before
+
+    down[0] = False
+    assert finish(api, match_id) is None  # The pooled connection is usable again
+
+
+def test_finish_rejects_bad_scores_and_unknown_matches(db, api):
+    ids, court_id = setup_players(db, 4, matches.AUTO_DISPATCH_OFF)
+    match_id = play(api, ids, court_id)
+    assert api.post(f'/api/matches/{match_id}/finish', json={'score_A': 21, 'score_B': 21}).status_code == 400
+    assert api.post(f'/api/matches/{match_id + 1000}/finish', json={'score_A': 21, 'score_B': 5}).status_code == 404
+
+
+# --- History keyset pagination (user-010) ---
+
+def add_finished(db, end_time, court_id, players):
+    match_id = db.execute("INSERT INTO matches (court_id, status, end_time, winning_team, score_A, score_B) "
+                          "VALUES (?, 'finished', ?, 'A', 21, 10)", (court_id, end_time)).lastrowid
+    db.executemany('INSERT INTO match_players (match_id, player_id, team) VALUES (?, ?, ?)',
+                   [(match_id, pid, 'A' if i < 2 else 'B') for i, pid in enumerate(players)])
+    return match_id
+
+
+def all_pages(api, limit, **filters):
+    pages, cursor = [], None
+    while True:
+        args = dict(filters, limit=limit, **({'cursor': cursor} if cursor else {}))
+        body = api.get('/api/matches/history/', query_string=args).get_json()
+        pages.append([match['id'] for match in body['matches']])
+        cursor = body['next_cursor']
+        if cursor is None:
+            return pages
+
+
+def test_history_pages_cover_every_match_once_in_order(db, api):
+    ids, court_id = setup_players(db, 4, matches.AUTO_DISPATCH_OFF)
+    for _ in range(3):  # Same end_time: the id breaks the tie across pages
+        add_finished(db, '2025-10-01 20:00:00', court_id, ids)
+    expected = [mid for mid, in db.execute("SELECT id FROM matches WHERE status = 'finished' "
+                                           "ORDER BY end_time DESC, id DESC")]
+
+    pages = all_pages(api, 2)
+    assert [mid for page in pages for mid in page] == expected
+    assert all(len(page) == 2 for page in pages[:-1])
+    full = api.get('/api/matches/history/', query_string={'limit': 200}).get_json()
+    assert [m['id'] for m in full['matches']] == expected and full['next_cursor'] is None
+
+
+def test_history_filters_apply_to_every_page(db, api):
+    ids, court_id = setup_players(db, 8, matches.AUTO_DISPATCH_OFF)
+    other_court = db.execute('SELECT id FROM courts WHERE id != ? ORDER BY id', (court_id,)).fetchone()[0]
+    mine = [add_finished(db, f'2025-10-0{day} 20:00:00', court_id, ids[:4]) for day in (1, 2, 3)]
+    theirs = add_finished(db, '2025-10-02 21:00:00', other_court, ids[4:])
+
+    assert all_pages(api, 1, player_id=ids[0], date_from='2025-10-01') == [[mine[2]], [mine[1]], [mine[0]]]
+    assert all_pages(api, 2, court_id=other_court, date_from='2025-10-01') == [[theirs]]
+    assert all_pages(api, 5, date_from='2025-10-02', date_to='2025-10-02') == [[theirs, mine[1]]]
+
+
+def test_history_cursor_round_trip_and_bad_arguments(db, api):
+    assert matches.decode_history_cursor(matches.encode_history_cursor('2025-10-01 20:00:00', 7)) == \
+        ('2025-10-01 20:00:00', 7)
+    for args in ({'cursor': 'not-a-cursor'}, {'limit': 'ten'}, {'player_id': 'x'}, {'date_from': '01/10/2025'}):
+        response = api.get('/api/matches/history/', query_string=args)
+        assert response.status_code == 400 and 'error' in response.get_json()
+
+
+# --- Match state deltas (user-019) ---
+
+@pytest.fixture
+def events(monkeypatch):
+    """The match_state_changed events emitted: [(payload, rooms)]."""
+    emitted = []
+
+    def emit_to(event, payload, targets):
+        if event == 'match_state_changed':
+            emitted.append((payload, list(targets)))
+    monkeypatch.setattr(rooms, 'emit_to', emit_to)
+    return emitted
+
+
+def test_begin_and_finish_emit_consecutive_deltas_with_the_changed_rows(db, api, events):
+    ids, court_id = setup_players(db, 5, matches.AUTO_DISPATCH_OFF)
+    db.execute('UPDATE players SET consecutive_matches = 1 WHERE id = ?', (ids[4],))  # Rests during the match
+    match_id = queue(api, ids[:2], ids[2:4])
+    version = api.get('/api/matches/state-version').get_json()['version']
+
+    api.post(f'/api/matches/{match_id}/begin', json={'court_id': court_id})
+    finish(api, match_id)
+
+    (started, started_rooms), (finished, finished_rooms) = events
+    assert (started['type'], started['version']) == (match_events.MATCH_STARTED, version + 1)
+    assert (started['match']['id'], started['match']['court_id']) == (match_id, court_id)
+    assert {p['id'] for p in started['players']} == set(ids[:4])
+    assert rooms.ROOM_HISTORY not in started_rooms and rooms.court_room(court_id) in started_rooms
+
+    assert (finished['type'], finished['version']) == (match_events.MATCH_FINISHED, version + 2)
+    assert (finished['match']['id'], finished['match']['score_A'], finished['match']['winning_team']) == (match_id, 21, 'A')
+    assert finished['court']['id'] == court_id
+    players = {p['id']: p for p in finished['players']}
+    assert set(players) == set(ids) and players[ids[4]]['consecutive_matches'] == 0
+    assert {rooms.ROOM_DASHBOARD, rooms.ROOM_HISTORY, rooms.court_room(court_id)} <= set(finished_rooms)
+    assert api.get('/api/matches/state-version').get_json()['version'] == version + 2
+
+
+def test_finish_with_auto_dispatch_emits_one_turnover(db, api, events):
+    ids, court_id = setup_players(db, 8, matches.AUTO_DISPATCH_QUEUE)
+    finished_id = play(api, ids[:4], court_id)
+    queued_id = queue(api, ids[4:6], ids[6:8])
+    events.clear()
+
+    assert finish(api, finished_id) == queued_id
+    [(turnover, _)] = events
+    assert turnover['type'] == match_events.MATCH_TURNOVER
+    assert (turnover['match']['id'], turnover['started_match']['id']) == (finished_id, queued_id)
+    assert {p['id'] for p in turnover['players']} == set(ids)
@@ -0,0 +1,32 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import migrations
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(params=['badminton.db', 'blank_template.db'])
+def conn(request, tmp_path):
+    path = tmp_path / request.param
+    shutil.copy(os.path.join(ROOT, request.param), path)
+    conn = sqlite3.connect(path)
+    conn.isolation_level = None  # migrate() manages its own transactions
+    yield conn
+    conn.close()
+
+
+def test_migrate_is_idempotent(conn):
+    migrations.migrate(conn)
+    assert migrations.get_version(conn) == migrations.MIGRATIONS[-1][0]
+    assert migrations.migrate(conn) == []
+
+
+def test_hot_queries_use_their_index(conn):
+    migrations.migrate(conn)
+    plans = migrations.verify_query_plans(conn)
+    tables = migrations._existing_tables(conn)
+    assert set(plans) == {name for name, (table, *_) in migrations.HOT_QUERIES.items() if table in tables}
@@ -0,0 +1,54 @@
+import pytest
+
+import database
+import logic
+import next_match
+from api import suggestions
+from conftest import activate_players, set_setting
+
+
+@pytest.fixture
+def conn(db):
+    ids = activate_players(db, 8)
+    for games, pid in enumerate(ids):
+        # Different game counts: the low-games rule would change the ranking
+        db.execute('UPDATE players SET session_matches_played = ?, session_last_played = NULL WHERE id = ?',
+                   (games, pid))
+    with database.pooled_connection() as conn:
+        yield conn
+
+
+def planner_best(conn):
+    """Best group of the suggestions planner for one court, with the rules of a request that sends none."""
+    rules, _ = suggestions.parse_rules({})
+    players, courts = suggestions.load_candidates(conn, [row['id'] for row in conn.execute(next_match.PLAYERS_QUERY)])
+    plan = logic.plan_matches(players, courts[:1], dict(rules, engine='exhaustive'), conn)
+    return plan['suggestions'][0]
+
+
+# --- Incremental next match (user-024) ---
+
+def test_freed_court_pick_ranks_like_the_planner(conn):
+    group = next_match.next_group(conn)
+    assert next_match._pool.rules == logic.DEFAULT_RULES
+    assert group['score'] == pytest.approx(planner_best(conn)['balance_score'], abs=0.01)
+
+
+def test_excluded_and_busy_players_are_left_out(conn):
+    first = next_match.next_group(conn)
+    members = [p['id'] for p in first['team_A'] + first['team_B']]
+
+    following = next_match.next_group(conn, exclude_ids=members)
+    assert following is not None
+    assert not set(members) & {p['id'] for p in following['team_A'] + following['team_B']}
+
+    next_match.update(conn, [dict(p) for p in first['team_A'] + first['team_B']], busy_ids=members)
+    assert not set(members) & {pid for pid in next_match._pool.players}
+
+
+def test_pool_is_rebuilt_when_the_settings_change(db, conn):
+    next_match.next_group(conn)
+    pool = next_match._pool
+    set_setting(db, 'REST_PRIORITY_WEIGHT', 0.5)
+    next_match.next_group(conn)
+    assert next_match._pool is not pool and next_match._pool.settings['REST_PRIORITY_WEIGHT'] == 0.5
@@ -0,0 +1,51 @@
+import pytest
+
+import score_stream
+
+
+@pytest.mark.parametrize('value, expected', [(0, 0), (21, 21), ('7', 7)])
+def test_valid_scores_are_parsed(value, expected):
+    assert score_stream.parse_score(value) == expected
+
+
+@pytest.mark.parametrize('value', [None, True, -1, '-3', 'abc', '', 2.5, [1]])
+def test_invalid_scores_are_rejected(value):
+    with pytest.raises(ValueError):
+        score_stream.parse_score(value)
+
+
+# --- Trimmed pending entries (user-015) ---
+
+@pytest.fixture
+def stream(redis_db):
+    score_stream.ensure_group()
+
+    def deliver(count):
+        """Adds `count` entries and reads them once, so they are pending on this consumer."""
+        ids = [redis_db.xadd(score_stream.REDIS_SCOREBOARD_STREAM, score_stream.score_entry(f'SB-{i}', i, 0))
+               for i in range(count)]
+        redis_db.xreadgroup(score_stream.REDIS_SCOREBOARD_GROUP, score_stream.CONSUMER_NAME,
+                            {score_stream.REDIS_SCOREBOARD_STREAM: '>'}, count=count)
+        return ids
+    return deliver
+
+
+def pending_count(client):
+    return client.xpending(score_stream.REDIS_SCOREBOARD_STREAM, score_stream.REDIS_SCOREBOARD_GROUP)['pending']
+
+
+def test_replay_acks_trimmed_entries_and_reads_past_them(redis_db, stream):
+    ids = stream(5)
+    redis_db.xdel(score_stream.REDIS_SCOREBOARD_STREAM, *ids[:3])  # Trimmed while pending
+
+    entries = score_stream.read_own_pending(2)  # The first page holds trimmed entries only
+    assert [entry_id for entry_id, _ in entries] == [ids[3]]
+    assert pending_count(redis_db) == 2
+
+
+def test_replay_ends_once_only_trimmed_entries_were_pending(redis_db, stream):
+    ids = stream(4)
+    redis_db.xdel(score_stream.REDIS_SCOREBOARD_STREAM, *ids)
+
+    assert score_stream.read_own_pending(3) == []
+    assert pending_count(redis_db) == 0
@@ -0,0 +1,28 @@
+import pytest
+
+import live_scores
+from api import scoreboards
+from conftest import api_client
+
+
+@pytest.fixture
+def api(db, redis_db):
+    return api_client(scoreboards.scoreboards_api)
+
+
+# --- Device scores in the live score store (user-014) ---
+
+@pytest.mark.parametrize('body', [{'score_A': 'abc', 'score_B': 1}, {'score_A': None, 'score_B': 1},
+                                  {'score_A': 3, 'score_B': -1}, {'score_A': True, 'score_B': 0}])
+def test_invalid_device_scores_are_rejected(api, redis_db, body):
+    response = api.post('/api/scoreboards/SB-001/score', json=body)
+    assert response.status_code == 400 and 'error' in response.get_json()
+    assert not redis_db.exists(live_scores._key('SB-001'))
+    assert api.get('/api/scoreboards/').status_code == 200
+
+
+def test_device_score_is_stored_and_served(api):
+    response = api.post('/api/scoreboards/SB-001/score', json={'score_A': '5', 'score_B': 3})
+    assert response.status_code == 200 and response.get_json()['seq'] == 1
+    boards = {board['device_id']: board for board in api.get('/api/scoreboards/').get_json()}
+    assert (boards['SB-001']['score_A'], boards['SB-001']['score_B']) == (5, 3)
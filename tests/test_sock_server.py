@@ -0,0 +1,31 @@
+import json
+
+import pytest
+import redis
+
+import sock_server
+from conftest import Done, ScriptedClient
+
+
+# --- Command listener reconnects (user-017) ---
+
+def test_command_listener_resubscribes(sleeps, monkeypatch):
+    class Board:
+        def __init__(self):
+            self.frames = []
+
+        def send(self, frame):
+            self.frames.append(json.loads(frame))
+
+    board = Board()
+    monkeypatch.setattr(sock_server, 'device_sockets', {'SB-1': board})
+    command = {'device_id': 'SB-1', 'action': 'inc_a', 'score_A': 1, 'score_B': 0}
+    lost = redis.ConnectionError('Connection reset by peer')
+    monkeypatch.setattr(sock_server, 'redis_client', ScriptedClient(
+        [json.dumps(dict(command, seq=1)), lost],
+        [json.dumps(dict(command, seq=2)), json.dumps(dict(command, device_id='SB-OTHER', seq=1))],
+    ))
+
+    with pytest.raises(Done):
+        sock_server.command_listener()
+    assert [frame['seq'] for frame in board.frames] == [1, 2]
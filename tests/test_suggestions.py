@@ -0,0 +1,114 @@
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from api import suggestions
+from conftest import activate_players, api_client
+
+
+class StubClient:
+    """Stands in for the OpenAI client: returns `reply` (a dict) after waiting for `release`."""
+
+    def __init__(self, reply=None, error=None):
+        self.reply, self.error = reply, error
+        self.calls = 0
+        self.release = threading.Event()
+        self.release.set()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        self.calls += 1
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        message = SimpleNamespace(content=json.dumps(self.reply))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+@pytest.fixture
+def players(db, monkeypatch):
+    rows = [(pid, name) for pid, name in db.execute('SELECT id, name FROM players ORDER BY id LIMIT 8')]
+    activate_players(db, 8)
+    monkeypatch.setattr(suggestions, 'AI_WAIT', 0.2)
+    monkeypatch.setattr(suggestions, '_ai_cache', {})
+    return [{'id': row[0], 'name': row[1]} for row in rows]
+
+
+@pytest.fixture
+def api(db):
+    client = api_client(suggestions.suggestions_api)
+    return lambda players: client.post('/api/suggestions', json={'player_ids': [p['id'] for p in players]}).get_json()
+
+
+def reply_for(players):
+    names = [p['name'] for p in players]
+    return {'suggestions': [{'team_A': names[0:2], 'team_B': names[2:4], 'reasoning': 'ok'},
+                            {'team_A': names[4:6], 'team_B': names[6:8], 'reasoning': 'ok'}]}
+
+
+def test_ai_result_is_used_then_cached(players, api, monkeypatch):
+    stub = StubClient(reply_for(players))
+    monkeypatch.setattr(suggestions, 'client', stub)
+
+    fresh = api(players)
+    assert (fresh['source'], fresh['ai_status']) == ('ai', 'fresh')
+    assert fresh['suggestions'][0]['team_A_ids'] == [players[0]['id'], players[1]['id']]
+
+    cached = api(players)
+    assert (cached['source'], cached['ai_status']) == ('ai', 'cached')
+    assert cached['suggestions'] == fresh['suggestions']
+    assert stub.calls == 1
+
+
+def test_local_plan_first_while_the_llm_is_slow(players, api, monkeypatch):
+    stub = StubClient(reply_for(players))
+    stub.release.clear()
+    monkeypatch.setattr(suggestions, 'client', stub)
+
+    pending = api(players)
+    assert (pending['source'], pending['ai_status']) == ('local', 'pending')
+    assert pending['suggestions'] == pending['local_suggestions'] != []
+
+    stub.release.set()
+    deadline = time.monotonic() + 5
+    while not suggestions._ai_cache and time.monotonic() < deadline:
+        time.sleep(0.02)  # The call goes on in the background and is cached
+    assert api(players)['ai_status'] == 'cached'
+
+
+def test_llm_failure_falls_back_to_the_local_plan(players, api, monkeypatch):
+    stub = StubClient(error=TimeoutError('Request timed out.'))
+    monkeypatch.setattr(suggestions, 'client', stub)
+
+    result = api(players)
+    assert (result['source'], result['ai_status']) == ('local', 'failed')
+    assert result['suggestions'] == result['local_suggestions'] != []
+
+
+@pytest.mark.parametrize('corrupt', [
+    lambda reply, players: reply['suggestions'][1].update(team_A=[players[0]['name'], players[5]['name']]),
+    lambda reply, players: reply['suggestions'][0].update(team_B=[players[2]['name'], 'Người lạ']),
+    lambda reply, players: reply['suggestions'][0].update(team_B=[players[2]['name']]),
+    lambda reply, players: reply['suggestions'].append(dict(reply['suggestions'][0])),
+])
+def test_invalid_ai_result_is_not_cached(players, api, monkeypatch, corrupt):
+    reply = reply_for(players)
+    corrupt(reply, players)
+    stub = StubClient(reply)
+    monkeypatch.setattr(suggestions, 'client', stub)
+
+    for _ in range(2):
+        result = api(players)
+        assert (result['source'], result['ai_status']) == ('local', 'failed')
+        assert result['suggestions'] == result['local_suggestions']
+    assert stub.calls == 2
+
+
+@pytest.mark.parametrize('engine, expected', [('fast', 'fast'), ('exhaustive', 'exhaustive'),
+                                              ('brute-force', 'auto'), (None, 'auto')])
+def test_only_known_engines_are_taken_from_the_request(engine, expected):
+    rules, _ = suggestions.parse_rules({'engine': engine})
+    assert rules['engine'] == expected
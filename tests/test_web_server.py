@@ -0,0 +1,65 @@
+import pytest
+
+import rooms
+import score_stream
+
+
+@pytest.fixture
+def web_server(db):
+    # Imported once the pool points at the copy: create_app() migrates the database it is given
+    import web_server
+    return web_server
+
+
+def entry(entry_id, device_id, score_a, score_b, seq=None):
+    fields = {'device_id': device_id, 'score_A': str(score_a), 'score_B': str(score_b), 'source': 'test'}
+    if seq is not None:
+        fields['seq'] = str(seq)
+    return entry_id, fields
+
+
+# --- Score batching and coalescing (user-012) ---
+
+def test_coalescing_keeps_the_latest_score_of_each_device(web_server):
+    latest = web_server._coalesce_scores([
+        entry('1-0', 'SB-A', 1, 0, seq=1),
+        entry('1-1', 'SB-B', 0, 1, seq=1),
+        entry('1-2', 'SB-A', 2, 0, seq=2),
+        entry('1-3', 'SB-B', 0, 2),  # Older producer: no seq, the latest arrival wins
+    ])
+    assert latest == {'SB-A': (2, 0, 2), 'SB-B': (0, 2, None)}
+
+
+def test_coalescing_orders_devices_by_latest_arrival(web_server):
+    latest = web_server._coalesce_scores([
+        entry('1-0', 'SB-A', 1, 0, seq=1),
+        entry('1-1', 'SB-B', 0, 1, seq=1),
+        entry('1-2', 'SB-A', 2, 0, seq=2),
+    ])
+    assert list(latest) == ['SB-B', 'SB-A']
+
+
+def test_coalescing_drops_replayed_entries_and_invalid_ones(web_server):
+    latest = web_server._coalesce_scores([
+        entry('1-0', 'SB-A', 5, 3, seq=8),
+        entry('1-1', 'SB-A', 4, 3, seq=7),  # Claimed from a dead consumer, older than seq 8
+        entry('1-2', 'SB-B', 'abc', 0, seq=1),
+        ('1-3', {'score_A': '1', 'score_B': '1'}),
+    ])
+    assert latest == {'SB-A': (5, 3, 8)}
+
+
+def test_batch_is_stored_emitted_once_and_acked(db, web_server, monkeypatch):
+    emitted, acked = [], []
+    monkeypatch.setattr(rooms, 'emit_score_updates', emitted.append)
+    monkeypatch.setattr(score_stream, 'ack', acked.extend)
+
+    entries = [entry('1-0', 'SB-001', 1, 0, seq=1), entry('1-1', 'SB-001', 2, 0, seq=2),
+               entry('1-2', 'SB-UNROUTED', 9, 9, seq=1)]
+    web_server._process_score_entries(entries)
+
+    assert acked == ['1-0', '1-1', '1-2']
+    assert emitted == [[{'court_id': 2, 'device_id': 'SB-001', 'score_A': 2, 'score_B': 0, 'seq': 2, 'epoch': None,
+                        'writer': 'device'}]]
+    # Without Redis the scores go straight to the scoreboards table
+    assert db.execute("SELECT score_A, score_B FROM scoreboards WHERE device_id = 'SB-001'").fetchone() == (2, 0)
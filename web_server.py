@@ -6,27 +6,34 @@ This is the primary server that handles:
 1.  Serving all HTML pages (using the upgraded template structure).
 2.  Serving all REST APIs (the /api/... blueprints).
 3.  Handling web client connections via Flask-SocketIO.
-4.  Running a background thread to listen to Redis for updates 
-    from the sock_server.py.
+4.  Running a background thread that consumes the Redis score stream
+    fed by sock_server.py.
 """
 
 import os
-import json
 import sqlite3
+import time
 from flask import Flask
 from flask_cors import CORS
+from flask_socketio import join_room, leave_room
 
 
 # --- Import extensions (from Step 1.2) ---
-# We import socketio (for web) and redis_client (for pubsub)
+# We import socketio (for web) and redis_client (for the score stream)
 try:
-    from extensions import socketio, redis_client, REDIS_SCOREBOARD_CHANNEL
+    from extensions import socketio, redis_client
 except ImportError:
     print("FATAL: Could not import extensions.py. Did you create it?")
     exit(1)
 
 # --- Import Database (from Step 1.3) ---
 import database
+import device_commands
+import device_routing
+import live_scores
+import rooms
+import score_stream
+import settings_cache
 
 # --- Import all API Blueprints ---
 # (These are the same as the original/upgraded versions)
@@ -37,6 +44,8 @@ from api.matches import matches_api
 from api.sessions import sessions_api
 from api.settings import settings_api 
 from api.scoreboards import scoreboards_api
+from api.system import system_api
+from api.dashboard import dashboard_api
 
 # --- Application Factory ---
 def create_app():
@@ -61,6 +70,8 @@ def create_app():
     app.register_blueprint(settings_api, url_prefix='/api') 
     app.register_blueprint(sessions_api, url_prefix='/api') 
     app.register_blueprint(scoreboards_api, url_prefix='/api')
+    app.register_blueprint(system_api, url_prefix='/api')
+    app.register_blueprint(dashboard_api, url_prefix='/api')
 
     return app
 
@@ -78,96 +89,156 @@ def handle_web_disconnect():
     """Handles web client disconnections."""
     print('❌ Web client disconnected')
 
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    """
+    Joins the rooms a client renders: {'rooms': ['dashboard', 'history', 'court:<id>', ...]}.
+    Unknown names are ignored; the joined rooms are returned as the ack.
+    """
+    joined = [room for room in (data or {}).get('rooms', []) if rooms.is_valid_room(room)]
+    for room in joined:
+        join_room(room)
+    return {'rooms': joined}
+
+@socketio.on('unsubscribe')
+def handle_unsubscribe(data):
+    """Leaves rooms joined with 'subscribe'."""
+    left = [room for room in (data or {}).get('rooms', []) if rooms.is_valid_room(room)]
+    for room in left:
+        leave_room(room)
+    return {'rooms': left}
+
 
 # --- Redis Listener (Task 2.3) ---
+
+# Device scores are read from the Redis Stream (see score_stream.py) in
+# batches of up to SCORE_BATCH_MAX entries collected over SCORE_BATCH_WINDOW
+# seconds. Only the latest score (highest seq) of each device is kept, the
+# batch is stored at once (live_scores, which drops the stale ones), emitted
+# once, and then acknowledged.
+SCORE_BATCH_WINDOW = float(os.environ.get('SCORE_BATCH_WINDOW', 0.05))
+SCORE_BATCH_MAX = 500
+
+
+def _parse_score_entry(fields):
+    """Returns (device_id, score_A, score_B, seq) or None if the entry is unusable."""
+    device_id = fields.get('device_id')
+    if not device_id:
+        return None
+    try:
+        # Entries of producers older than the seq field are sequenced when stored
+        seq = int(fields['seq']) if fields.get('seq') else None
+        return device_id, score_stream.parse_score(fields['score_A']), score_stream.parse_score(fields['score_B']), seq
+    except (KeyError, TypeError, ValueError):
+        print(f"[Redis Listener] Received invalid score entry: {fields}")
+        return None
+
+
+def _coalesce_scores(entries):
+    """Returns {device_id: (score_A, score_B, seq)}, the latest score of each device only."""
+    latest = {}
+    for _, fields in entries:
+        parsed = _parse_score_entry(fields)
+        if parsed is None:
+            continue
+        device_id, score_a, score_b, seq = parsed
+        previous = latest.get(device_id)
+        if previous is not None and seq is not None and previous[2] is not None and seq < previous[2]:
+            continue  # Replayed / claimed entry older than one already in the batch
+        latest.pop(device_id, None)  # Move the device to the end (latest arrival)
+        latest[device_id] = (score_a, score_b, seq)
+    if len(entries) > len(latest):
+        print(f"[Redis Listener] Coalesced {len(entries)} entries into {len(latest)} updates")
+    return latest
+
+
+def _store_score_batch(latest):
+    """
+    Stores every score of the batch in the live score store (one Redis
+    pipeline; SQLite is only written by the checkpointer) and returns the
+    updates to broadcast (only the scores actually stored, of boards
+    assigned to a court, resolved through the in-memory device_routing table).
+    """
+    stored = live_scores.set_many(
+        {device_id: (score_a, score_b) for device_id, (score_a, score_b, _) in latest.items()},
+        updated_by='device',
+        seqs={device_id: seq for device_id, (_, _, seq) in latest.items()},
+    )
+
+    updates = []
+    epoch = live_scores.epoch() if stored else None
+    for device_id, seq in stored.items():
+        court_id = device_routing.court_of(device_id)
+        if court_id is not None:
+            score_a, score_b, _ = latest[device_id]
+            updates.append({'court_id': court_id, 'device_id': device_id, 'score_A': score_a, 'score_B': score_b,
+                            'seq': seq, 'epoch': epoch, 'writer': 'device'})
+    return updates
+
+
+def _process_score_entries(entries):
+    latest = _coalesce_scores(entries)
+    if latest:
+        updates = _store_score_batch(latest)
+        if updates:
+            rooms.emit_score_updates(updates)
+            print(f"[SocketIO] Emitted 'score_updated' batch of {len(updates)} to the dashboard and court rooms")
+    # Acknowledge only once stored: on error the entries stay pending and are retried
+    score_stream.ack([entry_id for entry_id, _ in entries])
+
+
 def redis_listener():
     """
-    Listens to Redis PubSub channel in a background thread.
+    Consumes the device score stream in a background thread.
     This function bridges the gap from sock_server -> Redis -> web_server.
+    Entries left pending (previous run, failed batch) are processed first,
+    then stale entries of dead consumers, then new entries.
     """
     if redis_client is None:
         print("Redis listener: Cannot start, Redis client is not connected.")
         return
 
-    print("🎧 Redis listener started, subscribing to channel...")
-    pubsub = redis_client.pubsub()
-    pubsub.subscribe(REDIS_SCOREBOARD_CHANNEL)
-    
-    for message in pubsub.listen():
-        if message['type'] == 'message':
-            print(f"[Redis SUB] Received message: {message['data']}")
-            try:
-                # 1. Parse the data from sock_server
-                data = json.loads(message['data'])
-                device_id = data.get('device_id')
-                score_a = data.get('score_A')
-                score_b = data.get('score_B')
-
-                if not device_id:
-                    continue
-
-                # 2. Update the database
-                # IMPORTANT: This background thread is OUTSIDE the Flask app context,
-                # so we CANNOT use database.get_db_connection() (which uses flask.g).
-                # We must create a new, separate connection.
-                try:
-                    conn = sqlite3.connect(database.DATABASE_URI)
-                    conn.row_factory = sqlite3.Row
-                    cursor = conn.cursor()
-                    
-                    # (This DB logic is taken from the old server.py ...6307... logic)
-                    cursor.execute(
-                        """
-                        UPDATE scoreboards 
-                        SET score_A = ?, score_B = ?, last_seen = datetime('now', 'localtime'), updated_by = 'device' 
-                        WHERE device_id = ?
-                        """,
-                        (score_a, score_b, device_id)
-                    )
-                    
-                    # If no row was updated, insert a new one
-                    if cursor.rowcount == 0:
-                        cursor.execute(
-                            """
-                            INSERT INTO scoreboards (device_id, score_A, score_B, last_seen, updated_by) 
-                            VALUES (?, ?, ?, datetime('now', 'localtime'), 'device')
-                            """,
-                            (device_id, score_a, score_b)
-                        )
-                    
-                    conn.commit()
-                    
-                    # 3. Get court_id to broadcast to the web
-                    scoreboard = cursor.execute("SELECT court_id FROM scoreboards WHERE device_id = ?", (device_id,)).fetchone()
-                    conn.close()
-
-                    # 4. Broadcast the update to all connected WEB clients
-                    if scoreboard and scoreboard['court_id'] is not None:
-                        payload = {
-                            'court_id': scoreboard['court_id'], 
-                            'score_A': score_a, 
-                            'score_B': score_b
-                        }
-                        # Use socketio.emit to broadcast
-                        socketio.emit('score_updated', payload)
-                        print(f"[SocketIO] Emitted 'score_updated' to web clients: {payload}")
-                
-                except sqlite3.Error as e:
-                    print(f"[Redis Listener] Database error: {e}")
-                
-            except json.JSONDecodeError:
-                print(f"[Redis Listener] Received invalid JSON: {message['data']}")
-            except Exception as e:
-                print(f"[Redis Listener] Error processing message: {e}")
+    print("🎧 Redis listener started, reading the score stream...")
+    score_stream.ensure_group()
+    retry_pending = True
+
+    while True:
+        try:
+            if retry_pending:
+                entries = score_stream.read_own_pending(SCORE_BATCH_MAX)
+                retry_pending = bool(entries)
+            else:
+                entries = (score_stream.claim_stale(SCORE_BATCH_MAX)
+                           or score_stream.read_batch(SCORE_BATCH_MAX, 1000, SCORE_BATCH_WINDOW))
+            if entries:
+                _process_score_entries(entries)
+        except Exception as e:
+            if isinstance(e, sqlite3.Error):
+                print(f"[Redis Listener] Database error: {e}")
+            else:
+                print(f"[Redis Listener] Error processing entries: {e}")
+            retry_pending = True
+            time.sleep(1)
 
 
 # --- Run the Server ---
 if __name__ == '__main__':
     print("--- Starting Main Web Server (SocketIO) ---")
     
+    # Load the device -> court routes before the first score arrives
+    device_routing.warm()
+
     # Start the Redis listener in a background thread
     # This is the correct way to do it with flask-socketio
     socketio.start_background_task(target=redis_listener)
+    # Keep the settings cache in sync with changes made by other processes
+    socketio.start_background_task(target=settings_cache.invalidation_listener)
+    # Apply scoreboard assignment changes made by other processes
+    socketio.start_background_task(target=device_routing.change_listener)
+    # Periodically checkpoint the live scores (Redis) into SQLite
+    socketio.start_background_task(target=live_scores.checkpointer)
+    # Record the acks of the commands pushed to the boards
+    socketio.start_background_task(target=device_commands.ack_listener)
     
     # Run the main web server on port 5000
     port = int(os.environ.get('PORT', 5000))